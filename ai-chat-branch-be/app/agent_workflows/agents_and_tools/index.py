@@ -1,4 +1,5 @@
-from agents import Agent, WebSearchTool
+from agents import Agent, ItemHelpers, RunContextWrapper, Runner, WebSearchTool, function_tool
+from app.utils.search_cache import web_search_cache
 
 web_search_agent = Agent(
   name="Web Search Agent",
@@ -7,4 +8,12 @@ web_search_agent = Agent(
   tools=[WebSearchTool()]
 )
 
-web_search_agent_tool = web_search_agent.as_tool(tool_name="web_search_tool", tool_description="Search the web for the information.")
\ No newline at end of file
+
+@function_tool(name_override="web_search_tool", description_override="Search the web for the information.")
+async def web_search_agent_tool(context: RunContextWrapper, input: str) -> str:
+  """Same as web_search_agent.as_tool, with the results cached across workflows by query."""
+  async def search(query: str) -> str:
+    result = await Runner.run(web_search_agent, query, context=context.context)
+    return ItemHelpers.text_message_outputs(result.new_items)
+
+  return await web_search_cache.search(input, search)
@@ -1,12 +1,10 @@
 from typing import Any, Dict, List
 
-from agents.extensions.models.litellm_model import LitellmModel
 from app.agent_workflows.interface import AgentWorkflowInterface
 from agents import Agent, Runner, trace
 from app.utils.prompt import build_instruction
-from app.utils.model import get_model_api_key
+from app.utils.model import get_model
 from app.agent_workflows.agents_and_tools.index import web_search_agent_tool
-import os
 
 class ChainOfThoughtWorkflow(AgentWorkflowInterface):
     agent: Agent
@@ -16,23 +14,10 @@ class ChainOfThoughtWorkflow(AgentWorkflowInterface):
             name="Chain of Thought Agent",
             instructions=instructions,
             tools=[web_search_agent_tool],
-            model=self.get_model(model_settings=model_settings),
+            model=get_model(model_settings=model_settings),
         )
 
 
-    def get_model(self, model_settings: Dict[str, Any] | None = None):
-        if (not model_settings):
-            return LitellmModel(
-                model="openai/gpt-4o-mini",
-                api_key=os.getenv("OPENAI_API_KEY")
-            )
-
-        api_key = get_model_api_key(model_settings["model"])
-        return LitellmModel(
-            model=model_settings["model"],
-            api_key=api_key
-        )
-
     async def execute(self, query: List[dict]):
         pass
     
@@ -1,19 +1,45 @@
+from typing import List
 from agents import Agent
 from pydantic import BaseModel, Field
-from app.agent_workflows.deep_research.prompts import RESEARCH_INSTRUCTION_AGENT_PROMPT, CLARIFYING_AGENT_PROMPT
+from app.agent_workflows.deep_research.prompts import RESEARCH_INSTRUCTION_AGENT_PROMPT, CLARIFYING_AGENT_PROMPT, RESEARCH_PLANNER_AGENT_PROMPT
 from app.agent_workflows.agents_and_tools.index import web_search_agent_tool
 
 
 class TriageAgentResponse(BaseModel):
     need_clarify: bool = Field(..., description="Whether the user's query needs clarification.")
 
+class ResearchPlan(BaseModel):
+    sub_questions: List[str] = Field(..., description="Independent sub-questions that together cover the research instructions.")
+
+class Evidence(BaseModel):
+    claim: str = Field(..., description="A single factual finding, stated on its own.")
+    source: str = Field(..., description="URL or name of the source backing the claim, empty if none.")
+
+class SubResearchResult(BaseModel):
+    findings: List[Evidence] = Field(..., description="Findings relevant to the sub-question.")
+
 research_agent = Agent(
     name="Research Agent",
     model="gpt-4o-mini",
-    instructions="Perform deep empirical research based on the user's instructions. Always use web_search_agent_tool to gather evidence before answering.",
+    instructions="Perform deep empirical research based on the user's instructions. Build on the evidence given with the instructions; use web_search_agent_tool to gather evidence before answering whenever none is given or it leaves gaps.",
     tools=[web_search_agent_tool]
 )
 
+planner_agent = Agent(
+    name="Research Planner Agent",
+    model="gpt-4o-mini",
+    instructions=RESEARCH_PLANNER_AGENT_PROMPT,
+    output_type=ResearchPlan,
+)
+
+sub_research_agent = Agent(
+    name="Sub-Research Agent",
+    model="gpt-4o-mini",
+    instructions="Research one focused sub-question. Always use web_search_agent_tool to gather evidence, then return the relevant findings, each with its source.",
+    tools=[web_search_agent_tool],
+    output_type=SubResearchResult,
+)
+
 instruction_agent = Agent(
     name="Research Instruction Agent",
     model="gpt-4o-mini",
@@ -1,54 +1,167 @@
+import asyncio
+import logging
 import os
-from agents import Agent, Runner, trace
-from agents.extensions.models.litellm_model import LitellmModel
+import time
+from agents import Agent, RunResult, Runner, custom_span, trace
 from app.agent_workflows.interface import AgentWorkflowInterface
-from typing import List, Dict, Any
-from app.agent_workflows.deep_research.agents import triage_agent, clarifying_agent, instruction_agent, research_agent
-from app.utils.model import get_model_api_key
+from typing import List, Dict, Any, Optional
+from app.agent_workflows.deep_research.agents import Evidence, triage_agent, clarifying_agent, instruction_agent, planner_agent, sub_research_agent, research_agent
+from app.utils.model import get_model
+from app.utils.response_cache import response_cache
+from app.utils.text import normalize
+
+logger = logging.getLogger(__name__)
+
+# Start the instruction agent alongside triage instead of after it; its work is
+# thrown away when triage asks for clarification.
+SPECULATIVE_TRIAGE = os.getenv("DEEP_RESEARCH_SPECULATIVE_TRIAGE", "true").lower() == "true"
+
+# Split the instruction into sub-questions researched concurrently, and hand
+# the merged evidence to the research agent.
+FAN_OUT = os.getenv("DEEP_RESEARCH_FAN_OUT", "true").lower() == "true"
+MAX_SUB_QUESTIONS = int(os.getenv("DEEP_RESEARCH_MAX_SUB_QUESTIONS", "5"))
+FAN_OUT_CONCURRENCY = int(os.getenv("DEEP_RESEARCH_CONCURRENCY", "3"))
+
+stats = {
+    "triages": 0, "clarifications": 0, "speculations": 0, "wasted_speculations": 0, "wasted_completed": 0, "saved_seconds": 0.0,
+    "fan_outs": 0, "sub_questions": 0, "failed_sub_questions": 0, "evidence": 0, "duplicate_evidence": 0,
+}
+
+
+def merge_evidence(results: List[List[Evidence]]) -> List[Evidence]:
+    """Findings of all sub-questions, equivalent claims merged into one citing every source."""
+    merged: Dict[str, Evidence] = {}
+    for findings in results:
+        for evidence in findings:
+            key = normalize(evidence.claim)
+            if not key:
+                continue
+            if key not in merged:
+                merged[key] = evidence.model_copy()
+                continue
+            stats["duplicate_evidence"] += 1
+            kept = merged[key]
+            sources = [source for source in kept.source.split("; ") if source]
+            if evidence.source and evidence.source not in sources:
+                kept.source = "; ".join(sources + [evidence.source])
+    return list(merged.values())
+
+
+def format_evidence(evidence: List[Evidence]) -> str:
+    lines = [f"- {item.claim}" + (f" (source: {item.source})" if item.source else "") for item in evidence]
+    return "Evidence gathered so far:\n" + "\n".join(lines)
 
 
 class DeepResearchWorkflow(AgentWorkflowInterface):
     triage_agent: Agent
     clarifying_agent: Agent
     research_instruction_agent: Agent
+    planner_agent: Agent
+    sub_research_agent: Agent
     deep_research_agent: Agent
 
     def __init__(self, model_settings: Dict[str, Any] | None = None):
-        self.triage_agent = triage_agent.clone(model=self.get_model(key="triage_agent_model", model_settings=model_settings))
-        self.clarifying_agent = clarifying_agent.clone(model=self.get_model(key="clarifying_agent_model", model_settings=model_settings))
-        self.research_instruction_agent = instruction_agent.clone(model=self.get_model(key="research_instruction_agent_model", model_settings=model_settings))
-        self.deep_research_agent = research_agent.clone(model=self.get_model(key="research_agent_model", model_settings=model_settings))
+        self.triage_agent = triage_agent.clone(model=get_model(key="triage_agent_model", model_settings=model_settings))
+        self.clarifying_agent = clarifying_agent.clone(model=get_model(key="clarifying_agent_model", model_settings=model_settings))
+        self.research_instruction_agent = instruction_agent.clone(model=get_model(key="research_instruction_agent_model", model_settings=model_settings))
+        self.planner_agent = planner_agent.clone(model=get_model(key="research_instruction_agent_model", model_settings=model_settings))
+        self.sub_research_agent = sub_research_agent.clone(model=get_model(key="research_agent_model", model_settings=model_settings))
+        self.deep_research_agent = research_agent.clone(model=get_model(key="research_agent_model", model_settings=model_settings))
 
 
-    def get_model(self, key: str, model_settings: Dict[str, Any] | None = None):
-        if (not model_settings):
-            return LitellmModel(
-                model="openai/gpt-4o-mini",
-                api_key=os.getenv("OPENAI_API_KEY")
-            )
+    def discard(self, task: asyncio.Task) -> None:
+        """Cancel a speculative task whose result is not needed, retrieving its error if it already failed."""
+        if task.done() and not task.cancelled():
+            task.exception()
+        task.cancel()
 
-        api_key = get_model_api_key(model_settings[key])
-        return LitellmModel(
-            model=model_settings[key],
-            api_key=api_key
-        )
+    async def timed_run(self, agent: Agent, query: List[dict]):
+        started = time.perf_counter()
+        result = await Runner.run(agent, query)
+        return result, time.perf_counter() - started
+
+    async def research_instruction(self, query: List[dict]) -> Optional[RunResult]:
+        """The research instruction for the query, or None when triage asks for clarification."""
+        stats["triages"] += 1
+        if not SPECULATIVE_TRIAGE:
+            result = await response_cache.run(self.triage_agent, query)
+            if (result.final_output.need_clarify):
+                stats["clarifications"] += 1
+                return None
+            return await Runner.run(self.research_instruction_agent, query)
+
+        stats["speculations"] += 1
+        instruction = asyncio.create_task(self.timed_run(self.research_instruction_agent, query))
+        triage_started = time.perf_counter()
+        try:
+            result = await response_cache.run(self.triage_agent, query)
+        except BaseException:
+            self.discard(instruction)
+            raise
+        triage_seconds = time.perf_counter() - triage_started
 
-    async def deep_research(self, query: List[dict]):
-        result = await Runner.run(self.triage_agent, query)
         if (result.final_output.need_clarify):
+            stats["clarifications"] += 1
+            stats["wasted_speculations"] += 1
+            if instruction.done():
+                stats["wasted_completed"] += 1
+            self.discard(instruction)
+            return None
+
+        result, instruction_seconds = await instruction
+        # run one after the other, the shorter of the two would have been added
+        stats["saved_seconds"] += min(triage_seconds, instruction_seconds)
+        return result
+
+    async def research_sub_question(self, question: str, semaphore: asyncio.Semaphore) -> List[Evidence]:
+        async with semaphore:
+            try:
+                result = await Runner.run(self.sub_research_agent, question)
+            except Exception:
+                # the other sub-questions still make a report
+                stats["failed_sub_questions"] += 1
+                logger.exception("sub-question research failed: %s", question)
+                return []
+        return result.final_output.findings
+
+    async def gather_evidence(self, instruction: str) -> List[Evidence]:
+        """Evidence for the instruction, researched as concurrent sub-questions."""
+        plan = await response_cache.run(self.planner_agent, instruction)
+        questions = list(dict.fromkeys(plan.final_output.sub_questions))[:MAX_SUB_QUESTIONS]
+        stats["fan_outs"] += 1
+        stats["sub_questions"] += len(questions)
+
+        with custom_span("Deep research fan-out", data={"sub_questions": questions}) as span:
+            semaphore = asyncio.Semaphore(FAN_OUT_CONCURRENCY)
+            results = await asyncio.gather(*(self.research_sub_question(question, semaphore) for question in questions))
+            evidence = merge_evidence(results)
+            span.span_data.data["evidence"] = len(evidence)
+        stats["evidence"] += len(evidence)
+        return evidence
+
+    async def research_input(self, instruction: str) -> str:
+        """Input of the research agent: the instruction, followed by the evidence of the fan-out if enabled."""
+        if not FAN_OUT:
+            return instruction
+        evidence = await self.gather_evidence(instruction)
+        if not evidence:
+            return instruction
+        return f"{instruction}\n\n{format_evidence(evidence)}"
+
+    async def deep_research(self, query: List[dict]):
+        instruction = await self.research_instruction(query)
+        if instruction is None:
             result = await Runner.run(self.clarifying_agent, query)
         else:
-            instruction = await Runner.run(self.research_instruction_agent, query)
-            result = await Runner.run(self.deep_research_agent, instruction.final_output)
+            result = await Runner.run(self.deep_research_agent, await self.research_input(instruction.final_output))
         return result
 
     async def deep_research_streamed(self, query: List[dict]):
-        result = await Runner.run(self.triage_agent, query)
-        if (result.final_output.need_clarify):
+        instruction = await self.research_instruction(query)
+        if instruction is None:
             result = Runner.run_streamed(self.clarifying_agent, query)
         else:
-            instruction = await Runner.run(self.research_instruction_agent, query)
-            result = Runner.run_streamed(self.deep_research_agent, instruction.final_output)
+            result = Runner.run_streamed(self.deep_research_agent, await self.research_input(instruction.final_output))
         return result
 
     async def execute(self, query: List[dict]):
@@ -52,4 +52,13 @@ RESEARCH_INSTRUCTION_AGENT_PROMPT = """
 
         IMPORTANT: Ensure that the complete payload to this function is valid JSON
         IMPORTANT: SPECIFY REQUIRED OUTPUT LANGUAGE IN THE PROMPT
-        """
\ No newline at end of file
+        """
+
+RESEARCH_PLANNER_AGENT_PROMPT = """
+        Split the research instructions into independent sub-questions that can be researched in parallel.
+
+        GUIDELINES:
+        1. **Cover everything** Together the sub-questions must cover every part of the instructions.
+        2. **Keep them independent** A sub-question must not depend on the answer of another one.
+        3. **Keep them focused** Each sub-question should be answerable with a few web searches. Prefer 2–5 sub-questions; use a single one for a narrow request.
+        """
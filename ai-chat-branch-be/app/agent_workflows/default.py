@@ -1,10 +1,8 @@
-import os
-from agents.extensions.models.litellm_model import LitellmModel
 from app.agent_workflows.interface import AgentWorkflowInterface
 from agents import Agent, Runner, trace
 from app.agent_workflows.agents_and_tools.index import web_search_agent_tool
 from app.utils.prompt import build_instruction
-from app.utils.model import get_model_api_key
+from app.utils.model import get_model
 from typing import Any, Dict, List
 
 class DefaultWorkflow(AgentWorkflowInterface):
@@ -15,20 +13,7 @@ class DefaultWorkflow(AgentWorkflowInterface):
             name="Default Agent",
             instructions=instructions,
             tools=[web_search_agent_tool],
-            model=self.get_model(model_settings=model_settings),
-        )
-
-    def get_model(self, model_settings: Dict[str, Any] | None = None):
-        if (not model_settings):
-            return LitellmModel(
-                model="openai/gpt-4o-mini",
-                api_key=os.getenv("OPENAI_API_KEY")
-            )
-
-        api_key = get_model_api_key(model_settings["model"])
-        return LitellmModel(
-            model=model_settings["model"],
-            api_key=api_key
+            model=get_model(model_settings=model_settings),
         )
 
     async def execute(self, query: List[dict]):
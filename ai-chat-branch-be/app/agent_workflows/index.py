@@ -1,3 +1,6 @@
+from datetime import date
+import json
+import os
 from typing import List, Dict, Any
 
 from agents import RunResult, RunResultStreaming
@@ -9,6 +12,39 @@ from app.agent_workflows.think_longer import ThinkLongerWorkflow
 from app.agent_workflows.deep_research.index import DeepResearchWorkflow
 from app.agent_workflows.default import DefaultWorkflow
 from app.agent_workflows.summary import SummaryWorkflow
+from app.utils.cache import LRUCache
+from app.utils.model import model_cache_stats
+
+# Workflows only hold agents and models, which are never mutated per request, so
+# one instance serves every request with the same mode and model settings.
+# The date is part of the key because instructions embed today's date.
+_workflows = LRUCache(max_size=int(os.getenv("WORKFLOW_CACHE_SIZE", "64")))
+
+def build_workflow(agentic_mode: AGENTIC_MODE | None = None, model_settings: Dict[str, Any] | None = None) -> AgentWorkflowInterface:
+    if agentic_mode == AGENTIC_MODE.CHAIN_OF_THOUGHT:
+        return ChainOfThoughtWorkflow(model_settings=model_settings)
+    elif agentic_mode == AGENTIC_MODE.TREE_OF_THOUGHTS:
+        return TreeOfThoughtsWorkflow(model_settings=model_settings)
+    elif agentic_mode == AGENTIC_MODE.THINK_LONGER:
+        return ThinkLongerWorkflow(model_settings=model_settings)
+    elif agentic_mode == AGENTIC_MODE.DEEP_RESEARCH:
+        return DeepResearchWorkflow(model_settings=model_settings)
+    elif agentic_mode == AGENTIC_MODE.SUMMARY:
+        return SummaryWorkflow(model_settings=model_settings)
+    else:
+        return DefaultWorkflow(model_settings=model_settings)
+
+def get_workflow(agentic_mode: AGENTIC_MODE | None = None, model_settings: Dict[str, Any] | None = None) -> AgentWorkflowInterface:
+    settings = {key: value for key, value in (model_settings or {}).items() if value is not None}
+    key = (agentic_mode, json.dumps(settings, sort_keys=True), date.today())
+    workflow = _workflows.get(key)
+    if workflow is None:
+        workflow = build_workflow(agentic_mode=agentic_mode, model_settings=model_settings)
+        _workflows.set(key, workflow)
+    return workflow
+
+def workflow_cache_stats() -> Dict[str, Any]:
+    return {"workflows": _workflows.stats(), "models": model_cache_stats()}
 
 class Context:
   _workflow: AgentWorkflowInterface
@@ -29,18 +65,7 @@ class AgentWorkflows:
         self.set_workflow(agentic_mode=agentic_mode, model_settings=model_settings)
 
     def set_workflow(self, agentic_mode: AgentWorkflowInterface, model_settings: Dict[str, Any] | None = None):
-        if agentic_mode == AGENTIC_MODE.CHAIN_OF_THOUGHT:
-            self.context.set_workflow(ChainOfThoughtWorkflow(model_settings=model_settings))
-        elif agentic_mode == AGENTIC_MODE.TREE_OF_THOUGHTS:
-            self.context.set_workflow(TreeOfThoughtsWorkflow(model_settings=model_settings))
-        elif agentic_mode == AGENTIC_MODE.THINK_LONGER:
-            self.context.set_workflow(ThinkLongerWorkflow(model_settings=model_settings))
-        elif agentic_mode == AGENTIC_MODE.DEEP_RESEARCH:
-            self.context.set_workflow(DeepResearchWorkflow(model_settings=model_settings))
-        elif agentic_mode == AGENTIC_MODE.SUMMARY:
-            self.context.set_workflow(SummaryWorkflow(model_settings=model_settings))
-        else:
-            self.context.set_workflow(DefaultWorkflow(model_settings=model_settings))
+        self.context.set_workflow(get_workflow(agentic_mode=agentic_mode, model_settings=model_settings))
 
     async def run(self, query: List[dict]) -> RunResult:
         return await self.context.execute_workflow(query)
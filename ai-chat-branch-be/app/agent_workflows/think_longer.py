@@ -3,9 +3,7 @@ from app.agent_workflows.interface import AgentWorkflowInterface
 from agents import Agent, ModelSettings, Runner, trace
 from app.utils.prompt import build_instruction
 from typing import List, Dict, Any
-from agents.extensions.models.litellm_model import LitellmModel
-from app.utils.model import get_model_api_key
-import os
+from app.utils.model import get_model
 from app.agent_workflows.agents_and_tools.index import web_search_agent_tool
 
 
@@ -17,7 +15,7 @@ class ThinkLongerWorkflow(AgentWorkflowInterface):
         self.agent = Agent(
             name="Think Longer Agent",
             instructions=instructions,
-            model=self.get_model(model_settings=model_settings),
+            model=get_model(model_settings=model_settings, default="deepseek/deepseek-reasoner"),
             model_settings=ModelSettings(
                 reasoning=Reasoning(
                     summary="concise",
@@ -25,19 +23,6 @@ class ThinkLongerWorkflow(AgentWorkflowInterface):
             ),
         )
     
-    def get_model(self, model_settings: Dict[str, Any] | None = None):
-        if (not model_settings):
-            return LitellmModel(
-                model="deepseek/deepseek-reasoner",
-                api_key=os.getenv("DEEPSEEK_API_KEY")
-            )
-
-        api_key = get_model_api_key(model_settings["model"])
-        return LitellmModel(
-            model=model_settings["model"],
-            api_key=api_key
-        )
-
 
     async def execute(self, query: List[dict]):
         with trace("Think Longer workflow non streamed"):
@@ -3,6 +3,8 @@ from pydantic import BaseModel, Field
 from typing import List, Optional, Tuple
 from app.utils.prompt import build_instruction
 from app.agent_workflows.agents_and_tools.index import web_search_agent_tool
+from app.utils.response_cache import response_cache
+from app.agent_workflows.tree_of_thoughts.policy import SearchBudget
 
 
 class Thought(BaseModel):
@@ -18,6 +20,12 @@ class Evaluation(BaseModel):
     reason: str
     adjusted_score: float = Field(..., ge=0, le=1)
 
+class CandidateEvaluation(Evaluation):
+    index: int = Field(..., description="Index of the evaluated candidate in the given list.")
+
+class EvaluationBatch(BaseModel):
+    evaluations: List[CandidateEvaluation] = Field(..., description="One evaluation per candidate.")
+
 class Finalization(BaseModel):
     finalized: bool = Field(..., description="Whether the path is comprehensive and robust to reach the goal. True if the path is sufficient, False otherwise.")
     reason: str = Field(..., description="Why the path is sufficient or not.")
@@ -43,6 +51,7 @@ tot_evaluator_agent = Agent(
         "You are a careful and competent evaluator that evaluates the quality of thoughts thoroughly and objectively to reach the goal.\n"
         "You evaluate the quality of the thoughts step by step.\n"
         "When asked to EVALUATE_THOUGHT, judge whether a thought is promising toward the goal.\n"
+        "When asked to EVALUATE_THOUGHTS, judge every numbered candidate independently the same way.\n"
         "When asked to FINALIZE_THOUGHT, judge whether the path is comprehensive and robust to reach the goal.\n"
         "Be concise but precise."
     ),
@@ -64,18 +73,25 @@ tot_executioner_agent = Agent(
 )
 
 
-async def generate_thoughts(goal: str, agent: Agent, current_path: List[str], k: int = 3) -> ThoughtBatch:
+# model calls made by Tree-of-Thoughts searches
+stats = {"generate_calls": 0, "evaluate_calls": 0, "evaluated_candidates": 0, "speculation_saved_seconds": 0.0, "cancelled_expansions": 0, "saved_model_calls": 0}
+
+
+async def generate_thoughts(goal: str, agent: Agent, current_path: List[str], k: int = 3, budget: Optional[SearchBudget] = None) -> ThoughtBatch:
   prompt = (
     "Task: GENERATE_THOUGHTS\n"
     f"Goal: {goal}\n"
     f"Current path: {current_path}\n"
     f"Produce {k} thoughtful next steps, which are non-repetitive, non-overlapping, with rationales and scores in [0,1]."
   )
+  stats["generate_calls"] += 1
   result = await Runner.run(agent, prompt)
+  if budget:
+    budget.record(result)
   return result.final_output
 
 
-async def evaluate_thought(goal: str, agent: Agent, path_so_far: List[str], candiate: str) -> Evaluation:
+async def evaluate_thought(goal: str, agent: Agent, path_so_far: List[str], candiate: str, budget: Optional[SearchBudget] = None) -> Evaluation:
   prompt = (
     "TASK: EVALUATE_THOUGHT\n"
     f"Goal: {goal}\n"
@@ -84,6 +100,36 @@ async def evaluate_thought(goal: str, agent: Agent, path_so_far: List[str], cand
     "Return whether to keep it and an adjusted score in [0,1]."
   )
 
-  result = await Runner.run(agent, prompt)
+  stats["evaluate_calls"] += 1
+  stats["evaluated_candidates"] += 1
+  result = await response_cache.run(agent, prompt)
+  if budget:
+    budget.record(result)
   return result.final_output
 
+
+async def evaluate_thoughts(goal: str, agent: Agent, path_so_far: List[str], candidates: List[str], budget: Optional[SearchBudget] = None) -> List[Optional[Evaluation]]:
+  """Evaluate all candidates in one call; agent must have EvaluationBatch as output_type.
+
+  Returns the evaluations in candidate order, None for a candidate the model skipped.
+  """
+  numbered = "\n".join(f"{index}. {candidate}" for index, candidate in enumerate(candidates))
+  prompt = (
+    "TASK: EVALUATE_THOUGHTS\n"
+    f"Goal: {goal}\n"
+    f"Current path: {path_so_far}\n"
+    f"Candidate thoughts:\n{numbered}\n"
+    "For every candidate return its index, whether to keep it and an adjusted score in [0,1]."
+  )
+
+  stats["evaluate_calls"] += 1
+  stats["evaluated_candidates"] += len(candidates)
+  result = await response_cache.run(agent, prompt)
+  if budget:
+    budget.record(result)
+  evaluations: List[Optional[Evaluation]] = [None] * len(candidates)
+  for evaluation in result.final_output.evaluations:
+    if 0 <= evaluation.index < len(candidates) and evaluations[evaluation.index] is None:
+      evaluations[evaluation.index] = evaluation
+  return evaluations
+
@@ -1,12 +1,18 @@
 import asyncio
 from dataclasses import dataclass
-import os
-from typing import Any, Dict, List, Optional
-from agents import Agent, Runner, trace
-from agents.extensions.models.litellm_model import LitellmModel
+import logging
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Literal, Optional, Tuple
+from agents import Agent, RawResponsesStreamEvent, RunResultStreaming, Runner, custom_span, trace
+from openai.types.responses import ResponseTextDeltaEvent
 from app.agent_workflows.interface import AgentWorkflowInterface
-from app.agent_workflows.tree_of_thoughts.agents import Finalization, evaluate_thought, generate_thoughts, tot_evaluator_agent, tot_executioner_agent, tot_reasoner_agent
-from app.utils.model import get_model_api_key
+from app.agent_workflows.tree_of_thoughts.agents import EvaluationBatch, Finalization, evaluate_thought, evaluate_thoughts, generate_thoughts, stats, tot_evaluator_agent, tot_executioner_agent, tot_reasoner_agent
+from app.utils.model import get_model
+from app.utils.scheduler import Priority
+from app.agent_workflows.tree_of_thoughts.transposition import TranspositionTable
+from app.agent_workflows.tree_of_thoughts.policy import SearchBudget, adapt_beam_width
+
+logger = logging.getLogger(__name__)
 
 @dataclass
 class ToTConfig:
@@ -15,39 +21,118 @@ class ToTConfig:
     thoughts_per_step: int = 3   # k
     eval_enabled: bool = True    # whether to run evaluate_thought
     min_keep_score: float = 0.8 # prune weak branches early
+    eval_mode: Literal["per_candidate", "batched"] = "batched"  # one evaluator call per candidate or per ThoughtBatch
+    finalize_policy: Literal["sequential", "speculative"] = "speculative"  # expand the next depth while the finalize verdict is pending
+    dedup_enabled: bool = True   # merge equivalent thoughts/paths and reuse their evaluations
+    dedup_similarity: Optional[float] = None  # also merge thoughts whose word Jaccard similarity reaches this
+    adaptive_beam: bool = True   # narrow the beam behind a clear leader, widen it when candidates are too close to call
+    min_beam_width: int = 1
+    max_beam_width: int = 5
+    clear_lead: float = 0.15     # lead of the best candidate over the second that narrows the beam
+    tight_spread: float = 0.03   # score standard deviation below which the beam is widened
+    plateau_delta: Optional[float] = 0.01  # stop when the best score improves less than this over a depth
+    max_calls: Optional[int] = None        # budget of model calls for the search
+    max_tokens: Optional[int] = None       # budget of tokens for the search
+    max_seconds: Optional[float] = None    # budget of wall-clock seconds for the search
+
+    @classmethod
+    def from_model_settings(cls, model_settings: Dict[str, Any] | None = None) -> "ToTConfig":
+        """Default config with the search budget given in model_settings (tot_max_calls, tot_max_tokens, tot_max_seconds)."""
+        settings = model_settings or {}
+        return cls(
+            max_calls=int(settings["tot_max_calls"]) if settings.get("tot_max_calls") is not None else None,
+            max_tokens=int(settings["tot_max_tokens"]) if settings.get("tot_max_tokens") is not None else None,
+            max_seconds=float(settings["tot_max_seconds"]) if settings.get("tot_max_seconds") is not None else None,
+        )
+
+    def expansion_calls(self) -> int:
+        """Most model calls one expansion makes: the generator, then the evaluator per batch or per candidate."""
+        if not self.eval_enabled:
+            return 1
+        return 1 + (1 if self.eval_mode == "batched" else self.thoughts_per_step)
 
 @dataclass
 class Node:
     path: List[str]                 # sequence of thoughts up to here
     score: float                    # aggregate score
 
+# (event name, data) reported while a search runs
+ProgressCallback = Callable[[str, Dict[str, Any]], None]
+
+def ignore_progress(name: str, data: Dict[str, Any]) -> None:
+    pass
+
+@dataclass
+class ToTProgressEvent:
+    name: str
+    data: Dict[str, Any]
+    type: Literal["tot_progress_event"] = "tot_progress_event"
+
+
+class ToTStreamResult:
+    """Streamed Tree-of-Thoughts run: ToTProgressEvents while the search runs,
+    then the events of the streamed synthesis.
+
+    The workflow trace is opened in the search task, so the search and the
+    synthesis it starts are recorded in it, and finished once the stream ends.
+    """
+
+    def __init__(self, search: Callable[[ProgressCallback], Awaitable[RunResultStreaming | str]], workflow_name: str):
+        self._progress: asyncio.Queue = asyncio.Queue()
+        self._trace = trace(workflow_name)
+        self._trace_started = False
+        self._search = asyncio.create_task(self._traced(search))
+
+    async def _traced(self, search: Callable[[ProgressCallback], Awaitable[RunResultStreaming | str]]) -> RunResultStreaming | str:
+        self._trace.start(mark_as_current=True)
+        self._trace_started = True
+        return await search(lambda name, data: self._progress.put_nowait(ToTProgressEvent(name=name, data=data)))
+
+    async def stream_events(self) -> AsyncIterator[Any]:
+        try:
+            while not self._search.done():
+                next_event = asyncio.ensure_future(self._progress.get())
+                await asyncio.wait({next_event, self._search}, return_when=asyncio.FIRST_COMPLETED)
+                if next_event.done():
+                    yield next_event.result()
+                else:
+                    next_event.cancel()
+            while not self._progress.empty():
+                yield self._progress.get_nowait()
+
+            result = self._search.result()
+            if isinstance(result, str):
+                # nothing to synthesize from, e.g. "No solution found"
+                yield RawResponsesStreamEvent(data=ResponseTextDeltaEvent.model_construct(type="response.output_text.delta", delta=result))
+                return
+            async for event in result.stream_events():
+                yield event
+        finally:
+            self._search.cancel()
+            if self._trace_started:
+                self._trace.finish()
+
 
 class TreeOfThoughtsWorkflow(AgentWorkflowInterface):
     tot_reasoner_agent: Agent
     tot_evaluator_agent: Agent
     tot_executioner_agent: Agent
-    is_streamed: bool = False
+    tot_batch_evaluator_agent: Agent
+    tot_finalizer_agent: Agent
+    config: ToTConfig
 
     def __init__(self, model_settings: Dict[str, Any] | None = None):
-        self.tot_reasoner_agent = tot_reasoner_agent.clone(model=self.get_model(key="reasoner_agent_model", model_settings=model_settings))
-        self.tot_evaluator_agent = tot_evaluator_agent.clone(model=self.get_model(key="evaluator_agent_model", model_settings=model_settings))
-        self.tot_executioner_agent = tot_executioner_agent.clone(model=self.get_model(key="executioner_agent_model", model_settings=model_settings))
-
-    def get_model(self, key: str, model_settings: Dict[str, Any] | None = None):
-        if (not model_settings):
-            return LitellmModel(
-                model="openai/gpt-4o-mini",
-                api_key=os.getenv("OPENAI_API_KEY")
-            )
-        api_key = get_model_api_key(model_settings[key])
-        return LitellmModel(
-            model=model_settings[key],
-            api_key=api_key
-        )
-        
-    async def try_finalize(self, goal: str, frontier: List[Node]) -> Optional[str]:
+        self.tot_reasoner_agent = tot_reasoner_agent.clone(model=get_model(key="reasoner_agent_model", model_settings=model_settings, priority=Priority.BACKGROUND))
+        self.tot_evaluator_agent = tot_evaluator_agent.clone(model=get_model(key="evaluator_agent_model", model_settings=model_settings, priority=Priority.BACKGROUND))
+        self.tot_executioner_agent = tot_executioner_agent.clone(model=get_model(key="executioner_agent_model", model_settings=model_settings))
+        self.tot_batch_evaluator_agent = self.tot_evaluator_agent.clone(output_type=EvaluationBatch)
+        self.tot_finalizer_agent = self.tot_evaluator_agent.clone(output_type=Finalization)
+        self.config = ToTConfig.from_model_settings(model_settings)
+
+    async def check_finalized(self, goal: str, frontier: List[Node], budget: Optional[SearchBudget] = None) -> bool:
+        """FINALIZE_THOUGHT verdict on the best path of the frontier."""
         if not frontier:
-            return None
+            return False
         
         best = frontier[0]
 
@@ -59,13 +144,12 @@ class TreeOfThoughtsWorkflow(AgentWorkflowInterface):
             "If the path is sufficient, reply with finalized=True and why"
             "Otherwise reply with finalized=False and why"
         )
-        result = await Runner.run(self.tot_evaluator_agent.clone(output_type=Finalization), prompt)
-        if (not result.final_output.finalized):
-            return None
+        result = await Runner.run(self.tot_finalizer_agent, prompt)
+        if budget:
+            budget.record(result)
+        return result.final_output.finalized
 
-        return await self.synthesize_answer(goal, frontier)
-    
-    async def synthesize_answer(self, goal: str, frontier: List[Node]) -> str:
+    async def synthesize_answer(self, goal: str, frontier: List[Node], is_streamed: bool = False) -> str:
         if not frontier:
             return "No solution found"
         
@@ -80,7 +164,7 @@ class TreeOfThoughtsWorkflow(AgentWorkflowInterface):
             f"Steps: {best.path}\n"
             "Be accurate and cite assumptions."
         )
-        if self.is_streamed:
+        if is_streamed:
             result = Runner.run_streamed(self.tot_executioner_agent, prompt)
             return result
         
@@ -88,79 +172,212 @@ class TreeOfThoughtsWorkflow(AgentWorkflowInterface):
         result = await Runner.run(self.tot_executioner_agent, prompt)
         return result.final_output
 
-    async def generate_final_thought(self, goal: str, config: ToTConfig = ToTConfig()):
-        # trace = {"question": goal, "levels": []}
+    async def expand(self, goal: str, node: Node, config: ToTConfig, table: TranspositionTable, budget: SearchBudget, on_progress: ProgressCallback = ignore_progress) -> Tuple[List[Node], List[Node]]:
+        """Generate the children of a node and evaluate them.
+
+        Returns the kept and the pruned children, each best first.
+        """
+        batch = await generate_thoughts(goal=goal, agent=self.tot_reasoner_agent, current_path=node.path, k=config.thoughts_per_step, budget=budget)
+        thoughts = table.unique_thoughts(node.path, batch.thoughts)
+
+        # candidates of this batch are evaluated right away, without waiting for sibling batches
+        evaluations = [table.get_evaluation(node.path, thought.text) if config.eval_enabled else None for thought in thoughts]
+        missing = [index for index, evaluation in enumerate(evaluations) if evaluation is None]
+        if config.eval_enabled and config.eval_mode == "batched":
+            results = await evaluate_thoughts(goal=goal, agent=self.tot_batch_evaluator_agent, path_so_far=node.path, candidates=[thoughts[index].text for index in missing], budget=budget) if missing else []
+        elif config.eval_enabled:
+            results = await asyncio.gather(*[
+                evaluate_thought(goal=goal, agent=self.tot_evaluator_agent, path_so_far=node.path, candiate=thoughts[index].text, budget=budget)
+                for index in missing
+            ])
+        if config.eval_enabled:
+            # merged and reused candidates skip the evaluator; that saves calls as the mode counts them
+            evaluator_calls = (lambda candidates: min(candidates, 1)) if config.eval_mode == "batched" else (lambda candidates: candidates)
+            table.saved_evaluations += len(batch.thoughts) - len(missing)
+            table.saved_calls += evaluator_calls(len(batch.thoughts)) - evaluator_calls(len(missing))
+            for index, evaluation in zip(missing, results):
+                evaluations[index] = evaluation
+                if evaluation is not None:
+                    table.set_evaluation(node.path, thoughts[index].text, evaluation)
+
+        kept: List[Node] = []
+        pruned: List[Node] = []
+        candidates = []
+        for thought, eval_result in zip(thoughts, evaluations):
+            score = thought.score
+            if eval_result is not None:
+                score = (eval_result.adjusted_score + score) / 2.0
+                keep = eval_result.keep and score >= config.min_keep_score
+            else:
+                keep = score >= config.min_keep_score
+
+            child = Node(path=node.path + [thought.text], score=(node.score + score)/2.0)
+            if not keep:
+                pruned.append(child)
+            elif table.claim_path(child.path):
+                kept.append(child)
+            else:
+                # an equivalent path is already in the tree
+                keep = False
+            candidates.append({"text": thought.text, "score": score, "kept": keep, "reason": eval_result.reason if eval_result is not None else None})
+
+        on_progress("candidates", {"depth": len(node.path), "parent": node.path, "candidates": candidates})
+        kept.sort(key=lambda n: n.score, reverse=True)
+        pruned.sort(key=lambda n: n.score, reverse=True)
+        return kept, pruned
+
+    def settled_nodes(self, beam: List[Node], pending: Iterable[Node], width: int) -> List[Node]:
+        """Nodes of a (sorted) partial beam of the given width that no child of a pending parent can push out.
+
+        A child scores at most (parent.score + 1) / 2 and each parent can place at
+        most width children in the beam.
+        """
+        pending_bounds = [(parent.score + 1) / 2.0 for parent in pending]
+        return [
+            node for rank, node in enumerate(beam)
+            if rank + width * len([bound for bound in pending_bounds if bound >= node.score]) < width
+        ]
+
+    async def generate_final_thought(self, goal: str, config: ToTConfig = ToTConfig(), is_streamed: bool = False, on_progress: ProgressCallback = ignore_progress):
+        on_progress("search_started", {"max_depth": config.max_depth, "beam_width": config.beam_width, "thoughts_per_step": config.thoughts_per_step})
         frontier: List[Node] = [Node(path=[], score=0.0)]
+        width = config.beam_width
+        best_score = 0.0
+        # id(node) -> expansion started before the node's level was complete
+        prefetched: Dict[int, asyncio.Task] = {}
+        pending: Dict[asyncio.Task, Node] = {}
+        table = TranspositionTable(scope=f"{self.tot_evaluator_agent.model.model}\n{goal}", enabled=config.dedup_enabled, similarity=config.dedup_similarity)
+        budget = SearchBudget(max_calls=config.max_calls, max_tokens=config.max_tokens, max_seconds=config.max_seconds)
+        report = {"policy": config.finalize_policy, "saved_seconds": 0.0, "finalized_at_depth": None, "cancelled_expansions": 0, "stop_reason": None, "beam_widths": []}
+
+        def cancel_expansions():
+            for task in [*pending, *prefetched.values()]:
+                if not task.done():
+                    task.cancel()
+                    report["cancelled_expansions"] += 1
+                    stats["cancelled_expansions"] += 1
+            pending.clear()
+            prefetched.clear()
+
+        def start_expansion(node: Node) -> Optional[asyncio.Task]:
+            """Expansion of node, or None when the budget cannot cover it."""
+            calls = config.expansion_calls()
+            if not budget.reserve(calls):
+                return None
+            task = asyncio.create_task(self.expand(goal, node, config, table, budget, on_progress))
+            task.add_done_callback(lambda _: budget.release(calls))
+            return task
+
+        def prefetch(nodes: Iterable[Node]) -> None:
+            for node in nodes:
+                if id(node) in prefetched:
+                    continue
+                task = start_expansion(node)
+                if task is None:
+                    return
+                prefetched[id(node)] = task
 
+        # the span data (speculation, dedup savings, budget use) is filled in as the search goes
+        span = custom_span("Tree-of-Thoughts search", data=report)
+        span.start(mark_as_current=True)
+        try:
+            for depth in range(config.max_depth):
+                level_started = time.perf_counter()
+                pending = {}
+                for node in frontier:
+                    task = prefetched.pop(id(node), None) or start_expansion(node)
+                    if task is not None:
+                        pending[task] = node
+                if not pending:
+                    # not even one more expansion fits: answer from the previous level
+                    report["stop_reason"] = budget.exhausted() or "calls"
+                    break
+                report["beam_widths"].append(width)
+                can_prefetch = depth + 1 < config.max_depth
+                next_frontier: List[Node] = []
+                survivor_scores: List[float] = []
+                fallback: List[Node] = []
 
-        for depth in range(config.max_depth):
-            next_frontier: List[Node] = []
-            # level_dump = []
-            
-            thought_generation_tasks = [
-                generate_thoughts(goal=goal, agent=self.tot_reasoner_agent, current_path=node.path, k=config.thoughts_per_step)
-                for node in frontier
-            ]
-            thought_batches = await asyncio.gather(*thought_generation_tasks)
-
-            # Prepare evaluation tasks if evaluation is enabled
-            eval_tasks = []
-            
-            for batch, node in zip(thought_batches, frontier):
-                for thought in batch.thoughts:
-                    if config.eval_enabled:
-                        eval_tasks.append(
-                            evaluate_thought(goal=goal, agent=self.tot_evaluator_agent, path_so_far=node.path, candiate=thought.text)
-                        )
-
-            eval_results = []
-            if eval_tasks:
-                eval_results = await asyncio.gather(*eval_tasks)
-
-            # Process results and build next frontier
-            eval_index = 0
-            for (batch, node) in zip(thought_batches, frontier):
-                kept: List[Node] = []
-                
-                for thought in batch.thoughts:
-                    score = thought.score
-                    
-                    if config.eval_enabled and eval_index < len(eval_results):
-                        eval_result = eval_results[eval_index]
-                        eval_index += 1
-                        score = (eval_result.adjusted_score + score) / 2.0
-                        keep = eval_result.keep and score >= config.min_keep_score
-                        # reason = eval_result.reason
+                # Merge each parent's children as soon as they are ready instead of
+                # waiting for the slowest expansion of the level
+                while pending:
+                    done, _ = await asyncio.wait(pending.keys(), timeout=budget.remaining_seconds(), return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        del pending[task]
+                        kept, pruned = task.result()
+                        survivor_scores.extend(node.score for node in kept)
+                        next_frontier.extend(kept)
+                        fallback.extend(pruned)
+                    next_frontier.sort(key=lambda n: n.score, reverse=True)
+                    next_frontier = next_frontier[:width]
+
+                    report["stop_reason"] = budget.exhausted()
+                    if report["stop_reason"]:
+                        # out of budget: go on with what this level produced so far
+                        break
+                    if can_prefetch and pending:
+                        prefetch(self.settled_nodes(next_frontier, pending.values(), width))
+
+                if not next_frontier and fallback:
+                    # every candidate was pruned: carry on with the least weak ones rather than nothing
+                    fallback.sort(key=lambda n: n.score, reverse=True)
+                    next_frontier = fallback[:max(config.min_beam_width, 1)]
+                    on_progress("fallback_used", {"depth": depth, "frontier": [{"path": node.path, "score": node.score} for node in next_frontier]})
+                if next_frontier:
+                    frontier = next_frontier
+                logger.debug("ToT depth %d: %d nodes in %.2fs (%d expansions prefetched)", depth, len(frontier), time.perf_counter() - level_started, len(prefetched))
+                on_progress("depth_completed", {"depth": depth, "frontier": [{"path": node.path, "score": node.score} for node in frontier], "seconds": time.perf_counter() - level_started})
+
+                # the last level is synthesized whatever the verdict, so it is not asked for
+                if report["stop_reason"] or not next_frontier or depth + 1 == config.max_depth:
+                    report["stop_reason"] = report["stop_reason"] or ("no_candidates" if not next_frontier else "max_depth")
+                    break
+                if config.plateau_delta is not None and depth > 0 and frontier[0].score - best_score < config.plateau_delta:
+                    report["stop_reason"] = "plateau"
+                    break
+                best_score = frontier[0].score
+
+                if config.adaptive_beam:
+                    next_width = adapt_beam_width(width, survivor_scores, config.min_beam_width, config.max_beam_width, config.clear_lead, config.tight_spread)
+                    if next_width != width:
+                        on_progress("beam_width_changed", {"depth": depth + 1, "beam_width": next_width})
+                        width = next_width
+
+                # the verdict is reserved first so speculative expansions cannot crowd it out
+                if not budget.reserve(1):
+                    report["stop_reason"] = budget.exhausted() or "calls"
+                    break
+                try:
+                    if config.finalize_policy == "speculative":
+                        # expand the next level while the verdict is pending; it is usually "not finalized"
+                        prefetch(frontier)
+                        verdict_started = time.perf_counter()
+                        finalized = await self.check_finalized(goal, frontier, budget)
+                        if not finalized:
+                            report["saved_seconds"] += time.perf_counter() - verdict_started
                     else:
-                        keep = score >= config.min_keep_score
-                        # reason = "kept by initial score"
-                    
-                    # level_dump.append({
-                    #     "parent_path": node.path,
-                    #     "candidate": thought.model_dump(),
-                    #     "eval_reason": reason,
-                    #     "kept": keep,
-                    #     "depth": depth
-                    # })
-
-                    if keep:
-                        kept.append(Node(path=node.path + [thought.text], score=(node.score + score)/2.0))
-                
-                kept.sort(key=lambda n: n.score, reverse=True)
-                next_frontier.extend(kept[:config.beam_width])
-            
-            next_frontier.sort(key=lambda n: n.score, reverse=True)
-            frontier = next_frontier[:config.beam_width]
-            # TODO
-            # trace["levels"].append(level_dump)
-            
-            maybe_complete = await self.try_finalize(goal, frontier)
-            if maybe_complete:
-                final = maybe_complete
-                break
-        else:
-            # if no early return, take the best path so far
-            final = await self.synthesize_answer(goal, frontier)
+                        finalized = await self.check_finalized(goal, frontier, budget)
+                finally:
+                    budget.release(1)
+                on_progress("finalization_checked", {"depth": depth, "finalized": finalized})
+
+                if finalized:
+                    report["finalized_at_depth"] = depth
+                    report["stop_reason"] = "finalized"
+                    break
+
+            cancel_expansions()
+            on_progress("synthesis_started", {"path": frontier[0].path, "stop_reason": report["stop_reason"]})
+            # take the best path so far
+            final = await self.synthesize_answer(goal, frontier, is_streamed)
+        finally:
+            cancel_expansions()
+            stats["speculation_saved_seconds"] += report["saved_seconds"]
+            stats["saved_model_calls"] += table.saved_calls
+            report.update(table.stats())
+            report["budget"] = budget.to_dict()
+            logger.debug("ToT search stopped (%s) after %d model calls, saved %d through deduplication", report["stop_reason"], budget.calls, table.saved_calls)
+            span.finish(reset_current=True)
         return final
         
 
@@ -168,12 +385,13 @@ class TreeOfThoughtsWorkflow(AgentWorkflowInterface):
         goal = query[-1]["content"]
 
         with trace("Tree-of-Thoughts workflow non streamed"):
-            return await self.generate_final_thought(goal, ToTConfig())
+            return await self.generate_final_thought(goal, self.config)
       
     async def execute_streamed(self, query: List[dict]):
-        self.is_streamed = True
         goal = query[-1]["content"]
 
-        with trace("Tree-of-Thoughts workflow"):
-            result = await self.generate_final_thought(goal, ToTConfig())
-            return result
+        # returns right away; the search reports its progress through the stream
+        return ToTStreamResult(
+            lambda on_progress: self.generate_final_thought(goal, self.config, is_streamed=True, on_progress=on_progress),
+            workflow_name="Tree-of-Thoughts workflow",
+        )
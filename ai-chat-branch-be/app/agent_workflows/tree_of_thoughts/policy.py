@@ -0,0 +1,77 @@
+import statistics
+import time
+from typing import Any, Dict, List, Optional
+from app.utils.response_cache import CachedRunResult
+
+
+class SearchBudget:
+    """Model calls, tokens and wall-clock one search may spend; None means unlimited.
+
+    Work reserves the calls it may make before it starts and releases them
+    once it is done, so calls in flight count against max_calls at their
+    worst case.
+    """
+
+    def __init__(self, max_calls: Optional[int] = None, max_tokens: Optional[int] = None, max_seconds: Optional[float] = None):
+        self.max_calls = max_calls
+        self.max_tokens = max_tokens
+        self.max_seconds = max_seconds
+        self.started = time.perf_counter()
+        self.calls = 0
+        self.tokens = 0
+        self.reserved = 0
+
+    def record(self, result: Any) -> None:
+        """Account for a Runner.run result; cached results cost nothing."""
+        if isinstance(result, CachedRunResult):
+            return
+        self.calls += 1
+        usage = getattr(getattr(result, "context_wrapper", None), "usage", None)
+        if usage is not None:
+            self.tokens += usage.total_tokens
+
+    def reserve(self, calls: int) -> bool:
+        """Set aside calls for work about to start; False when the budget cannot cover them."""
+        if self.exhausted():
+            return False
+        if self.max_calls is not None and self.calls + self.reserved + calls > self.max_calls:
+            return False
+        self.reserved += calls
+        return True
+
+    def release(self, calls: int) -> None:
+        self.reserved -= calls
+
+    def remaining_seconds(self) -> Optional[float]:
+        if self.max_seconds is None:
+            return None
+        return max(self.max_seconds - (time.perf_counter() - self.started), 0.0)
+
+    def exhausted(self) -> Optional[str]:
+        """The limit that was reached, if any."""
+        if self.max_calls is not None and self.calls >= self.max_calls:
+            return "calls"
+        if self.max_tokens is not None and self.tokens >= self.max_tokens:
+            return "tokens"
+        if self.max_seconds is not None and self.remaining_seconds() <= 0:
+            return "seconds"
+        return None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"calls": self.calls, "tokens": self.tokens, "seconds": time.perf_counter() - self.started}
+
+
+def adapt_beam_width(width: int, scores: List[float], min_width: int, max_width: int, clear_lead: float, tight_spread: float) -> int:
+    """Beam width for the next depth from the scores of the candidates that survived this one.
+
+    A clear leader narrows the beam, candidates too close to tell apart widen it.
+    """
+    if len(scores) < 2:
+        return width
+
+    ranked = sorted(scores, reverse=True)
+    if ranked[0] - ranked[1] >= clear_lead:
+        return max(min_width, width - 1)
+    if len(ranked) > width and statistics.pstdev(ranked[:width + 1]) <= tight_spread:
+        return min(max_width, width + 1)
+    return width
@@ -0,0 +1,110 @@
+import hashlib
+import os
+from typing import Any, Dict, List, Optional, Set, Tuple
+from app.agent_workflows.tree_of_thoughts.agents import Evaluation, Thought
+from app.utils.cache import LRUCache
+from app.utils.text import jaccard, normalize
+
+# (scope, key of the path ending in the candidate) -> Evaluation, shared by searches so a
+# repeated or regenerated question reuses the verdicts on equivalent steps
+_evaluations = LRUCache(
+    max_size=int(os.getenv("TOT_EVALUATION_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("TOT_EVALUATION_CACHE_TTL_SECONDS", "3600")),
+)
+
+
+def thought_key(text: str) -> str:
+    return hashlib.sha1(normalize(text).encode()).hexdigest()
+
+
+class TranspositionTable:
+    """Per-search record of the thoughts and paths already seen.
+
+    Thoughts are compared by their normalized text (case, punctuation and
+    whitespace ignored) and, when similarity is set, also count as the same
+    when the Jaccard similarity of their words reaches it. Paths are compared
+    as ordered sequences of thoughts, since the same steps in another order
+    are a different line of reasoning. Evaluations are reused for an
+    equivalent path within the same scope (evaluator model and normalized
+    goal), also across searches.
+    """
+
+    def __init__(self, scope: str, enabled: bool = True, similarity: Optional[float] = None):
+        self.scope = thought_key(scope)
+        self.enabled = enabled
+        self.similarity = similarity
+        self._paths: Set[Tuple[str, ...]] = set()
+        # parent path key -> thoughts already proposed after an equivalent parent path
+        self._children: Dict[Tuple[str, ...], List[str]] = {}
+        self.duplicate_thoughts = 0
+        self.duplicate_paths = 0
+        self.reused_evaluations = 0
+        self.saved_evaluations = 0
+        self.saved_calls = 0
+
+    def path_key(self, path: List[str]) -> Tuple[str, ...]:
+        return tuple(thought_key(thought) for thought in path)
+
+    def same_thought(self, a: str, b: str) -> bool:
+        return thought_key(a) == thought_key(b) or (self.similarity is not None and jaccard(a, b) >= self.similarity)
+
+    def unique_thoughts(self, path: List[str], thoughts: List[Thought]) -> List[Thought]:
+        """Thoughts proposed after path that are worth evaluating.
+
+        Equivalent thoughts of the batch are merged, keeping the best scored of
+        each group, and thoughts already proposed after an equivalent path are
+        dropped. Children of other parents are left alone: the same step after
+        a different path is a different path.
+        """
+        if not self.enabled:
+            return thoughts
+
+        siblings = self._children.setdefault(self.path_key(path), [])
+        unique: List[Thought] = []
+        for thought in sorted(thoughts, key=lambda t: t.score, reverse=True):
+            if any(self.same_thought(thought.text, kept.text) for kept in unique):
+                self.duplicate_thoughts += 1
+            elif any(self.same_thought(thought.text, other) for other in siblings):
+                self.duplicate_paths += 1
+            else:
+                unique.append(thought)
+        siblings.extend(thought.text for thought in unique)
+        return unique
+
+    def claim_path(self, path: List[str]) -> bool:
+        """False when an equivalent path is already in the tree."""
+        if not self.enabled:
+            return True
+
+        key = self.path_key(path)
+        if key in self._paths:
+            self.duplicate_paths += 1
+            return False
+        self._paths.add(key)
+        return True
+
+    def get_evaluation(self, path: List[str], candidate: str) -> Optional[Evaluation]:
+        if not self.enabled:
+            return None
+
+        evaluation = _evaluations.get((self.scope, self.path_key(path + [candidate])))
+        if evaluation is not None:
+            self.reused_evaluations += 1
+        return evaluation
+
+    def set_evaluation(self, path: List[str], candidate: str, evaluation: Evaluation) -> None:
+        if self.enabled:
+            _evaluations.set((self.scope, self.path_key(path + [candidate])), evaluation)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "duplicate_thoughts": self.duplicate_thoughts,
+            "duplicate_paths": self.duplicate_paths,
+            "reused_evaluations": self.reused_evaluations,
+            "saved_evaluations": self.saved_evaluations,
+            "saved_model_calls": self.saved_calls,
+        }
+
+
+def evaluation_cache_stats() -> Dict[str, Any]:
+    return _evaluations.stats()
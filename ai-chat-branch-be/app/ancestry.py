@@ -0,0 +1,136 @@
+import asyncio
+from typing import Any, Dict, List
+from app.db import db
+
+# Every conversation stores its ancestry at creation time:
+#   ancestor_ids         - ancestor conversation ids, root first
+#   ancestor_message_ids - messages each level branched from, root first
+# so path and history lookups are single indexed queries instead of a walk
+# up the thread tree.
+
+# Recomputes the ancestry of every conversation from conversations.message_id.
+# Used by the consistency checker (and mirrored by the dml/v4.sql backfill).
+EXPECTED_ANCESTRY_CTE = """
+    WITH RECURSIVE expected AS (
+        SELECT c.id, ARRAY[]::integer[] AS ancestor_ids, ARRAY[]::integer[] AS ancestor_message_ids
+        FROM conversations AS c
+        WHERE c.message_id IS NULL
+        UNION ALL
+        SELECT c.id, e.ancestor_ids || m.conversation_id, e.ancestor_message_ids || m.id
+        FROM expected AS e
+        JOIN messages AS m ON m.conversation_id = e.id
+        JOIN conversations AS c ON c.message_id = m.id
+    )
+"""
+
+
+class MessageNotFound(LookupError):
+    pass
+
+
+async def create_conversation(name: str, message_id: int | None = None) -> Dict[str, Any]:
+    """Insert a conversation, branched from message_id if given.
+
+    Raises MessageNotFound when message_id does not exist.
+    """
+    if not message_id:
+        rows = await db.execute("INSERT INTO conversations (name) VALUES (%s) RETURNING *", (name,), True)
+        return rows[0]
+
+    rows = await db.execute(
+        """
+        INSERT INTO conversations (name, message_id, ancestor_ids, ancestor_message_ids)
+        SELECT %s, m.id, p.ancestor_ids || p.id, p.ancestor_message_ids || m.id
+        FROM messages AS m
+        JOIN conversations AS p ON p.id = m.conversation_id
+        WHERE m.id = %s
+        RETURNING *
+        """,
+        (name, message_id,),
+        True
+    )
+    if not rows:
+        raise MessageNotFound(message_id)
+    return rows[0]
+
+
+async def get_conversation_path(conversation_id: int) -> List[Dict[str, Any]]:
+    """Conversation and its ancestors, from the conversation up to the root."""
+    return await db.fetch_all(
+        """
+        SELECT c.id, c.name, c.message_id
+        FROM conversations AS t
+        JOIN conversations AS c ON c.id = ANY(t.ancestor_ids || t.id)
+        WHERE t.id = %s
+        ORDER BY cardinality(c.ancestor_ids) DESC
+        """,
+        (conversation_id,)
+    )
+
+
+async def get_thread_history(ancestor_message_ids: List[int]) -> List[Dict[str, Any]]:
+    """Messages of every ancestor up to its branch point, root first, oldest first within each."""
+    if not ancestor_message_ids:
+        return []
+
+    return await db.fetch_all(
+        """
+        SELECT m.id, m.content, m.role
+        FROM unnest(%s::integer[]) WITH ORDINALITY AS a(message_id, depth)
+        JOIN messages AS b ON b.id = a.message_id
+        JOIN messages AS m ON m.conversation_id = b.conversation_id AND m.created_at <= b.created_at
+        ORDER BY a.depth ASC, m.created_at
+        """,
+        (ancestor_message_ids,)
+    )
+
+
+async def check_consistency(repair: bool = False) -> List[Dict[str, Any]]:
+    """Conversations whose stored ancestry differs from the one derived from message_id."""
+    mismatches = await db.fetch_all(
+        EXPECTED_ANCESTRY_CTE + """
+        SELECT c.id,
+            c.ancestor_ids, e.ancestor_ids AS expected_ancestor_ids,
+            c.ancestor_message_ids, e.ancestor_message_ids AS expected_ancestor_message_ids
+        FROM conversations AS c
+        LEFT JOIN expected AS e ON e.id = c.id
+        WHERE e.id IS NULL
+            OR c.ancestor_ids IS DISTINCT FROM e.ancestor_ids
+            OR c.ancestor_message_ids IS DISTINCT FROM e.ancestor_message_ids
+        ORDER BY c.id
+        """
+    )
+
+    if repair and mismatches:
+        await db.execute(
+            EXPECTED_ANCESTRY_CTE + """
+            UPDATE conversations AS c
+            SET ancestor_ids = e.ancestor_ids, ancestor_message_ids = e.ancestor_message_ids
+            FROM expected AS e
+            WHERE e.id = c.id AND c.id = ANY(%s)
+            """,
+            ([row["id"] for row in mismatches],)
+        )
+    return mismatches
+
+
+async def main(repair: bool = False) -> List[Dict[str, Any]]:
+    await db.connect()
+    try:
+        return await check_consistency(repair=repair)
+    finally:
+        await db.disconnect()
+
+
+if __name__ == "__main__":
+    import sys
+    repair = "--repair" in sys.argv
+    mismatches = asyncio.run(main(repair=repair))
+    for row in mismatches:
+        print(
+            f"conversation {row['id']}: "
+            f"ancestor_ids={row['ancestor_ids']} expected={row['expected_ancestor_ids']}, "
+            f"ancestor_message_ids={row['ancestor_message_ids']} expected={row['expected_ancestor_message_ids']}"
+        )
+    print(f"{len(mismatches)} inconsistent conversation(s){' repaired' if repair and mismatches else ''}")
+    sys.exit(1 if mismatches else 0)
@@ -1,7 +1,8 @@
 import os
+import time
 from contextlib import asynccontextmanager
 from typing import Optional, Dict, Any
-from psycopg_pool import ConnectionPool
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
 from dotenv import load_dotenv
 
 load_dotenv(override=True)
@@ -9,8 +10,17 @@ load_dotenv(override=True)
 
 class Database:
     def __init__(self):
-        self.pool: Optional[ConnectionPool] = None
+        self.pool: Optional[AsyncConnectionPool] = None
         self._connection_string = self._build_connection_string()
+        self._min_size = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+        self._max_size = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+        self._timeout = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+        self._max_idle = float(os.getenv("DB_POOL_MAX_IDLE", "600"))
+        self._max_lifetime = float(os.getenv("DB_POOL_MAX_LIFETIME", "3600"))
+        self._acquire_count = 0
+        self._acquire_timeouts = 0
+        self._acquire_wait_ms = 0.0
+        self._acquire_wait_max_ms = 0.0
     
     def _build_connection_string(self) -> str:
         """Build PostgreSQL connection string from environment variables."""
@@ -25,22 +35,26 @@ class Database:
     async def connect(self) -> None:
         """Initialize connection pool."""
         try:
-            self.pool = ConnectionPool(
+            self.pool = AsyncConnectionPool(
                 conninfo=self._connection_string,
-                min_size=1,
-                max_size=10,
-                timeout=30
+                min_size=self._min_size,
+                max_size=self._max_size,
+                timeout=self._timeout,
+                max_idle=self._max_idle,
+                max_lifetime=self._max_lifetime,
+                open=False
             )
+            await self.pool.open(wait=True, timeout=self._timeout)
             # Test connection
-            with self.pool.connection() as conn:
-                conn.execute("SELECT 1")
+            async with self.pool.connection() as conn:
+                await conn.execute("SELECT 1")
         except Exception as e:
             raise ConnectionError(f"Failed to connect to database: {e}")
     
     async def disconnect(self) -> None:
         """Close connection pool."""
         if self.pool:
-            self.pool.close()
+            await self.pool.close()
     
     @asynccontextmanager
     async def get_connection(self):
@@ -48,15 +62,27 @@ class Database:
         if not self.pool:
             raise RuntimeError("Database not connected. Call connect() first.")
         
-        with self.pool.connection() as conn:
-            yield conn
+        started = time.perf_counter()
+        try:
+            async with self.pool.connection() as conn:
+                self._record_acquire(started)
+                yield conn
+        except PoolTimeout:
+            self._acquire_timeouts += 1
+            raise
+    
+    def _record_acquire(self, started: float) -> None:
+        wait_ms = (time.perf_counter() - started) * 1000
+        self._acquire_count += 1
+        self._acquire_wait_ms += wait_ms
+        self._acquire_wait_max_ms = max(self._acquire_wait_max_ms, wait_ms)
     
     async def execute(self, query: str, params: Optional[tuple] = None, fetch: bool = False):
         async with self.get_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute(query, params)
+            async with conn.cursor() as cur:
+                await cur.execute(query, params)
                 if fetch:
-                    rows = cur.fetchall()
+                    rows = await cur.fetchall()
                     return [dict(zip([desc[0] for desc in cur.description], row)) for row in rows]
                 return cur
     
@@ -65,9 +91,9 @@ class Database:
     async def fetch_one(self, query: str, params: Optional[tuple] = None) -> Optional[Dict[str, Any]]:
         """Fetch a single row."""
         async with self.get_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute(query, params)
-                row = cur.fetchone()
+            async with conn.cursor() as cur:
+                await cur.execute(query, params)
+                row = await cur.fetchone()
                 if row:
                     return dict(zip([desc[0] for desc in cur.description], row))
                 return None
@@ -75,25 +101,35 @@ class Database:
     async def fetch_all(self, query: str, params: Optional[tuple] = None) -> list[Dict[str, Any]]:
         """Fetch all rows."""
         async with self.get_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute(query, params)
-                rows = cur.fetchall()
+            async with conn.cursor() as cur:
+                await cur.execute(query, params)
+                rows = await cur.fetchall()
                 return [dict(zip([desc[0] for desc in cur.description], row)) for row in rows]
     
     async def execute_many(self, query: str, params_list: list[tuple]) -> None:
         """Execute a query with multiple parameter sets."""
         async with self.get_connection() as conn:
-            with conn.cursor() as cur:
-                cur.executemany(query, params_list)
+            async with conn.cursor() as cur:
+                await cur.executemany(query, params_list)
     
     @asynccontextmanager
     async def transaction(self):
         """Get a transaction context manager."""
-        if not self.pool:
-            raise RuntimeError("Database not connected. Call connect() first.")
-        
-        with self.pool.connection() as conn:
-            yield conn
+        async with self.get_connection() as conn:
+            async with conn.transaction():
+                yield conn
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Pool usage and connection acquire metrics."""
+        stats: Dict[str, Any] = {
+            "acquire_count": self._acquire_count,
+            "acquire_timeouts": self._acquire_timeouts,
+            "acquire_wait_avg_ms": self._acquire_wait_ms / self._acquire_count if self._acquire_count else 0.0,
+            "acquire_wait_max_ms": self._acquire_wait_max_ms,
+        }
+        if self.pool:
+            stats.update(self.pool.get_stats())
+        return stats
 
 
 # Global database instance
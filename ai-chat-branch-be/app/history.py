@@ -0,0 +1,108 @@
+import os
+from typing import Any, Dict, Hashable, List
+from app.db import db
+from app import ancestry, summaries
+from app.utils.cache import LRUCache
+
+
+class HistoryCache:
+    """In-process cache of prompt history keyed by (conversation_id, cutoff message id).
+
+    Ancestor history of a thread is keyed by the message the thread branched
+    from and never changes once the thread exists. A conversation's own turns
+    are keyed by its last message id; when a newer message arrives, the
+    previous entry is extended with only the missing rows.
+    """
+
+    def __init__(self, max_messages: int):
+        self._cache = LRUCache(max_size=max_messages, get_size=lambda rows: max(len(rows), 1), on_evict=self._on_evict)
+        # conversation_id -> cutoff of its newest cached local entry
+        self._latest: Dict[int, int] = {}
+        self.incremental_loads = 0
+        self.invalidations = 0
+
+    def _on_evict(self, key: Hashable, rows: List[Dict[str, Any]]) -> None:
+        conversation_id, cutoff = key
+        if self._latest.get(conversation_id) == cutoff:
+            del self._latest[conversation_id]
+
+    async def get_ancestor_history(self, conversation: Dict[str, Any]) -> List[Dict[str, Any]]:
+        if not conversation["message_id"]:
+            return []
+
+        key = (conversation["id"], conversation["message_id"])
+        rows = self._cache.get(key)
+        if rows is None:
+            rows = await summaries.get_branch_history(conversation["message_id"]) or await ancestry.get_thread_history(conversation["ancestor_message_ids"])
+            self._cache.set(key, rows)
+        return rows
+
+    async def get_local_history(self, conversation_id: int, last_message_id: int | None) -> List[Dict[str, Any]]:
+        if last_message_id is None:
+            return []
+
+        key = (conversation_id, last_message_id)
+        rows = self._cache.get(key)
+        if rows is not None:
+            return rows
+
+        previous = self._latest.get(conversation_id)
+        base = self._cache.peek((conversation_id, previous)) if previous is not None and previous < last_message_id else None
+        if base is not None:
+            delta = await db.fetch_all(
+                "SELECT id, content, role from messages WHERE conversation_id = %s AND id > %s AND id <= %s ORDER BY created_at ASC",
+                (conversation_id, previous, last_message_id,)
+            )
+            self._cache.pop((conversation_id, previous))
+            rows = base + delta
+            self.incremental_loads += 1
+        else:
+            rows = await db.fetch_all(
+                "SELECT id, content, role from messages WHERE conversation_id = %s AND id <= %s ORDER BY created_at ASC",
+                (conversation_id, last_message_id,)
+            )
+
+        self._cache.set(key, rows)
+        self._latest[conversation_id] = last_message_id
+        return rows
+
+    async def get_history(self, conversation: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Prompt history of a conversation: its ancestors' turns, then its own.
+
+        conversation must carry last_message_id, the newest message to include,
+        and its rolling summary (summary, summary_message_id) if it has one; the
+        summary then replaces everything up to summary_message_id.
+        Rows keep their message id so the context builder can pin them.
+        """
+        local = await self.get_local_history(conversation["id"], conversation["last_message_id"])
+        summary_message_id = conversation.get("summary_message_id")
+        if summary_message_id and summary_message_id <= (conversation["last_message_id"] or 0):
+            rows = [summaries.summary_message(conversation["summary"])] + [row for row in local if row["id"] > summary_message_id]
+        else:
+            rows = await self.get_ancestor_history(conversation) + local
+        return [{"id": row["id"], "content": row["content"], "role": row["role"]} for row in rows]
+
+    def invalidate_message(self, message_id: int) -> None:
+        """Drop every entry holding a message whose content has changed."""
+        for key, rows in self._cache.items():
+            if any(row["id"] == message_id for row in rows):
+                self._cache.pop(key)
+                self._on_evict(key, rows)
+                self.invalidations += 1
+
+    def invalidate_conversation(self, conversation_id: int) -> None:
+        for key, rows in self._cache.items():
+            if key[0] == conversation_id:
+                self._cache.pop(key)
+                self._on_evict(key, rows)
+                self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._cache.stats(),
+            "incremental_loads": self.incremental_loads,
+            "invalidations": self.invalidations,
+        }
+
+
+history_cache = HistoryCache(max_messages=int(os.getenv("HISTORY_CACHE_MAX_MESSAGES", "50000")))
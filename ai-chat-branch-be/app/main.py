@@ -1,16 +1,34 @@
+import asyncio
+import base64
 from contextlib import asynccontextmanager
-from typing import Any, Dict
+from datetime import datetime
+from typing import Any, Dict, List, Literal
 from dotenv import load_dotenv
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, HTTPException
 import json
+import os
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
-from openai.types.responses import ResponseReasoningSummaryTextDeltaEvent, ResponseTextDeltaEvent
-from pydantic import BaseModel
+from openai.types.responses import ResponseTextDeltaEvent
+from pydantic import BaseModel, Field
 from app.db import db
+from app import ancestry, summaries
+from app.history import history_cache
+from app.message_buffer import message_buffer
 from app.agent_workflows.constants import AGENTIC_MODE
-from app.agent_workflows.index import AgentWorkflows
+from app.agent_workflows.index import AgentWorkflows, workflow_cache_stats
+from app.agent_workflows.tree_of_thoughts.agents import stats as tot_stats
+from app.agent_workflows.deep_research.index import stats as deep_research_stats
+from app.agent_workflows.tree_of_thoughts.transposition import evaluation_cache_stats as tot_evaluation_cache_stats
 from app.prompts.index import Prompt
+from app.prompts.budget import context_stats
+from app.utils.stream import coalesce, encode_frame, encode_sse, stream_deltas
+from app.utils.stream_channel import StreamChannel, StreamRegistry
+from app.utils.job_runner import JobRunner
+from app.utils.http_client import llm_http_client
+from app.utils.response_cache import response_cache
+from app.utils.search_cache import web_search_cache
+from app.utils.model import llm_scheduler
 from app.prompts.constants import PromptMode
 import litellm
 
@@ -18,6 +36,17 @@ load_dotenv(override=True)
 
 # Configure litellm to drop unsupported parameters (fixes GPT-5 temperature issue)
 litellm.drop_params = True
+STREAM_COALESCE_MS = int(os.getenv("STREAM_COALESCE_MS", "50"))
+STREAM_COALESCE_BYTES = int(os.getenv("STREAM_COALESCE_BYTES", "512"))
+generation_runner = JobRunner(
+    max_concurrency=int(os.getenv("GENERATION_MAX_CONCURRENCY", "32")),
+    max_queue=int(os.getenv("GENERATION_MAX_QUEUE", "128"))
+)
+stream_registry = StreamRegistry(
+    capacity=int(os.getenv("STREAM_REPLAY_BUFFER_EVENTS", "4096")),
+    linger=float(os.getenv("STREAM_REPLAY_LINGER_SECONDS", "60")),
+    runner=generation_runner
+)
 origins = [
     "*",
 ]
@@ -26,8 +55,13 @@ origins = [
 async def lifespan(app: FastAPI):
     # Startup
     await db.connect()
+    llm_http_client.start()
+    message_buffer.start()
     yield
     # Shutdown
+    await generation_runner.stop()
+    await message_buffer.stop()
+    await llm_http_client.stop()
     await db.disconnect()
 
 app = FastAPI(lifespan=lifespan)
@@ -56,6 +90,28 @@ async def root():
         }
     }
 
+@app.get("/metrics")
+async def getMetrics():
+    return {
+        "code": 0,
+        "data": {
+            "db": db.get_stats(),
+            "history_cache": history_cache.stats(),
+            "context_window": context_stats.to_dict(),
+            "summaries": summaries.stats,
+            "message_buffer": message_buffer.stats(),
+            "streams": stream_registry.stats(),
+            "generation_jobs": generation_runner.stats(),
+            "workflow_cache": workflow_cache_stats(),
+            "llm_http": llm_http_client.stats(),
+            "response_cache": response_cache.stats(),
+            "web_search_cache": web_search_cache.stats(),
+            "llm_scheduler": llm_scheduler.stats(),
+            "tree_of_thoughts": {**tot_stats, "evaluation_cache": tot_evaluation_cache_stats()},
+            "deep_research": deep_research_stats
+        }
+    }
+
 # get conversations - done
 # get one conversations - done
 # get nested msg in a parent msg - done
@@ -71,59 +127,115 @@ class ConversationCreate(BaseModel):
 
 class ConversationDetails(BaseModel):
     id: int
+    # window of messages: the newest `limit` ones, or `limit` before/after a message id; no limit returns them all
+    limit: int | None = Field(default=None, ge=1, le=500)
+    before_id: int | None = None
+    after_id: int | None = None
+
+ConversationField = Literal["id", "name", "message_id", "created_at", "updated_at", "ancestor_ids", "ancestor_message_ids"]
+
+class ConversationList(BaseModel):
+    # no limit returns every conversation
+    limit: int | None = Field(default=None, ge=1, le=200)
+    cursor: str | None = None
+    fields: List[ConversationField] | None = None
+
+def encodeConversationCursor(conversation):
+    return base64.urlsafe_b64encode(json.dumps([conversation["created_at"].isoformat(), conversation["id"]]).encode()).decode()
+
+def decodeConversationCursor(cursor: str):
+    try:
+        created_at, conversation_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), int(conversation_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 @app.post("/conversations/v1/getAll")
-async def getConversations():
-    conversations = await db.fetch_all("SELECT * from conversations ORDER BY created_at DESC")
+async def getConversations(body: ConversationList | None = None):
+    body = body or ConversationList()
+    # id and created_at back the cursor, so they are always selected
+    fields = ["id", "created_at"] + [field for field in (body.fields or ["name", "message_id", "updated_at"]) if field not in ("id", "created_at")]
+
+    query = f"SELECT {', '.join(fields)} from conversations"
+    params = []
+    if body.cursor:
+        query += " WHERE (created_at, id) < (%s, %s)"
+        params += decodeConversationCursor(body.cursor)
+    query += " ORDER BY created_at DESC, id DESC"
+    if body.limit:
+        query += " LIMIT %s"
+        params.append(body.limit + 1)
+
+    conversations = await db.fetch_all(query, tuple(params))
+    next_cursor = None
+    if body.limit and len(conversations) > body.limit:
+        conversations = conversations[:body.limit]
+        next_cursor = encodeConversationCursor(conversations[-1])
+
     return {
         "code": 0, 
         "data": {
-            "conversations": conversations
+            "conversations": conversations,
+            "next_cursor": next_cursor
         }
     }
 
 async def getConversationPath(body: ConversationDetails):
-    conversation = await db.fetch_one("SELECT id, name, message_id FROM conversations WHERE id = %s", (body.id,))
-    if not conversation:
-        return []
-
-    path = [{"id": conversation["id"], "name": conversation["name"], "message_id": conversation["message_id"]}]
-    while (conversation["message_id"]):
-        message = await db.fetch_one("SELECT id, content, conversation_id from messages WHERE id = %s", (conversation["message_id"],))
-        conversation = await db.fetch_one("SELECT id, name, message_id from conversations WHERE id = %s", (message["conversation_id"],))
-        path.append({"id": conversation["id"], "name": conversation["name"], "message_id": conversation["message_id"]})
-    return path
-
-
-@app.post("/conversations/v1/getDetails")
-async def getConversationDetails(body: ConversationDetails):
-    messages = await db.fetch_all(
+    return await ancestry.get_conversation_path(body.id)
+
+
+async def getMessagesWindow(body: ConversationDetails):
+    query = "SELECT m.* FROM messages AS m WHERE m.conversation_id = %s"
+    params = [body.id]
+    descending = not body.after_id and (body.before_id or body.limit)
+    if body.before_id:
+        query += " AND (m.created_at, m.id) < (SELECT created_at, id FROM messages WHERE id = %s)"
+        params.append(body.before_id)
+    if body.after_id:
+        query += " AND (m.created_at, m.id) > (SELECT created_at, id FROM messages WHERE id = %s)"
+        params.append(body.after_id)
+    query += " ORDER BY m.created_at DESC, m.id DESC" if descending else " ORDER BY m.created_at, m.id"
+    if body.limit:
+        query += " LIMIT %s"
+        params.append(body.limit + 1)
+
+    messages = await db.fetch_all(query, tuple(params))
+    has_more = bool(body.limit) and len(messages) > body.limit
+    if has_more:
+        messages = messages[:body.limit]
+    if descending:
+        messages.reverse()
+    return messages, has_more
+
+async def getChildConversations(message_ids: List[int]):
+    rows = await db.fetch_all(
         """
-        SELECT m.*,
-        COALESCE(cc.child_conversations, '[]'::json) AS child_conversations
-        FROM messages AS m
-        LEFT JOIN LATERAL (
-            SELECT json_agg(
-                json_build_object('id', c.id, 'name', c.name)
-                ORDER BY c.created_at
-            ) AS child_conversations
-            FROM conversations AS c
-            WHERE c.message_id = m.id
-        ) AS cc ON TRUE
-        WHERE m.conversation_id = %s
-        ORDER BY m.created_at;
+        SELECT c.message_id,
+        json_agg(json_build_object('id', c.id, 'name', c.name) ORDER BY c.created_at) AS child_conversations
+        FROM conversations AS c
+        WHERE c.message_id = ANY(%s)
+        GROUP BY c.message_id
         """,
-        (body.id,)
+        (message_ids,)
     )
+    return {row["message_id"]: row["child_conversations"] for row in rows}
+
+@app.post("/conversations/v1/getDetails")
+async def getConversationDetails(body: ConversationDetails):
+    (messages, has_more), path = await asyncio.gather(getMessagesWindow(body), getConversationPath(body))
+
+    child_conversations = await getChildConversations([message["id"] for message in messages]) if messages else {}
+    for message in messages:
+        message["child_conversations"] = child_conversations.get(message["id"], [])
 
-    path = await getConversationPath(body)
     path.reverse()
     
     return {
         "code": 0,
         "data": {
             "messages": messages,
-            "path": path
+            "path": path,
+            "has_more": has_more
         }
     }
 @app.post("/conversations/v1/create")
@@ -131,19 +243,17 @@ async def createConversations(body: ConversationCreate):
     agent_workflows = AgentWorkflows(agentic_mode=AGENTIC_MODE.SUMMARY)
     result = await agent_workflows.run(query=[{"role": "user", "content": body.first_msg + "\nSummarize the user query in less than 10 words. DO NOT use bullet point list, stages or steps."}])
     
-    new_record = None
+    try:
+        new_record = await ancestry.create_conversation(name=result.final_output, message_id=body.message_id)
+    except ancestry.MessageNotFound:
+        raise HTTPException(status_code=404, detail="Message not found")
 
-    if (not body.message_id):
-        new_record = await db.execute("INSERT INTO conversations (name) VALUES (%s) RETURNING *", (result.final_output,), True)
-    else:
-        new_record = await db.execute("INSERT INTO conversations (name, message_id) VALUES (%s, %s) RETURNING *", (result.final_output, body.message_id,), True)
-
-    await db.execute("INSERT INTO messages (content, conversation_id, role, num_of_children) VALUES (%s, %s, %s, %s)", (body.first_msg, new_record[0]["id"], "user", 0,))
+    await db.execute("INSERT INTO messages (content, conversation_id, role, num_of_children) VALUES (%s, %s, %s, %s)", (body.first_msg, new_record["id"], "user", 0,))
 
     return {
         "code": 0,
         "data": {
-            "conversation": new_record[0]
+            "conversation": new_record
         }
     }
 
@@ -156,84 +266,153 @@ class CreateMessageReq(BaseModel):
     prompt_mode: PromptMode | None = None
     extra_data: Dict[str, Any] | None = None
     model_settings: Dict[str, Any] | None = None
+    # "coalesced" sends metadata once in a header frame and batches deltas into fewer frames;
+    # "sse" streams Server-Sent Events that can be resumed through /messages/v1/stream
+    stream_format: Literal["ndjson", "coalesced", "sse"] = "ndjson"
 
 
 async def getThreadHistory(thread):
-    conversation = thread
-    history = []
-    while (conversation["message_id"]):
-        message = await db.fetch_one("SELECT * from messages WHERE id = %s", (conversation["message_id"],))
-        conversation = await db.fetch_one("SELECT * from conversations WHERE id = %s", (message["conversation_id"],))
-
-        currHistory = await db.fetch_all("SELECT content, role from messages WHERE conversation_id = %s AND created_at <= %s ORDER BY created_at ASC", (conversation["id"], message["created_at"],))
-        history += currHistory
+    return await history_cache.get_history(thread)
+
+async def finishMessage(conversation_id: int, message_id: int, content: str, reasoning_summary: str | None):
+    await message_buffer.finalize(message_id, content, reasoning_summary)
+    history_cache.invalidate_message(message_id)
+    summaries.schedule_refresh(conversation_id, message_id)
+
+async def prepareMessage(body: CreateMessageReq):
+    # Get conversation
+    conversation = await db.fetch_one(
+        """
+        SELECT c.*,
+        (SELECT max(m.id) FROM messages AS m WHERE m.conversation_id = c.id) AS last_message_id,
+        s.summary, s.last_message_id AS summary_message_id
+        FROM conversations AS c
+        LEFT JOIN conversation_summaries AS s ON s.conversation_id = c.id
+        WHERE c.id = %s
+        """,
+        (body.conversation_id,)
+    )
+    # a thread sees its ancestors' history up to the branch point, then its own turns
+    history = await getThreadHistory(conversation)
+
+    if (not body.is_new_conversation):
+        # Insert user message first
+        if (body.prompt_mode == PromptMode.REPLY):
+            await db.execute("INSERT INTO messages (content, conversation_id, role, num_of_children, referred_message_id, referred_message_content) VALUES (%s, %s, %s, %s, %s, %s)", (body.user_message, body.conversation_id, "user", 0, body.extra_data["referred_message"]["id"], body.extra_data["sub_str"],))
+        else:
+            await db.execute("INSERT INTO messages (content, conversation_id, role, num_of_children) VALUES (%s, %s, %s, %s)", (body.user_message, body.conversation_id, "user", 0,))
+
+    # Prepare assistant placeholder to obtain message id
+    
+    new_message = await db.execute(
+        "INSERT INTO messages (content, conversation_id, role, num_of_children, agentic_mode, model_settings) VALUES (%s, %s, %s, %s, %s, %s) RETURNING *",
+        ("", body.conversation_id, "assistant", 0, body.agentic_mode, json.dumps(body.model_settings) if body.model_settings else None,),
+        True
+    )
     
-    return history
+    # Update num_of_children for the parent message
+    if conversation["message_id"]:
+        await db.execute(
+            "UPDATE messages SET num_of_children = num_of_children + 1 WHERE id = %s",
+            (conversation["message_id"],)
+        )
+    
+    prompt_strategy = Prompt()
+    return {
+        "message_id": new_message[0]["id"],
+        "agentic_mode": new_message[0]["agentic_mode"],
+        "model_settings": new_message[0]["model_settings"],
+        "query": prompt_strategy.prepare(query=body.user_message, history=history, mode=body.prompt_mode, extra_data=body.extra_data, model_settings=body.model_settings, branch_message_id=conversation["message_id"]),
+    }
+
+async def generateMessage(body: CreateMessageReq, message_id: int, query):
+    """Run the agent and persist its output; yields (type, delta) pairs."""
+    agent_workflows = AgentWorkflows(agentic_mode=body.agentic_mode, model_settings=body.model_settings)
+    output = {"real_content": "", "reasoning_summary": ""}
+    try:
+        result = await agent_workflows.run_streamed(query=query)
+        async for delta_type, content in stream_deltas(result):
+            if delta_type in output:
+                output[delta_type] += content
+                message_buffer.update(message_id, output["real_content"], output["reasoning_summary"] or None)
+            yield delta_type, content
+    finally:
+        # Final flush also runs when the client disconnects or the run fails mid-stream
+        await asyncio.shield(finishMessage(body.conversation_id, message_id, output["real_content"], output["reasoning_summary"] or None))
+
+async def publishedEvents(deltas):
+    async for delta_type, content in deltas:
+        yield delta_type, {"content": content}
+
+async def channelDeltas(channel: StreamChannel):
+    """(type, delta) pairs of a channel; a snapshot turns into the part not sent yet."""
+    sent = {"real_content": "", "reasoning_summary": ""}
+    async for _, event_type, data in channel.subscribe():
+        if event_type == "snapshot":
+            for delta_type, content in data.items():
+                if len(content) > len(sent[delta_type]):
+                    yield delta_type, content[len(sent[delta_type]):]
+                    sent[delta_type] = content
+        elif event_type in sent:
+            sent[event_type] += data["content"]
+            yield event_type, data["content"]
+        elif event_type == "error":
+            yield "error", data["message"]
+        else:
+            yield event_type, data["content"]
+
+async def sseStream(channel: StreamChannel, last_event_id: int = 0):
+    yield encode_sse("header", channel.header)
+    async for event_id, event_type, data in channel.subscribe(last_event_id):
+        yield encode_sse(event_type, data, event_id)
+    yield encode_sse("done", {})
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "Connection": "keep-alive", "X-Accel-Buffering": "no"}
 
 @app.post("/messages/v1/create")
 async def createMessage(body: CreateMessageReq):
-    async def generate_stream():
-        # Get conversation
-        conversation = await db.fetch_one("SELECT * from conversations WHERE id = %s", (body.conversation_id,))
-        history = []
-        # means conversation is a thread
-        if (conversation["message_id"]):
-            history = await getThreadHistory(conversation)
-        else:
-            history = await db.fetch_all("SELECT content, role from messages WHERE conversation_id = %s ORDER BY created_at ASC", (body.conversation_id,))
+    # reserved up front so concurrent requests cannot all pass the check while preparing
+    if not generation_runner.try_reserve():
+        generation_runner.rejected += 1
+        raise HTTPException(status_code=503, detail="Too many generations in progress, try again later")
+
+    try:
+        prepared = await prepareMessage(body)
+    except BaseException:
+        generation_runner.release()
+        raise
+    message_id = prepared["message_id"]
+    agentic_mode = prepared["agentic_mode"]
+    model_settings = prepared["model_settings"]
+    # generation runs as a background job; this request (and any other viewer) only subscribes to it
+    channel = stream_registry.start(
+        message_id,
+        {"message_id": message_id, "agentic_mode": agentic_mode, "model_settings": model_settings},
+        publishedEvents(generateMessage(body, message_id, prepared["query"])),
+        reserved=True,
+        # a generation dropped at shutdown before it started is finished like one that failed
+        on_discard=lambda: finishMessage(body.conversation_id, message_id, "", None)
+    )
 
-        if (not body.is_new_conversation):
-            # Insert user message first
-            if (body.prompt_mode == PromptMode.REPLY):
-                await db.execute("INSERT INTO messages (content, conversation_id, role, num_of_children, referred_message_id, referred_message_content) VALUES (%s, %s, %s, %s, %s, %s)", (body.user_message, body.conversation_id, "user", 0, body.extra_data["referred_message"]["id"], body.extra_data["sub_str"],))
-            else:
-                await db.execute("INSERT INTO messages (content, conversation_id, role, num_of_children) VALUES (%s, %s, %s, %s)", (body.user_message, body.conversation_id, "user", 0,))
+    if body.stream_format == "sse":
+        return StreamingResponse(sseStream(channel), media_type="text/event-stream", headers=SSE_HEADERS)
 
-        # Prepare assistant placeholder to obtain message id
-        
-        new_message = await db.execute(
-            "INSERT INTO messages (content, conversation_id, role, num_of_children, agentic_mode, model_settings) VALUES (%s, %s, %s, %s, %s, %s) RETURNING *",
-            ("", body.conversation_id, "assistant", 0, body.agentic_mode, json.dumps(body.model_settings) if body.model_settings else None,),
-            True
-        )
-        
-        # Update num_of_children for the parent message
-        if conversation["message_id"]:
-            await db.execute(
-                "UPDATE messages SET num_of_children = num_of_children + 1 WHERE id = %s",
-                (conversation["message_id"],)
-            )
-        
-        message_id = new_message[0]["id"]
-        agentic_mode = new_message[0]["agentic_mode"]
-        model_settings = new_message[0]["model_settings"]
-        prompt_strategy = Prompt()
-        agent_workflows = AgentWorkflows(agentic_mode=body.agentic_mode, model_settings=body.model_settings)
-        
-        query = prompt_strategy.prepare(query=body.user_message, history=history, mode=body.prompt_mode, extra_data=body.extra_data)
-        result = await agent_workflows.run_streamed(query=query)
-        
-        full_response = ""
-        full_reasoning_summary = ""
+    async def generate_stream():
         # Stream the response
-        async for event in result.stream_events():
-            common_data = {
-                "message_id": message_id,
-                "content": event.data.delta if hasattr(event, 'data') and hasattr(event.data, 'delta') else "",
-                "agentic_mode": agentic_mode,
-                "model_settings": model_settings
-            }
-
-            if event.type == "raw_response_event" and isinstance(event.data, ResponseTextDeltaEvent):
-                full_response += event.data.delta
-                common_data["type"] = "real_content"
-                yield json.dumps(common_data) + "\n"
-            elif event.type == "raw_response_event" and isinstance(event.data, ResponseReasoningSummaryTextDeltaEvent):
-                full_reasoning_summary += event.data.delta
-                common_data["type"] = "reasoning_summary"
-                yield json.dumps(common_data) + "\n"
-        # Update assistant message with full content after streaming completes
-        await db.execute("UPDATE messages SET content = %s, reasoning_summary = %s WHERE id = %s", (full_response, None if full_reasoning_summary == "" else full_reasoning_summary, message_id,))
+        if body.stream_format == "coalesced":
+            # static metadata once, then deltas merged into larger frames
+            yield encode_frame({"type": "header", **channel.header})
+            async for delta_type, content in coalesce(channelDeltas(channel), interval=STREAM_COALESCE_MS / 1000, max_bytes=STREAM_COALESCE_BYTES):
+                yield encode_frame({"type": delta_type, "content": content})
+        else:
+            async for delta_type, content in channelDeltas(channel):
+                yield encode_frame({
+                    "message_id": message_id,
+                    "content": content,
+                    "agentic_mode": agentic_mode,
+                    "model_settings": model_settings,
+                    "type": delta_type
+                })
         
     return StreamingResponse(
         generate_stream(),
@@ -241,6 +420,24 @@ async def createMessage(body: CreateMessageReq):
         headers={"Cache-Control": "no-cache", "Connection": "keep-alive"}
     )
 
+@app.get("/messages/v1/stream/{message_id}")
+async def streamMessage(message_id: int, last_event_id: int = Header(default=0)):
+    channel = stream_registry.get(message_id)
+    if channel:
+        return StreamingResponse(sseStream(channel, last_event_id), media_type="text/event-stream", headers=SSE_HEADERS)
+
+    # no generation in flight: replay the persisted message
+    message = await db.fetch_one("SELECT id, content, reasoning_summary, agentic_mode, model_settings FROM messages WHERE id = %s AND role = 'assistant'", (message_id,))
+    if not message:
+        raise HTTPException(status_code=404, detail="Message not found")
+
+    async def replay_stream():
+        yield encode_sse("header", {"message_id": message["id"], "agentic_mode": message["agentic_mode"], "model_settings": message["model_settings"]})
+        yield encode_sse("snapshot", {"real_content": message["content"], "reasoning_summary": message["reasoning_summary"] or ""})
+        yield encode_sse("done", {})
+
+    return StreamingResponse(replay_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
 @app.post("/test/treeOfThoughts")
 async def createTreeOfThoughts(body: CreateMessageReq):
     agent_workflows = AgentWorkflows(agentic_mode=AGENTIC_MODE.TREE_OF_THOUGHTS)
@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import os
+from typing import Any, Dict, Optional, Tuple
+from app.db import db
+
+logger = logging.getLogger(__name__)
+
+
+class MessageWriteBuffer:
+    """Write-behind buffer for assistant messages that are still streaming.
+
+    Streams report their accumulated content with update(); dirty messages are
+    checkpointed together in one batched UPDATE every flush_interval seconds,
+    or sooner once a message has grown by flush_bytes since its last write.
+    finalize() writes the final content and stops buffering the message.
+    """
+
+    def __init__(self, flush_interval: float, flush_bytes: int):
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        # message_id -> (content, reasoning_summary) not yet written
+        self._pending: Dict[int, Tuple[str, Optional[str]]] = {}
+        # message_id -> content length at its last write
+        self._written: Dict[int, int] = {}
+        # serializes writes so an older checkpoint never lands after a newer one
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.rows_written = 0
+        self.final_writes = 0
+        self.failures = 0
+
+    def start(self) -> None:
+        if not self._task:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def update(self, message_id: int, content: str, reasoning_summary: Optional[str] = None) -> None:
+        self._pending[message_id] = (content, reasoning_summary)
+        grown = len(content) + len(reasoning_summary or "") - self._written.get(message_id, 0)
+        if grown >= self.flush_bytes:
+            self._wakeup.set()
+
+    async def flush(self) -> None:
+        async with self._lock:
+            if not self._pending:
+                return
+
+            batch, self._pending = self._pending, {}
+            ids = list(batch.keys())
+            try:
+                await db.execute(
+                    """
+                    UPDATE messages AS m
+                    SET content = v.content, reasoning_summary = v.reasoning_summary
+                    FROM unnest(%s::integer[], %s::text[], %s::text[]) AS v(id, content, reasoning_summary)
+                    WHERE m.id = v.id
+                    """,
+                    (ids, [batch[message_id][0] for message_id in ids], [batch[message_id][1] for message_id in ids],)
+                )
+            except Exception:
+                self.failures += 1
+                logger.exception("failed to checkpoint %d streaming message(s)", len(ids))
+                for message_id, values in batch.items():
+                    self._pending.setdefault(message_id, values)
+                return
+
+            for message_id, (content, reasoning_summary) in batch.items():
+                self._written[message_id] = len(content) + len(reasoning_summary or "")
+            self.flushes += 1
+            self.rows_written += len(ids)
+
+    async def finalize(self, message_id: int, content: str, reasoning_summary: Optional[str] = None) -> None:
+        async with self._lock:
+            self._pending.pop(message_id, None)
+            self._written.pop(message_id, None)
+            await db.execute("UPDATE messages SET content = %s, reasoning_summary = %s WHERE id = %s", (content, reasoning_summary, message_id,))
+            self.final_writes += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "streaming_messages": len(self._written) + len([message_id for message_id in self._pending if message_id not in self._written]),
+            "pending": len(self._pending),
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "final_writes": self.final_writes,
+            "failures": self.failures,
+        }
+
+
+message_buffer = MessageWriteBuffer(
+    flush_interval=int(os.getenv("STREAM_FLUSH_INTERVAL_MS", "1000")) / 1000,
+    flush_bytes=int(os.getenv("STREAM_FLUSH_BYTES", "2048")),
+)
@@ -0,0 +1,141 @@
+import logging
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Set
+import litellm
+from app.utils.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "openai/gpt-4o-mini"
+# model_settings keys holding the model that receives the conversation, by preference
+MODEL_KEYS = ["model", "executioner_agent_model", "research_agent_model", "clarifying_agent_model"]
+
+
+@dataclass
+class ContextReport:
+    budget: int
+    tokens_before: int = 0
+    tokens_after: int = 0
+    dropped_messages: int = 0
+    pinned_messages: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+
+@dataclass
+class ContextStats:
+    requests: int = 0
+    trimmed_requests: int = 0
+    tokens_saved: int = 0
+    dropped_messages: int = 0
+
+    def record(self, report: ContextReport) -> None:
+        self.requests += 1
+        self.tokens_saved += report.tokens_saved
+        self.dropped_messages += report.dropped_messages
+        if report.dropped_messages:
+            self.trimmed_requests += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "trimmed_requests": self.trimmed_requests,
+            "tokens_saved": self.tokens_saved,
+            "dropped_messages": self.dropped_messages,
+        }
+
+
+context_stats = ContextStats()
+# (model, message id, content length) -> token count; message content is immutable once persisted
+_token_counts = LRUCache(max_size=int(os.getenv("CONTEXT_TOKEN_COUNT_CACHE_SIZE", "100000")))
+
+
+def resolve_model(model_settings: Dict[str, Any] | None = None) -> str:
+    for key in MODEL_KEYS:
+        if model_settings and model_settings.get(key):
+            return model_settings[key]
+    return DEFAULT_MODEL
+
+
+def resolve_budget(model: str, model_settings: Dict[str, Any] | None = None) -> int:
+    budget = int((model_settings or {}).get("context_token_budget") or os.getenv("CONTEXT_TOKEN_BUDGET", "32000"))
+    try:
+        max_input_tokens = litellm.get_model_info(model).get("max_input_tokens")
+    except Exception:
+        max_input_tokens = None
+    if max_input_tokens:
+        budget = min(budget, max_input_tokens - int(os.getenv("CONTEXT_OUTPUT_RESERVE", "4096")))
+    return budget
+
+
+class ContextWindowBuilder:
+    """Fits branch history into a token budget.
+
+    The newest keep_recent messages and pinned messages are always kept
+    verbatim; older messages are added newest first while they fit and the
+    rest are dropped.
+    """
+
+    def __init__(self, model: str, budget: int, keep_recent: int | None = None):
+        self.model = model
+        self.budget = budget
+        self.keep_recent = keep_recent if keep_recent is not None else int(os.getenv("CONTEXT_KEEP_RECENT_MESSAGES", "6"))
+
+    @classmethod
+    def from_model_settings(cls, model_settings: Dict[str, Any] | None = None):
+        model = resolve_model(model_settings)
+        return cls(model=model, budget=resolve_budget(model, model_settings))
+
+    def count_tokens(self, message: Dict[str, Any]) -> int:
+        content = message["content"] or ""
+        key = (self.model, message["id"], len(content)) if message.get("id") else None
+        if key:
+            count = _token_counts.get(key)
+            if count is not None:
+                return count
+
+        try:
+            count = litellm.token_counter(model=self.model, messages=[{"role": message["role"], "content": content}])
+        except Exception:
+            count = len(content) // 4 + 4
+
+        if key:
+            _token_counts.set(key, count)
+        return count
+
+    def build(self, history: List[Dict[str, Any]], prompt: List[Dict[str, Any]], pinned_ids: Set[int] | None = None) -> tuple[List[Dict[str, Any]], ContextReport]:
+        report = ContextReport(budget=self.budget)
+        pinned_ids = pinned_ids or set()
+        counts = [self.count_tokens(message) for message in history]
+        report.tokens_before = sum(counts)
+        remaining = self.budget - sum(self.count_tokens(message) for message in prompt)
+
+        kept: Set[int] = set()
+        recent_start = max(len(history) - self.keep_recent, 0)
+        for i, message in enumerate(history):
+            if i >= recent_start or message.get("id") in pinned_ids:
+                kept.add(i)
+                remaining -= counts[i]
+        report.pinned_messages = len([i for i in kept if i < recent_start])
+
+        for i in range(recent_start - 1, -1, -1):
+            if i in kept:
+                continue
+            if counts[i] > remaining:
+                break
+            kept.add(i)
+            remaining -= counts[i]
+
+        fitted = [{"content": message["content"], "role": message["role"]} for i, message in enumerate(history) if i in kept]
+        report.tokens_after = sum(counts[i] for i in kept)
+        report.dropped_messages = len(history) - len(kept)
+        context_stats.record(report)
+        if report.dropped_messages:
+            logger.info(
+                "context window trimmed: model=%s budget=%d tokens %d -> %d (saved %d), dropped %d message(s)",
+                self.model, self.budget, report.tokens_before, report.tokens_after, report.tokens_saved, report.dropped_messages
+            )
+        return fitted, report
@@ -1,4 +1,6 @@
+from typing import Any, Dict
 from app.prompts.interface import PromptInterface
+from app.prompts.budget import ContextReport, ContextWindowBuilder
 from app.prompts.constants import PromptMode
 from app.prompts.reply import ReplyPrompt
 from app.prompts.select import SelectPrompt
@@ -16,6 +18,7 @@ class Context:
 
 class Prompt:
     context: Context
+    report: ContextReport | None = None
 
     def __init__(self):
         self.context = Context()
@@ -28,7 +31,19 @@ class Prompt:
         else:
             self.context.set_prompt_strategy(DefaultPrompt())
 
-    def prepare(self, query: str, history, mode: PromptMode | None = None, extra_data = None):
+    def get_pinned_message_ids(self, mode: PromptMode | None = None, extra_data = None, branch_message_id: int | None = None):
+        # the message a thread branched from is what the thread is about
+        pinned = {branch_message_id} if branch_message_id else set()
+        if (mode == PromptMode.REPLY):
+            pinned.add(extra_data["referred_message"].get("id"))
+        elif (mode == PromptMode.SELECT):
+            pinned.update(message.get("id") for message in extra_data["selected_messages"])
+        return pinned
+
+    def prepare(self, query: str, history, mode: PromptMode | None = None, extra_data = None, model_settings: Dict[str, Any] | None = None, branch_message_id: int | None = None):
         self.set_prompt_strategy(mode)
 
-        return self.context.prepare(query, history, extra_data)
\ No newline at end of file
+        prompt = self.context.prepare(query, [], extra_data)
+        builder = ContextWindowBuilder.from_model_settings(model_settings)
+        history, self.report = builder.build(history or [], prompt, pinned_ids=self.get_pinned_message_ids(mode, extra_data, branch_message_id))
+        return history + prompt
\ No newline at end of file
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import os
+from typing import Any, Dict, List, Set
+from app.db import db
+from app import ancestry
+from app.agent_workflows.constants import AGENTIC_MODE
+from app.agent_workflows.index import AgentWorkflows
+
+logger = logging.getLogger(__name__)
+
+# A conversation's rolling summary covers its whole prompt history (ancestors
+# included) up to last_message_id. Messages after it are sent verbatim.
+REFRESH_EVERY = int(os.getenv("SUMMARY_REFRESH_EVERY", "10"))
+KEEP_RECENT = int(os.getenv("SUMMARY_KEEP_RECENT", "6"))
+
+_refreshing: Set[int] = set()
+_tasks: Set[asyncio.Task] = set()
+stats = {"refreshes": 0, "failures": 0, "summarized_messages": 0}
+
+
+def summary_message(summary: str) -> Dict[str, Any]:
+    return {"id": None, "role": "system", "content": f"Summary of the earlier conversation:\n{summary}"}
+
+
+async def get_branch_history(message_id: int) -> List[Dict[str, Any]]:
+    """History up to a branch point built from the parent's rolling summary.
+
+    Returns the summary followed by the parent's messages between the summary
+    cutoff and the branch point, or [] when the parent has no summary that
+    ends at or before the branch point.
+    """
+    rows = await db.fetch_all(
+        """
+        WITH s AS (
+            SELECT s.summary, b.conversation_id, sm.created_at AS summary_at, b.created_at AS branch_at
+            FROM messages AS b
+            JOIN conversation_summaries AS s ON s.conversation_id = b.conversation_id
+            JOIN messages AS sm ON sm.id = s.last_message_id
+            WHERE b.id = %s AND sm.created_at <= b.created_at
+        )
+        SELECT NULL::integer AS id, s.summary AS content, 'system' AS role, 0 AS part, NULL::timestamptz AS created_at
+        FROM s
+        UNION ALL
+        SELECT m.id, m.content, m.role, 1 AS part, m.created_at
+        FROM s
+        JOIN messages AS m ON m.conversation_id = s.conversation_id AND m.created_at > s.summary_at AND m.created_at <= s.branch_at
+        ORDER BY part, created_at
+        """,
+        (message_id,)
+    )
+    if not rows:
+        return []
+    return [summary_message(rows[0]["content"])] + [{"id": row["id"], "content": row["content"], "role": row["role"]} for row in rows[1:]]
+
+
+def format_transcript(rows: List[Dict[str, Any]]) -> str:
+    return "\n".join(f"{row['role']}: {row['content']}" for row in rows)
+
+
+async def refresh(conversation_id: int, up_to_message_id: int) -> None:
+    """Fold messages older than the KEEP_RECENT newest into the rolling summary
+    once at least REFRESH_EVERY of them are pending."""
+    conversation = await db.fetch_one(
+        """
+        SELECT c.id, c.message_id, c.ancestor_message_ids, s.summary, s.last_message_id AS summary_message_id, s.num_messages
+        FROM conversations AS c
+        LEFT JOIN conversation_summaries AS s ON s.conversation_id = c.id
+        WHERE c.id = %s
+        """,
+        (conversation_id,)
+    )
+    if not conversation:
+        return
+
+    pending = await db.fetch_all(
+        "SELECT id, content, role from messages WHERE conversation_id = %s AND id > %s AND id <= %s ORDER BY created_at ASC",
+        (conversation_id, conversation["summary_message_id"] or 0, up_to_message_id,)
+    )
+    if len(pending) < REFRESH_EVERY + KEEP_RECENT:
+        return
+    to_fold = pending[:len(pending) - KEEP_RECENT]
+
+    previous = conversation["summary"]
+    if not previous and conversation["message_id"]:
+        ancestors = await get_branch_history(conversation["message_id"]) or await ancestry.get_thread_history(conversation["ancestor_message_ids"])
+        previous = format_transcript(ancestors)
+
+    agent_workflows = AgentWorkflows(agentic_mode=AGENTIC_MODE.SUMMARY)
+    result = await agent_workflows.run(query=[{
+        "role": "user",
+        "content": (f"Current summary:\n{previous}\n\n" if previous else "")
+            + f"New messages:\n{format_transcript(to_fold)}\n\n"
+            + "Update the summary so it captures the whole conversation so far: key facts, decisions, open questions and user preferences. DO NOT answer or continue the conversation."
+    }])
+
+    await db.execute(
+        """
+        INSERT INTO conversation_summaries (conversation_id, summary, last_message_id, num_messages)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (conversation_id) DO UPDATE
+        SET summary = EXCLUDED.summary, last_message_id = EXCLUDED.last_message_id, num_messages = EXCLUDED.num_messages
+        """,
+        (conversation_id, result.final_output, to_fold[-1]["id"], (conversation["num_messages"] or 0) + len(to_fold),)
+    )
+    stats["refreshes"] += 1
+    stats["summarized_messages"] += len(to_fold)
+
+
+async def _run_refresh(conversation_id: int, up_to_message_id: int) -> None:
+    try:
+        await refresh(conversation_id, up_to_message_id)
+    except Exception:
+        stats["failures"] += 1
+        logger.exception("failed to refresh summary of conversation %s", conversation_id)
+    finally:
+        _refreshing.discard(conversation_id)
+
+
+def schedule_refresh(conversation_id: int, up_to_message_id: int) -> None:
+    """Refresh a conversation's summary in the background, at most once at a time."""
+    if REFRESH_EVERY <= 0 or conversation_id in _refreshing:
+        return
+
+    _refreshing.add(conversation_id)
+    task = asyncio.create_task(_run_refresh(conversation_id, up_to_message_id))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
@@ -0,0 +1,103 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterator, Optional, Tuple
+
+
+class LRUCache:
+    """Size-bounded LRU cache with optional per-entry TTL and hit/miss counters.
+
+    Entries weigh 1 each unless get_size is given, in which case max_size bounds
+    the summed weight instead of the entry count.
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl: Optional[float] = None,
+        get_size: Optional[Callable[[Any], int]] = None,
+        on_evict: Optional[Callable[[Hashable, Any], None]] = None,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._get_size = get_size or (lambda value: 1)
+        self._on_evict = on_evict
+        self._entries: "OrderedDict[Hashable, Tuple[Any, int, Optional[float]]]" = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.peek(key) is not None
+
+    def _is_expired(self, expires_at: Optional[float]) -> bool:
+        return expires_at is not None and expires_at <= time.monotonic()
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """Read an entry without touching recency or counters."""
+        entry = self._entries.get(key)
+        if entry is None or self._is_expired(entry[2]):
+            return default
+        return entry[0]
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        value, _, expires_at = entry
+        if self._is_expired(expires_at):
+            self.pop(key)
+            self.misses += 1
+            return default
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        if key in self._entries:
+            self.pop(key)
+
+        ttl = ttl if ttl is not None else self.ttl
+        size = self._get_size(value)
+        self._entries[key] = (value, size, time.monotonic() + ttl if ttl is not None else None)
+        self._size += size
+
+        while self._size > self.max_size and len(self._entries) > 1:
+            evicted_key, (evicted_value, evicted_size, _) = self._entries.popitem(last=False)
+            self._size -= evicted_size
+            self.evictions += 1
+            if self._on_evict:
+                self._on_evict(evicted_key, evicted_value)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return default
+        self._size -= entry[1]
+        return entry[0]
+
+    def items(self) -> Iterator[Tuple[Hashable, Any]]:
+        """Snapshot of live entries, least recently used first."""
+        return iter([(key, value) for key, (value, _, expires_at) in self._entries.items() if not self._is_expired(expires_at)])
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._size = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "size": self._size,
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
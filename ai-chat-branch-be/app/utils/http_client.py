@@ -0,0 +1,73 @@
+import importlib.util
+import logging
+import os
+from collections import Counter
+from typing import Any, Dict, Optional
+import httpx
+import litellm
+from agents import set_default_openai_client
+from openai import AsyncOpenAI
+from app.utils.model import PROVIDERS, get_provider_setting
+
+logger = logging.getLogger(__name__)
+
+# HTTP/2 needs the optional h2 package (httpx[http2]), which is not a default dependency
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class LLMHttpClient:
+    """Process-wide HTTP client for model provider calls.
+
+    Every provider in PROVIDERS gets its own mounted transport, so each has a
+    separate keep-alive pool and connection limit and one busy provider cannot
+    starve another. LiteLLM (litellm.aclient_session) and the Agents SDK's
+    default OpenAI client both send their requests through it.
+    """
+
+    def __init__(self):
+        http2 = os.getenv("LLM_HTTP2", "false").lower() == "true"
+        if http2 and not HTTP2_AVAILABLE:
+            logger.warning("LLM_HTTP2 is set but the h2 package is not installed, using HTTP/1.1")
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self.client: Optional[httpx.AsyncClient] = None
+        self.requests: Counter = Counter()
+
+    def _transport(self, provider: Optional[str] = None) -> httpx.AsyncHTTPTransport:
+        return httpx.AsyncHTTPTransport(
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=int(get_provider_setting(provider, "HTTP_MAX_CONNECTIONS", "100")),
+                max_keepalive_connections=int(get_provider_setting(provider, "HTTP_MAX_KEEPALIVE", "20")),
+                keepalive_expiry=float(get_provider_setting(provider, "HTTP_KEEPALIVE_EXPIRY", "60")),
+            ),
+        )
+
+    async def _count(self, request: httpx.Request) -> None:
+        self.requests[request.url.host] += 1
+
+    def start(self) -> None:
+        if self.client:
+            return
+
+        self.client = httpx.AsyncClient(
+            transport=self._transport(),
+            mounts={provider["base_url"]: self._transport(name) for name, provider in PROVIDERS.items()},
+            timeout=httpx.Timeout(float(os.getenv("LLM_HTTP_TIMEOUT", "600")), connect=10.0),
+            event_hooks={"request": [self._count]},
+        )
+        litellm.aclient_session = self.client
+        if os.getenv("OPENAI_API_KEY"):
+            set_default_openai_client(AsyncOpenAI(http_client=self.client), use_for_tracing=False)
+
+    async def stop(self) -> None:
+        if self.client:
+            if litellm.aclient_session is self.client:
+                litellm.aclient_session = None
+            await self.client.aclose()
+            self.client = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"http2": self.http2, "requests": dict(self.requests)}
+
+
+llm_http_client = LLMHttpClient()
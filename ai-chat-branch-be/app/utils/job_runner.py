@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Coroutine, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class JobRunner:
+    """Runs background jobs with at most max_concurrency at a time.
+
+    Jobs beyond that wait in a FIFO queue of up to max_queue entries. Callers
+    reserve a place with try_reserve() before doing work they would have to
+    throw away, then either submit the job with reserved=True or release().
+    A job dropped by stop() before it started never runs; its on_discard
+    callback runs instead so the caller can clean up after it.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._tasks: Set[asyncio.Task] = set()
+        self.queued = 0
+        self.running = 0
+        self.reserved = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.discarded = 0
+        self._wait_ms_total = 0.0
+        self._wait_ms_max = 0.0
+
+    def try_reserve(self) -> bool:
+        """Hold a place for a job about to be submitted; False when the runner is full."""
+        if self.running + self.queued + self.reserved >= self.max_concurrency + self.max_queue:
+            return False
+        self.reserved += 1
+        return True
+
+    def release(self) -> None:
+        """Give back a reservation that will not be submitted."""
+        self.reserved -= 1
+
+    def submit(self, job: Coroutine[Any, Any, Any], reserved: bool = False, on_discard: Optional[Callable[[], Awaitable[None]]] = None) -> asyncio.Task:
+        if reserved:
+            self.reserved -= 1
+        self.submitted += 1
+        self.queued += 1
+        task = asyncio.create_task(self._run(job, time.perf_counter(), on_discard))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _run(self, job: Coroutine[Any, Any, Any], enqueued_at: float, on_discard: Optional[Callable[[], Awaitable[None]]]) -> None:
+        started = False
+        try:
+            async with self._semaphore:
+                started = True
+                self.queued -= 1
+                wait_ms = (time.perf_counter() - enqueued_at) * 1000
+                self._wait_ms_total += wait_ms
+                self._wait_ms_max = max(self._wait_ms_max, wait_ms)
+                self.running += 1
+                try:
+                    await job
+                    self.completed += 1
+                except Exception:
+                    self.failed += 1
+                    logger.exception("background job failed")
+                finally:
+                    self.running -= 1
+        finally:
+            if not started:
+                # cancelled while still queued
+                self.queued -= 1
+                self.discarded += 1
+                job.close()
+                if on_discard is not None:
+                    try:
+                        await on_discard()
+                    except Exception:
+                        logger.exception("failed to clean up a discarded background job")
+
+    async def stop(self) -> None:
+        """Cancel queued and running jobs and wait for them to unwind."""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        started = self.submitted - self.queued
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "running": self.running,
+            "queue_depth": self.queued,
+            "reserved": self.reserved,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "discarded": self.discarded,
+            "wait_avg_ms": self._wait_ms_total / started if started else 0.0,
+            "wait_max_ms": self._wait_ms_max,
+        }
@@ -1,14 +1,88 @@
-from typing import List
+import asyncio
+from functools import partial
+from typing import Any, Dict, List, Optional, Tuple
 import os
+from agents.extensions.models.litellm_model import LitellmModel
+import litellm
+from app.utils.cache import LRUCache
+from app.utils.scheduler import LLMScheduler, Priority
 
-def get_model_api_key(model: str):
+# LitellmModel holds no per-request state, so one instance per model name (and priority) is shared
+_models = LRUCache(max_size=int(os.getenv("MODEL_CACHE_SIZE", "64")))
+
+# model name prefix -> provider endpoint and the env var holding its key
+PROVIDERS: Dict[str, Dict[str, str]] = {
+    "deepseek": {"base_url": "https://api.deepseek.com", "api_key_env": "DEEPSEEK_API_KEY"},
+    "openai": {"base_url": "https://api.openai.com", "api_key_env": "OPENAI_API_KEY"},
+}
+
+def get_model_provider(model: str):
     modelParts: List[str] = model.split("/")
     prefix = modelParts[0]
+    return prefix if prefix in PROVIDERS else None
+
+def get_model_api_key(model: str):
+    provider = get_model_provider(model)
+    if (provider is None):
+        return None
+
+    return os.getenv(PROVIDERS[provider]["api_key_env"])
+
+def get_provider_setting(provider: Optional[str], name: str, default: str) -> str:
+    """<PROVIDER>_<NAME> when set, otherwise the LLM_<NAME> default."""
+    value = os.getenv(f"LLM_{name}", default)
+    return os.getenv(f"{provider.upper()}_{name}", value) if provider else value
+
+def get_provider_limits(provider: str) -> Tuple[int, float]:
+    return (
+        int(get_provider_setting(provider, "MAX_CONCURRENCY", "16")),
+        float(get_provider_setting(provider, "REQUESTS_PER_MINUTE", "0")),
+    )
+
+llm_scheduler = LLMScheduler(
+    get_limits=get_provider_limits,
+    max_retries=int(os.getenv("LLM_RATE_LIMIT_RETRIES", "3")),
+    retry_base_delay=float(os.getenv("LLM_RETRY_BASE_DELAY", "1")),
+    is_rate_limit=lambda error: isinstance(error, litellm.RateLimitError),
+)
+
+class ScheduledLitellmModel(LitellmModel):
+    """LitellmModel whose calls go through the provider's llm_scheduler limiter."""
+
+    def __init__(self, model: str, api_key: str | None = None, priority: Priority = Priority.INTERACTIVE):
+        super().__init__(model=model, api_key=api_key)
+        self.provider = get_model_provider(model) if model else None
+        self.priority = priority
+
+    async def get_response(self, *args, **kwargs):
+        return await llm_scheduler.run(self.provider, self.priority, partial(super().get_response, *args, **kwargs))
+
+    async def stream_response(self, *args, **kwargs):
+        attempt = 0
+        while True:
+            started = False
+            try:
+                async with llm_scheduler.slot(self.provider, self.priority):
+                    async for event in super().stream_response(*args, **kwargs):
+                        started = True
+                        yield event
+                return
+            except Exception as error:
+                # only retry before anything was streamed
+                delay = None if started else llm_scheduler.retry_delay(self.provider, error, attempt)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+            attempt += 1
+
+def get_model(model_settings: Dict[str, Any] | None = None, key: str = "model", default: str = "openai/gpt-4o-mini", priority: Priority = Priority.INTERACTIVE) -> LitellmModel:
+    """Shared model for model_settings[key], or for default when no settings are given."""
+    model = model_settings[key] if model_settings else default
+    instance = _models.get((model, priority))
+    if instance is None:
+        instance = ScheduledLitellmModel(model=model, api_key=get_model_api_key(model), priority=priority)
+        _models.set((model, priority), instance)
+    return instance
 
-    if (prefix == "deepseek"):
-        return os.getenv("DEEPSEEK_API_KEY")
-    
-    if (prefix == "openai"):
-        return os.getenv("OPENAI_API_KEY")
-    
-    return None
\ No newline at end of file
+def model_cache_stats() -> Dict[str, Any]:
+    return _models.stats()
@@ -0,0 +1,98 @@
+import hashlib
+import json
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+from agents import Agent, Runner
+from pydantic import BaseModel
+from app.utils.tiered_cache import TieredCache
+
+
+@dataclass
+class CachedRunResult:
+    """Stand-in for a RunResult served from the cache; callers only read final_output."""
+    final_output: Any
+    cached: bool = True
+
+
+class ResponseCache:
+    """Exact-match cache of non-streamed agent runs.
+
+    Agents opt in by being run through run() instead of Runner.run(). The key
+    covers everything that shapes the answer: model, instructions, model
+    settings, tools, output schema and input. Entries live in a TieredCache,
+    optionally persisted in the llm_response_cache table.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, persist: bool, purge_interval: float):
+        self._cache = TieredCache(
+            table="llm_response_cache",
+            value_column="output",
+            value_type="jsonb",
+            max_size=max_entries,
+            ttl=ttl,
+            persist=persist,
+            purge_interval=purge_interval,
+        )
+        self.bypassed = 0
+
+    def cache_key(self, agent: Agent, input: str | List[dict]) -> Optional[str]:
+        if not isinstance(agent.instructions, (str, type(None))):
+            # dynamic instructions are not part of the key
+            return None
+
+        output_type = agent.output_type
+        model = agent.model if isinstance(agent.model, (str, type(None))) else getattr(agent.model, "model", None)
+        parts = {
+            "model": model,
+            "instructions": agent.instructions,
+            "model_settings": agent.model_settings.to_json_dict(),
+            "tools": sorted(tool.name for tool in agent.tools),
+            "output_type": output_type.model_json_schema() if isinstance(output_type, type) and issubclass(output_type, BaseModel) else repr(output_type),
+            "input": input,
+        }
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _dump(self, output: Any) -> Any:
+        return output.model_dump() if isinstance(output, BaseModel) else output
+
+    def _load(self, agent: Agent, data: Any) -> Any:
+        output_type = agent.output_type
+        if isinstance(output_type, type) and issubclass(output_type, BaseModel):
+            return output_type.model_validate(data)
+        return data
+
+    async def run(self, agent: Agent, input: str | List[dict]):
+        """Runner.run(agent, input), served from the cache when possible."""
+        key = self.cache_key(agent, input)
+        if key is None:
+            self.bypassed += 1
+            return await Runner.run(agent, input)
+
+        # the caller that runs the agent gets the real RunResult, e.g. for its usage
+        ran = None
+
+        async def load() -> CachedRunResult:
+            nonlocal ran
+            ran = await Runner.run(agent, input)
+            return CachedRunResult(final_output=ran.final_output)
+
+        cached = await self._cache.get(
+            key,
+            load,
+            encode=lambda result: json.dumps(self._dump(result.final_output)),
+            decode=lambda output: CachedRunResult(final_output=self._load(agent, output)),
+            columns={"agent_name": agent.name},
+        )
+        return ran if ran is not None else cached
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._cache.stats(), "bypassed": self.bypassed}
+
+
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000")),
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "86400")),
+    persist=os.getenv("RESPONSE_CACHE_PERSIST", "false").lower() == "true",
+    purge_interval=float(os.getenv("RESPONSE_CACHE_PURGE_INTERVAL_SECONDS", "3600")),
+)
@@ -0,0 +1,195 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """Lower values are served first when a provider is saturated."""
+    INTERACTIVE = 0
+    BACKGROUND = 10
+
+
+class ProviderLimiter:
+    """Concurrency limit plus token bucket for the calls to one provider.
+
+    A call starts once a concurrency slot is free and the bucket holds a
+    token (requests_per_minute <= 0 disables the bucket). Waiting calls are
+    released in priority order, FIFO within a priority.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, requests_per_minute: float):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.rate = requests_per_minute / 60
+        # allow a burst of one second's worth of requests
+        self.capacity = max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.in_flight = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.started = 0
+        self.waited = 0
+        self.rate_limited = 0
+        self._wait_ms_max = 0.0
+
+    def _ready_in(self) -> float:
+        """Seconds until the bucket (and any 429 back-off) allows another call."""
+        now = time.monotonic()
+        if self.rate > 0:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+        delay = max(self.paused_until - now, 0.0)
+        if self.rate > 0 and self.tokens < 1:
+            delay = max(delay, (1 - self.tokens) / self.rate)
+        return delay
+
+    def _try_take(self) -> bool:
+        if self.in_flight >= self.max_concurrency:
+            return False
+        delay = self._ready_in()
+        if delay > 0:
+            if self._timer is None:
+                self._timer = asyncio.get_running_loop().call_later(delay, self._on_timer)
+            return False
+        if self.rate > 0:
+            self.tokens -= 1
+        self.in_flight += 1
+        self.started += 1
+        return True
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self._waiters:
+            future = self._waiters[0][2]
+            if future.done():
+                # its caller was cancelled while waiting
+                heapq.heappop(self._waiters)
+                continue
+            if not self._try_take():
+                return
+            heapq.heappop(self._waiters)
+            future.set_result(None)
+
+    async def acquire(self, priority: int) -> None:
+        if not self._waiters and self._try_take():
+            return
+
+        self.waited += 1
+        queued_at = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # granted a slot right as the caller was cancelled
+                self.release()
+            raise
+        self._wait_ms_max = max(self._wait_ms_max, (time.perf_counter() - queued_at) * 1000)
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._dispatch()
+
+    def back_off(self, delay: float) -> None:
+        """Hold back every call to this provider after it answered 429."""
+        self.rate_limited += 1
+        self.paused_until = max(self.paused_until, time.monotonic() + delay)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "requests_per_minute": self.rate * 60,
+            "in_flight": self.in_flight,
+            "queue_depth": len([waiter for waiter in self._waiters if not waiter[2].done()]),
+            "started": self.started,
+            "waited": self.waited,
+            "wait_max_ms": self._wait_ms_max,
+            "rate_limited": self.rate_limited,
+        }
+
+
+class LLMScheduler:
+    """Per-provider limiters shared by every model call of the process.
+
+    get_limits(provider) returns (max_concurrency, requests_per_minute) for a
+    provider the first time it is used. Calls rejected with a rate limit
+    error are retried up to max_retries times after an exponential, jittered
+    delay (or the provider's Retry-After), during which the whole provider
+    backs off.
+    """
+
+    def __init__(self, get_limits: Callable[[str], Tuple[int, float]], max_retries: int, retry_base_delay: float, is_rate_limit: Callable[[BaseException], bool]):
+        self.get_limits = get_limits
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.is_rate_limit = is_rate_limit
+        self._limiters: Dict[str, ProviderLimiter] = {}
+        self.retries = 0
+
+    def limiter(self, provider: Optional[str]) -> ProviderLimiter:
+        name = provider or "default"
+        if name not in self._limiters:
+            max_concurrency, requests_per_minute = self.get_limits(name)
+            self._limiters[name] = ProviderLimiter(name, max_concurrency, requests_per_minute)
+        return self._limiters[name]
+
+    @asynccontextmanager
+    async def slot(self, provider: Optional[str], priority: int):
+        limiter = self.limiter(provider)
+        await limiter.acquire(priority)
+        try:
+            yield
+        finally:
+            limiter.release()
+
+    def retry_delay(self, provider: Optional[str], error: BaseException, attempt: int) -> Optional[float]:
+        """Seconds to wait before retrying a failed call, or None to give up."""
+        if attempt >= self.max_retries or not self.is_rate_limit(error):
+            return None
+
+        retry_after = None
+        response = getattr(error, "response", None)
+        if response is not None:
+            try:
+                retry_after = float(response.headers.get("retry-after"))
+            except (AttributeError, TypeError, ValueError):
+                pass
+        delay = retry_after if retry_after is not None else self.retry_base_delay * 2 ** attempt * random.uniform(0.5, 1.5)
+        self.limiter(provider).back_off(delay)
+        self.retries += 1
+        logger.warning("%s rate limited, retrying in %.1fs (attempt %d)", provider, delay, attempt + 1)
+        return delay
+
+    async def run(self, provider: Optional[str], priority: int, call: Callable[[], Awaitable[Any]]) -> Any:
+        attempt = 0
+        while True:
+            try:
+                async with self.slot(provider, priority):
+                    return await call()
+            except Exception as error:
+                delay = self.retry_delay(provider, error, attempt)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "retries": self.retries,
+            "providers": {name: limiter.stats() for name, limiter in self._limiters.items()},
+        }
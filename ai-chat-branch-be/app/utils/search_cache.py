@@ -0,0 +1,64 @@
+import hashlib
+import os
+import re
+from typing import Any, Awaitable, Callable, Dict, Optional
+from app.utils.text import normalize
+from app.utils.tiered_cache import TieredCache
+
+# Queries whose answer changes from day to day are always searched live
+DATE_SENSITIVE = re.compile(
+    r"\b(today|tonight|tomorrow|yesterday|now|currently|current|latest|recent|recently|breaking|news|"
+    r"this (week|month|year)|live|score|scores|weather|forecast|price|prices|stock|stocks)\b"
+)
+
+
+class SearchCache:
+    """Cache of web search results keyed by the normalized query.
+
+    Results live in a TieredCache bounded by their total characters and
+    optionally persisted in the web_search_cache table. Date-sensitive queries
+    bypass the cache.
+    """
+
+    def __init__(self, max_chars: int, ttl: float, persist: bool, purge_interval: float):
+        self._cache = TieredCache(
+            table="web_search_cache",
+            value_column="result",
+            value_type="text",
+            max_size=max_chars,
+            ttl=ttl,
+            persist=persist,
+            purge_interval=purge_interval,
+            get_size=len,
+        )
+        self.bypassed = 0
+
+    def cache_key(self, query: str) -> Optional[str]:
+        text = normalize(query)
+        if not text or DATE_SENSITIVE.search(text):
+            return None
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    async def search(self, query: str, run: Callable[[str], Awaitable[str]]) -> str:
+        """run(query), served from the cache when possible."""
+        key = self.cache_key(query)
+        if key is None:
+            self.bypassed += 1
+            return await run(query)
+
+        async def load() -> Optional[str]:
+            # empty results are not cached
+            return await run(query) or None
+
+        return await self._cache.get(key, load, columns={"query": query}) or ""
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._cache.stats(), "bypassed": self.bypassed}
+
+
+web_search_cache = SearchCache(
+    max_chars=int(os.getenv("WEB_SEARCH_CACHE_MAX_CHARS", "20000000")),
+    ttl=float(os.getenv("WEB_SEARCH_CACHE_TTL_SECONDS", "21600")),
+    persist=os.getenv("WEB_SEARCH_CACHE_PERSIST", "false").lower() == "true",
+    purge_interval=float(os.getenv("WEB_SEARCH_CACHE_PURGE_INTERVAL_SECONDS", "3600")),
+)
@@ -0,0 +1,92 @@
+import asyncio
+import json
+from typing import Any, AsyncIterator, Tuple
+from openai.types.responses import ResponseReasoningSummaryTextDeltaEvent, ResponseTextDeltaEvent
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(data: Any) -> str:
+    if orjson:
+        return orjson.dumps(data).decode()
+    return json.dumps(data)
+
+
+def encode_frame(data: Any) -> str:
+    return dumps(data) + "\n"
+
+
+def encode_sse(event_type: str, data: Any, event_id: int | None = None) -> str:
+    frame = f"id: {event_id}\n" if event_id is not None else ""
+    return frame + f"event: {event_type}\ndata: {dumps(data)}\n\n"
+
+
+async def stream_deltas(result) -> AsyncIterator[Tuple[str, Any]]:
+    """(type, delta) pairs of the text and reasoning summary a streamed run produces.
+
+    Tree-of-Thoughts progress is passed through as ("tot_progress", dict) pairs.
+    """
+    async for event in result.stream_events():
+        if event.type == "raw_response_event" and isinstance(event.data, ResponseTextDeltaEvent):
+            yield "real_content", event.data.delta
+        elif event.type == "raw_response_event" and isinstance(event.data, ResponseReasoningSummaryTextDeltaEvent):
+            yield "reasoning_summary", event.data.delta
+        elif event.type == "tot_progress_event":
+            yield "tot_progress", {"event": event.name, **event.data}
+
+
+async def coalesce(deltas: AsyncIterator[Tuple[str, Any]], interval: float, max_bytes: int) -> AsyncIterator[Tuple[str, Any]]:
+    """Merge consecutive text deltas of the same type.
+
+    A merged delta is emitted once it reaches max_bytes, interval seconds after
+    its first piece arrived, or when the delta type changes. Non-text deltas
+    are passed through as they are.
+    """
+    loop = asyncio.get_running_loop()
+    iterator = deltas.__aiter__()
+    next_delta = None
+    buffer_type, buffer, size, deadline = None, [], 0, 0.0
+    try:
+        while True:
+            if next_delta is None:
+                next_delta = asyncio.ensure_future(iterator.__anext__())
+            done, _ = await asyncio.wait({next_delta}, timeout=max(deadline - loop.time(), 0) if buffer else None)
+            if not done:
+                yield buffer_type, "".join(buffer)
+                buffer, size = [], 0
+                continue
+
+            try:
+                delta_type, content = next_delta.result()
+            except StopAsyncIteration:
+                break
+            finally:
+                next_delta = None
+
+            if buffer and (delta_type != buffer_type or not isinstance(content, str)):
+                yield buffer_type, "".join(buffer)
+                buffer, size = [], 0
+            if not isinstance(content, str):
+                yield delta_type, content
+                continue
+            if not buffer:
+                buffer_type, deadline = delta_type, loop.time() + interval
+            buffer.append(content)
+            size += len(content.encode())
+            if size >= max_bytes:
+                yield buffer_type, "".join(buffer)
+                buffer, size = [], 0
+    finally:
+        if next_delta is not None:
+            next_delta.cancel()
+            await asyncio.wait({next_delta})
+        # close the source too, so its own cleanup runs when the consumer stops early
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+    if buffer:
+        yield buffer_type, "".join(buffer)
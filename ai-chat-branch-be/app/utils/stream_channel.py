@@ -0,0 +1,135 @@
+import asyncio
+import itertools
+import logging
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional, Tuple
+from app.utils.job_runner import JobRunner
+
+logger = logging.getLogger(__name__)
+
+# (event id, event type, data)
+StreamEvent = Tuple[int, str, Dict[str, Any]]
+
+
+class StreamChannel:
+    """Ring buffer of the events of one in-flight generation.
+
+    Events get increasing ids so a subscriber can resume after the last id it
+    saw. A subscriber that fell further behind than the buffer reaches gets a
+    single "snapshot" event with the content accumulated so far instead.
+    """
+
+    def __init__(self, message_id: int, header: Dict[str, Any], capacity: int):
+        self.message_id = message_id
+        self.header = header
+        self._events: Deque[StreamEvent] = deque(maxlen=capacity)
+        self._last_id = 0
+        self._content = {"real_content": "", "reasoning_summary": ""}
+        self._changed = asyncio.Event()
+        self.done = False
+
+    def publish(self, event_type: str, data: Dict[str, Any]) -> int:
+        self._last_id += 1
+        self._events.append((self._last_id, event_type, data))
+        if event_type in self._content:
+            self._content[event_type] += data["content"]
+        self._notify()
+        return self._last_id
+
+    def close(self) -> None:
+        self.done = True
+        self._notify()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def snapshot(self) -> StreamEvent:
+        return (self._last_id, "snapshot", dict(self._content))
+
+    async def subscribe(self, last_event_id: int = 0) -> AsyncIterator[StreamEvent]:
+        while True:
+            changed = self._changed
+            if self._events and last_event_id < self._events[0][0] - 1:
+                event = self.snapshot()
+                last_event_id = event[0]
+                yield event
+                continue
+
+            first_id = self._events[0][0] if self._events else self._last_id + 1
+            pending = list(itertools.islice(self._events, max(last_event_id + 1 - first_id, 0), None))
+            for event in pending:
+                last_event_id = event[0]
+                yield event
+
+            if self.done and last_event_id >= self._last_id:
+                return
+            if not pending:
+                await changed.wait()
+
+
+class StreamRegistry:
+    """In-flight generations by message id.
+
+    A generation runs as a job of the runner and publishes into its channel,
+    so it outlives the request that started it and any number of viewers can
+    subscribe. Finished channels linger for a while so late reconnects still
+    replay from memory.
+    """
+
+    def __init__(self, capacity: int, linger: float, runner: JobRunner):
+        self.capacity = capacity
+        self.linger = linger
+        self.runner = runner
+        self._channels: Dict[int, StreamChannel] = {}
+
+    def get(self, message_id: int) -> Optional[StreamChannel]:
+        return self._channels.get(message_id)
+
+    def start(
+        self,
+        message_id: int,
+        header: Dict[str, Any],
+        events: AsyncIterator[Tuple[str, Dict[str, Any]]],
+        reserved: bool = False,
+        on_discard: Optional[Callable[[], Awaitable[None]]] = None,
+    ) -> StreamChannel:
+        """Publish events into a new channel as a job of the runner; reserved is passed on to submit().
+
+        If the runner stops before the job starts, events is never iterated:
+        on_discard runs instead and the channel ends with an error event.
+        """
+        channel = StreamChannel(message_id, header, self.capacity)
+        self._channels[message_id] = channel
+        self.runner.submit(self._publish(channel, events), reserved=reserved, on_discard=lambda: self._discard(channel, on_discard))
+        return channel
+
+    async def _publish(self, channel: StreamChannel, events: AsyncIterator[Tuple[str, Dict[str, Any]]]) -> None:
+        try:
+            async for event_type, data in events:
+                channel.publish(event_type, data)
+        except Exception:
+            logger.exception("generation of message %s failed", channel.message_id)
+            channel.publish("error", {"message": "Generation failed"})
+        finally:
+            channel.close()
+            asyncio.get_running_loop().call_later(self.linger, self._remove, channel)
+
+    async def _discard(self, channel: StreamChannel, on_discard: Optional[Callable[[], Awaitable[None]]]) -> None:
+        try:
+            if on_discard is not None:
+                await on_discard()
+        finally:
+            channel.publish("error", {"message": "Generation cancelled"})
+            channel.close()
+            asyncio.get_running_loop().call_later(self.linger, self._remove, channel)
+
+    def _remove(self, channel: StreamChannel) -> None:
+        if self._channels.get(channel.message_id) is channel:
+            del self._channels[channel.message_id]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "channels": len(self._channels),
+            "in_flight": len([channel for channel in self._channels.values() if not channel.done]),
+        }
@@ -0,0 +1,16 @@
+import re
+
+_non_word = re.compile(r"[^\w\s]+")
+
+
+def normalize(text: str) -> str:
+    """Lowercase text without punctuation and with single spaces, for comparing near-identical strings."""
+    return " ".join(_non_word.sub(" ", text.lower()).split())
+
+
+def jaccard(a: str, b: str) -> float:
+    """Jaccard similarity of the word sets of two texts."""
+    words_a, words_b = set(normalize(a).split()), set(normalize(b).split())
+    if not words_a or not words_b:
+        return 0.0
+    return len(words_a & words_b) / len(words_a | words_b)
@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+from app.db import db
+from app.utils.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+def _identity(value: Any) -> Any:
+    return value
+
+
+class TieredCache:
+    """In-process LRU in front of an optional Postgres table, with single-flight loads.
+
+    get() returns the cached value of a key or loads it; concurrent gets of a
+    key that is being loaded wait for that load instead of starting another.
+    When persist is set, entries are also kept in table, which has a key,
+    a value_column of value_type, an expires_at and any extra columns given
+    to get(), so they survive restarts and are shared between processes.
+    Expired rows are deleted by the writes, at most once per purge_interval.
+    """
+
+    def __init__(
+        self,
+        table: str,
+        value_column: str,
+        value_type: str,
+        max_size: int,
+        ttl: float,
+        persist: bool,
+        purge_interval: float,
+        get_size: Optional[Callable[[Any], int]] = None,
+    ):
+        self.table = table
+        self.value_column = value_column
+        self.value_type = value_type
+        self.ttl = ttl
+        self.persist = persist
+        self.purge_interval = purge_interval
+        self._entries = LRUCache(max_size=max_size, ttl=ttl, get_size=get_size)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._purged_at = time.monotonic()
+        self.db_hits = 0
+        self.joined = 0
+        self.failures = 0
+        self.purged = 0
+
+    async def _fetch(self, key: str) -> Optional[Any]:
+        try:
+            row = await db.fetch_one(f"SELECT {self.value_column} AS value FROM {self.table} WHERE key = %s AND expires_at > NOW()", (key,))
+        except Exception:
+            self.failures += 1
+            logger.exception("failed to read from %s", self.table)
+            return None
+        if not row:
+            return None
+        self.db_hits += 1
+        return row["value"]
+
+    async def _store(self, key: str, value: Any, columns: Dict[str, Any]) -> None:
+        names = [self.value_column, *columns]
+        try:
+            await db.execute(
+                f"""
+                INSERT INTO {self.table} (key, {", ".join(names)}, expires_at)
+                VALUES (%s, %s::{self.value_type}{", %s" * len(columns)}, NOW() + make_interval(secs => %s))
+                ON CONFLICT (key) DO UPDATE
+                SET {self.value_column} = EXCLUDED.{self.value_column}, expires_at = EXCLUDED.expires_at
+                """,
+                (key, value, *columns.values(), self.ttl,)
+            )
+        except Exception:
+            self.failures += 1
+            logger.exception("failed to write to %s", self.table)
+        await self._purge()
+
+    async def _purge(self) -> None:
+        if time.monotonic() - self._purged_at < self.purge_interval:
+            return
+        self._purged_at = time.monotonic()
+        try:
+            row = await db.fetch_one(f"WITH expired AS (DELETE FROM {self.table} WHERE expires_at <= NOW() RETURNING 1) SELECT count(*) AS count FROM expired")
+        except Exception:
+            self.failures += 1
+            logger.exception("failed to purge expired rows of %s", self.table)
+            return
+        self.purged += row["count"]
+
+    async def get(
+        self,
+        key: str,
+        load: Callable[[], Awaitable[Any]],
+        encode: Callable[[Any], Any] = _identity,
+        decode: Callable[[Any], Any] = _identity,
+        columns: Optional[Dict[str, Any]] = None,
+    ) -> Any:
+        """Cached value of key, else the value of load(); None values are not cached.
+
+        encode and decode convert between a value and its value_column; columns
+        fills the table's extra columns when the value is stored.
+        """
+        cached = self._entries.get(key)
+        if cached is not None:
+            return cached
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.joined += 1
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+                # the load we joined was cancelled, not us
+                return await self.get(key, load, encode, decode, columns)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            stored = await self._fetch(key) if self.persist else None
+            if stored is not None:
+                value = decode(stored)
+            else:
+                value = await load()
+                if self.persist and value is not None:
+                    await self._store(key, encode(value), columns or {})
+            if value is not None:
+                self._entries.set(key, value)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as error:
+            future.set_exception(error)
+            # waiters see the error; nobody else has to retrieve it
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._entries.stats(),
+            "db_hits": self.db_hits,
+            "joined": self.joined,
+            "failures": self.failures,
+            "purged": self.purged,
+        }
@@ -0,0 +1,101 @@
+"""Conversation path and thread history lookups on threads 1 to 50 levels deep.
+
+Builds a synthetic chain of threads, each branched from the last message of
+its parent, and compares the per-level walk the path lookup used to do with
+the materialized ancestry of app.ancestry. The chain is deleted afterwards.
+
+    uv run python -m benchmarks.ancestry_depth --depths 1 5 10 25 50
+"""
+import argparse
+import asyncio
+import json
+from typing import Any, Dict, List
+from app import ancestry
+from app.db import db
+from benchmarks.common import print_table, summarize, timed
+
+
+async def walk_path(conversation_id: int) -> List[Dict[str, Any]]:
+    """The lookup before the stored ancestry: two queries per level of nesting."""
+    conversation = await db.fetch_one("SELECT id, name, message_id FROM conversations WHERE id = %s", (conversation_id,))
+    path = [conversation]
+    while conversation["message_id"]:
+        message = await db.fetch_one("SELECT id, conversation_id FROM messages WHERE id = %s", (conversation["message_id"],))
+        conversation = await db.fetch_one("SELECT id, name, message_id FROM conversations WHERE id = %s", (message["conversation_id"],))
+        path.append(conversation)
+    return path
+
+
+async def build_chain(depth: int, messages_per_level: int) -> List[Dict[str, Any]]:
+    """Conversations of a chain depth levels deep, root first."""
+    chain = [await ancestry.create_conversation(name="bench root")]
+    for level in range(depth):
+        rows = await db.execute(
+            "INSERT INTO messages (content, conversation_id, role) SELECT 'message ' || n, %s, 'user' FROM generate_series(1, %s) AS n RETURNING id",
+            (chain[-1]["id"], messages_per_level,),
+            True
+        )
+        chain.append(await ancestry.create_conversation(name=f"bench level {level + 1}", message_id=rows[-1]["id"]))
+    return chain
+
+
+async def explain(query: str, params: tuple) -> Dict[str, Any]:
+    row = await db.fetch_one("EXPLAIN (ANALYZE, FORMAT JSON) " + query, params)
+    plan = row["QUERY PLAN"]
+    plan = (json.loads(plan) if isinstance(plan, str) else plan)[0]
+    nodes, stack = [], [plan["Plan"]]
+    while stack:
+        node = stack.pop()
+        nodes.append(node["Node Type"] + (f" on {node['Relation Name']}" if "Relation Name" in node else ""))
+        stack.extend(node.get("Plans", []))
+    return {"execution_ms": plan["Execution Time"], "nodes": nodes}
+
+
+async def run(depths: List[int], repeat: int, messages_per_level: int) -> None:
+    await db.connect()
+    chain: List[Dict[str, Any]] = []
+    try:
+        chain = await build_chain(max(depths), messages_per_level)
+        results = []
+        for depth in depths:
+            conversation = chain[depth]
+            walk_ms: List[float] = []
+            path_ms: List[float] = []
+            history_ms: List[float] = []
+            for _ in range(repeat):
+                with timed(walk_ms):
+                    walked = await walk_path(conversation["id"])
+                with timed(path_ms):
+                    path = await ancestry.get_conversation_path(conversation["id"])
+                with timed(history_ms):
+                    history = await ancestry.get_thread_history(conversation["ancestor_message_ids"])
+            assert [row["id"] for row in walked] == [row["id"] for row in path]
+            results.append({
+                "depth": depth,
+                "walk_p50_ms": summarize(walk_ms)["p50_ms"],
+                "path_p50_ms": summarize(path_ms)["p50_ms"],
+                "history_p50_ms": summarize(history_ms)["p50_ms"],
+                "history_rows": len(history),
+            })
+        print_table(results)
+
+        deepest = chain[max(depths)]
+        plan = await explain(
+            "SELECT c.id FROM conversations AS t JOIN conversations AS c ON c.id = ANY(t.ancestor_ids || t.id) WHERE t.id = %s",
+            (deepest["id"],)
+        )
+        print(f"\npath query plan at depth {max(depths)} ({plan['execution_ms']:.3f} ms): {', '.join(plan['nodes'])}")
+    finally:
+        if chain:
+            # cascades to every message and branched thread of the chain
+            await db.execute("DELETE FROM conversations WHERE id = %s", (chain[0]["id"],))
+        await db.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--depths", type=int, nargs="+", default=[1, 5, 10, 25, 50])
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--messages-per-level", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(run(args.depths, args.repeat, args.messages_per_level))
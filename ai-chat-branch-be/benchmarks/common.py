@@ -0,0 +1,41 @@
+import statistics
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ranked = sorted(samples)
+    return ranked[min(int(len(ranked) * pct / 100), len(ranked) - 1)]
+
+
+def summarize(samples_ms: List[float]) -> Dict[str, float]:
+    """p50/p99/mean/max of latency samples in milliseconds."""
+    return {
+        "count": len(samples_ms),
+        "p50_ms": round(percentile(samples_ms, 50), 3),
+        "p99_ms": round(percentile(samples_ms, 99), 3),
+        "mean_ms": round(statistics.fmean(samples_ms), 3) if samples_ms else 0.0,
+        "max_ms": round(max(samples_ms), 3) if samples_ms else 0.0,
+    }
+
+
+@contextmanager
+def timed(samples_ms: List[float]) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        samples_ms.append((time.perf_counter() - started) * 1000)
+
+
+def print_table(rows: List[Dict[str, object]]) -> None:
+    if not rows:
+        return
+    columns = list(rows[0])
+    widths = {column: max(len(str(column)), *(len(str(row[column])) for row in rows)) for column in columns}
+    print("  ".join(str(column).ljust(widths[column]) for column in columns))
+    for row in rows:
+        print("  ".join(str(row[column]).ljust(widths[column]) for column in columns))
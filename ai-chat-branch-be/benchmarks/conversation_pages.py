@@ -0,0 +1,90 @@
+"""Keyset versus OFFSET pagination of the conversation list.
+
+Fills a scratch copy of the conversations table, indexed like dml/v6.sql,
+with 10k, 100k and 1M rows and times fetching a page at several depths of
+the list with the getConversations keyset query and with the OFFSET query it
+replaced. The scratch table is dropped afterwards:
+
+    uv run python -m benchmarks.conversation_pages --sizes 10000 100000 1000000
+"""
+import argparse
+import asyncio
+from typing import List
+from app.db import db
+from benchmarks.common import print_table, summarize, timed
+
+TABLE = "bench_conversation_pages"
+COLUMNS = "id, created_at, name, message_id, updated_at"
+
+
+async def fill(size: int) -> None:
+    await db.execute(f"DROP TABLE IF EXISTS {TABLE}")
+    await db.execute(
+        f"""
+        CREATE TABLE {TABLE} (
+            id SERIAL PRIMARY KEY, name TEXT, message_id INTEGER,
+            created_at TIMESTAMPTZ NOT NULL, updated_at TIMESTAMPTZ NOT NULL
+        )
+        """
+    )
+    # a few conversations share each timestamp so the id tiebreaker matters
+    await db.execute(
+        f"""
+        INSERT INTO {TABLE} (name, created_at, updated_at)
+        SELECT 'conversation ' || n, NOW() - make_interval(secs => n / 3), NOW() - make_interval(secs => n / 3)
+        FROM generate_series(1, %s) AS n
+        """,
+        (size,)
+    )
+    await db.execute(f"CREATE INDEX ON {TABLE} (created_at DESC, id DESC)")
+    await db.execute(f"ANALYZE {TABLE}")
+
+
+async def run(sizes: List[int], page_size: int, repeat: int) -> None:
+    await db.connect()
+    try:
+        results = []
+        for size in sizes:
+            await fill(size)
+            for depth in (0, 0.1, 0.5, 0.99):
+                offset = int(size * depth)
+                cursor = None
+                if offset:
+                    cursor = await db.fetch_one(f"SELECT created_at, id FROM {TABLE} ORDER BY created_at DESC, id DESC OFFSET %s LIMIT 1", (offset - 1,))
+
+                keyset_ms: List[float] = []
+                offset_ms: List[float] = []
+                for _ in range(repeat):
+                    with timed(keyset_ms):
+                        if cursor:
+                            keyset = await db.fetch_all(
+                                f"SELECT {COLUMNS} FROM {TABLE} WHERE (created_at, id) < (%s, %s) ORDER BY created_at DESC, id DESC LIMIT %s",
+                                (cursor["created_at"], cursor["id"], page_size + 1,)
+                            )
+                        else:
+                            keyset = await db.fetch_all(f"SELECT {COLUMNS} FROM {TABLE} ORDER BY created_at DESC, id DESC LIMIT %s", (page_size + 1,))
+                    with timed(offset_ms):
+                        paged = await db.fetch_all(f"SELECT {COLUMNS} FROM {TABLE} ORDER BY created_at DESC, id DESC OFFSET %s LIMIT %s", (offset, page_size + 1,))
+                assert [row["id"] for row in keyset] == [row["id"] for row in paged]
+
+                results.append({
+                    "conversations": size,
+                    "page_at": f"{depth:.0%}",
+                    "keyset_p50_ms": summarize(keyset_ms)["p50_ms"],
+                    "keyset_p99_ms": summarize(keyset_ms)["p99_ms"],
+                    "offset_p50_ms": summarize(offset_ms)["p50_ms"],
+                    "offset_p99_ms": summarize(offset_ms)["p99_ms"],
+                })
+        print_table(results)
+    finally:
+        await db.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        await db.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.sizes, args.page_size, args.repeat))
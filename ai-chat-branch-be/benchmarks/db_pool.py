@@ -0,0 +1,66 @@
+"""Concurrent streaming load on the database layer.
+
+Simulates generations that each insert a placeholder message, checkpoint
+its growing content and read the conversation back, all at once, and
+reports latency and pool acquire waits. Runs against the database
+configured through DB_* in a scratch table that is dropped afterwards:
+
+    uv run python -m benchmarks.db_pool --concurrency 10 50 200
+"""
+import argparse
+import asyncio
+import time
+from typing import List
+from app.db import db
+from benchmarks.common import print_table, summarize, timed
+
+TABLE = "bench_db_pool_messages"
+
+
+async def generation(conversation_id: int, checkpoints: int, samples_ms: List[float]) -> None:
+    with timed(samples_ms):
+        rows = await db.execute(f"INSERT INTO {TABLE} (conversation_id, content) VALUES (%s, '') RETURNING id", (conversation_id,), True)
+    message_id = rows[0]["id"]
+    content = ""
+    for _ in range(checkpoints):
+        content += "token " * 20
+        with timed(samples_ms):
+            await db.execute(f"UPDATE {TABLE} SET content = %s WHERE id = %s", (content, message_id,))
+    with timed(samples_ms):
+        await db.fetch_all(f"SELECT id, content FROM {TABLE} WHERE conversation_id = %s ORDER BY id", (conversation_id,))
+
+
+async def run(concurrency_levels: List[int], checkpoints: int) -> None:
+    await db.connect()
+    try:
+        await db.execute(f"CREATE TABLE IF NOT EXISTS {TABLE} (id SERIAL PRIMARY KEY, conversation_id INTEGER NOT NULL, content TEXT NOT NULL)")
+        results = []
+        for concurrency in concurrency_levels:
+            samples_ms: List[float] = []
+            before = db.get_stats()
+            started = time.perf_counter()
+            await asyncio.gather(*(generation(index % 10, checkpoints, samples_ms) for index in range(concurrency)))
+            seconds = time.perf_counter() - started
+            after = db.get_stats()
+            acquires = after["acquire_count"] - before["acquire_count"]
+            results.append({
+                "concurrency": concurrency,
+                "seconds": round(seconds, 3),
+                "queries_per_s": round(len(samples_ms) / seconds, 1),
+                **{key: value for key, value in summarize(samples_ms).items() if key != "count"},
+                "acquire_timeouts": after["acquire_timeouts"] - before["acquire_timeouts"],
+                "acquires": acquires,
+                "acquire_wait_max_ms": round(after["acquire_wait_max_ms"], 3),
+            })
+        print_table(results)
+    finally:
+        await db.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        await db.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--checkpoints", type=int, default=20, help="content checkpoints per generation")
+    args = parser.parse_args()
+    asyncio.run(run(args.concurrency, args.checkpoints))
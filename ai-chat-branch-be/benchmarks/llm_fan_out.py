@@ -0,0 +1,99 @@
+"""Latency of concurrent model calls through the shared HTTP client.
+
+Starts a local OpenAI-compatible stub server that answers chat completions
+after a fixed delay, then fans out batches of concurrent calls with the
+OpenAI client, once with a new HTTP client per call (the previous behaviour,
+paying connection setup every time) and once through the pooled keep-alive
+client of app.utils.http_client. Reports p50/p99 call latency and the wall
+clock of each batch. The stub is plain HTTP on localhost, so the gap it shows
+is a lower bound of the one against a TLS endpoint:
+
+    uv run python -m benchmarks.llm_fan_out --fan-out 8 32 128
+"""
+import argparse
+import asyncio
+import time
+from typing import List
+import httpx
+import uvicorn
+from fastapi import FastAPI
+from openai import AsyncOpenAI
+from app.utils.http_client import llm_http_client
+from benchmarks.common import print_table, summarize, timed
+
+HOST = "127.0.0.1"
+
+
+def stub_app(latency: float) -> FastAPI:
+    stub = FastAPI()
+
+    @stub.post("/v1/chat/completions")
+    async def chatCompletions(body: dict):
+        await asyncio.sleep(latency)
+        return {
+            "id": "chatcmpl-bench",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        }
+
+    return stub
+
+
+async def call(base_url: str, http_client: httpx.AsyncClient, samples_ms: List[float]) -> None:
+    client = AsyncOpenAI(base_url=base_url, api_key="bench", http_client=http_client, max_retries=0)
+    with timed(samples_ms):
+        await client.chat.completions.create(model="stub", messages=[{"role": "user", "content": "ping"}])
+
+
+async def fresh_client_call(base_url: str, samples_ms: List[float]) -> None:
+    async with httpx.AsyncClient() as http_client:
+        await call(base_url, http_client, samples_ms)
+
+
+async def run(fan_outs: List[int], rounds: int, latency_ms: float, port: int) -> None:
+    server = uvicorn.Server(uvicorn.Config(stub_app(latency_ms / 1000), host=HOST, port=port, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    base_url = f"http://{HOST}:{port}/v1"
+    llm_http_client.start()
+    try:
+        results = []
+        for fan_out in fan_outs:
+            for name in ("client_per_call", "shared_client"):
+                samples_ms: List[float] = []
+                batches_ms: List[float] = []
+                for _ in range(rounds):
+                    with timed(batches_ms):
+                        if name == "shared_client":
+                            await asyncio.gather(*(call(base_url, llm_http_client.client, samples_ms) for _ in range(fan_out)))
+                        else:
+                            await asyncio.gather(*(fresh_client_call(base_url, samples_ms) for _ in range(fan_out)))
+                latency = summarize(samples_ms)
+                results.append({
+                    "fan_out": fan_out,
+                    "client": name,
+                    "p50_ms": latency["p50_ms"],
+                    "p99_ms": latency["p99_ms"],
+                    "batch_p50_ms": summarize(batches_ms)["p50_ms"],
+                    "overhead_p50_ms": round(latency["p50_ms"] - latency_ms, 3),
+                })
+        print_table(results)
+        print(f"\n{llm_http_client.stats()}")
+    finally:
+        await llm_http_client.stop()
+        server.should_exit = True
+        await serving
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fan-out", type=int, nargs="+", default=[8, 32, 128])
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=50, help="stub server response delay")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    asyncio.run(run(args.fan_out, args.rounds, args.latency_ms, args.port))
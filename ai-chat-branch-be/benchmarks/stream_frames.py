@@ -0,0 +1,79 @@
+"""Bytes and encoding CPU per streamed token for each createMessage stream format.
+
+Replays a synthetic token stream, arriving in bursts like model output does,
+through the frame encoding of "ndjson" (the default), "coalesced" and "sse"
+and reports frames, bytes per response and CPU per token. No database or
+model is needed:
+
+    uv run python -m benchmarks.stream_frames --tokens 2000
+"""
+import argparse
+import asyncio
+import os
+import time
+from typing import AsyncIterator, List, Tuple
+from app.utils.stream import coalesce, encode_frame, encode_sse
+from benchmarks.common import print_table
+
+HEADER = {
+    "message_id": 123456,
+    "agentic_mode": "tree_of_thoughts",
+    "model_settings": {"model": "openai/gpt-4o-mini", "temperature": 0.7, "tot_max_calls": 40},
+}
+
+
+async def tokens(count: int, burst: int, gap: float) -> AsyncIterator[Tuple[str, str]]:
+    for index in range(count):
+        if index and index % burst == 0:
+            await asyncio.sleep(gap)
+        yield "real_content", " tok" if index % 3 else " token"
+
+
+async def ndjson(deltas: AsyncIterator[Tuple[str, str]], interval: float, max_bytes: int) -> AsyncIterator[str]:
+    async for delta_type, content in deltas:
+        yield encode_frame({**HEADER, "content": content, "type": delta_type})
+
+
+async def coalesced(deltas: AsyncIterator[Tuple[str, str]], interval: float, max_bytes: int) -> AsyncIterator[str]:
+    yield encode_frame({"type": "header", **HEADER})
+    async for delta_type, content in coalesce(deltas, interval=interval, max_bytes=max_bytes):
+        yield encode_frame({"type": delta_type, "content": content})
+
+
+async def sse(deltas: AsyncIterator[Tuple[str, str]], interval: float, max_bytes: int) -> AsyncIterator[str]:
+    yield encode_sse("header", HEADER)
+    event_id = 0
+    async for delta_type, content in deltas:
+        event_id += 1
+        yield encode_sse(delta_type, content, event_id)
+    yield encode_sse("done", {})
+
+
+async def run(count: int, burst: int, gap_ms: float, interval_ms: float, max_bytes: int) -> None:
+    results = []
+    for name, encode in (("ndjson", ndjson), ("coalesced", coalesced), ("sse", sse)):
+        frames: List[int] = []
+        cpu_started, started = time.process_time(), time.perf_counter()
+        async for frame in encode(tokens(count, burst, gap_ms / 1000), interval_ms / 1000, max_bytes):
+            frames.append(len(frame.encode()))
+        cpu, seconds = time.process_time() - cpu_started, time.perf_counter() - started
+        results.append({
+            "format": name,
+            "frames": len(frames),
+            "bytes": sum(frames),
+            "bytes_per_token": round(sum(frames) / count, 1),
+            "cpu_us_per_token": round(cpu * 1e6 / count, 2),
+            "seconds": round(seconds, 3),
+        })
+    print_table(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=2000)
+    parser.add_argument("--burst", type=int, default=8, help="tokens arriving together")
+    parser.add_argument("--gap-ms", type=float, default=10, help="pause between bursts")
+    parser.add_argument("--interval-ms", type=float, default=float(os.getenv("STREAM_COALESCE_MS", "50")))
+    parser.add_argument("--max-bytes", type=int, default=int(os.getenv("STREAM_COALESCE_BYTES", "512")))
+    args = parser.parse_args()
+    asyncio.run(run(args.tokens, args.burst, args.gap_ms, args.interval_ms, args.max_bytes))
@@ -0,0 +1,58 @@
+"""Per-request workflow setup cost with and without the workflow cache.
+
+Times, for every agentic mode, building the workflow and its models from
+scratch as every request used to, building it from cached models, and
+get_workflow serving it from the workflow cache. No model is called:
+
+    uv run python -m benchmarks.workflow_setup --repeat 200
+"""
+import argparse
+from typing import List
+from app.agent_workflows import index as workflows
+from app.agent_workflows.constants import AGENTIC_MODE
+from app.utils import model as model_module
+from benchmarks.common import print_table, summarize, timed
+
+MODEL_SETTINGS = {"model": "openai/gpt-4o-mini", "temperature": 0.7}
+
+
+def micros(samples_ms: List[float]) -> dict:
+    """summarize() of samples in microseconds; its *_ms keys then hold microseconds."""
+    return summarize([sample * 1000 for sample in samples_ms])
+
+
+def run(repeat: int) -> None:
+    results = []
+    for agentic_mode in [None, *AGENTIC_MODE]:
+        uncached_ms: List[float] = []
+        shared_models_ms: List[float] = []
+        cached_ms: List[float] = []
+        for _ in range(repeat):
+            model_module._models.clear()
+            with timed(uncached_ms):
+                workflows.build_workflow(agentic_mode=agentic_mode, model_settings=MODEL_SETTINGS)
+            with timed(shared_models_ms):
+                workflows.build_workflow(agentic_mode=agentic_mode, model_settings=MODEL_SETTINGS)
+        workflows.get_workflow(agentic_mode=agentic_mode, model_settings=MODEL_SETTINGS)
+        for _ in range(repeat):
+            with timed(cached_ms):
+                workflows.get_workflow(agentic_mode=agentic_mode, model_settings=MODEL_SETTINGS)
+
+        uncached, shared_models, cached = micros(uncached_ms), micros(shared_models_ms), micros(cached_ms)
+        results.append({
+            "mode": agentic_mode.value if agentic_mode else "default",
+            "uncached_p50_us": uncached["p50_ms"],
+            "uncached_p99_us": uncached["p99_ms"],
+            "shared_models_p50_us": shared_models["p50_ms"],
+            "cached_p50_us": cached["p50_ms"],
+            "cached_p99_us": cached["p99_ms"],
+        })
+    print_table(results)
+    print(f"\n{workflows.workflow_cache_stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    run(args.repeat)
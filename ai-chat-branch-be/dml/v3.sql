@@ -0,0 +1,2 @@
+-- Support the recursive ancestry walk and per-conversation history slices
+CREATE INDEX idx_messages_conversation_id_created_at ON messages(conversation_id, created_at);
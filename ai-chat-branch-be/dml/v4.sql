@@ -0,0 +1,20 @@
+-- Materialize each conversation's ancestry: ancestor conversation ids and
+-- the message each level branched from, both ordered root first
+ALTER TABLE conversations ADD ancestor_ids INTEGER[] NOT NULL DEFAULT '{}';
+ALTER TABLE conversations ADD ancestor_message_ids INTEGER[] NOT NULL DEFAULT '{}';
+
+-- Backfill existing rows top-down from conversations.message_id
+WITH RECURSIVE expected AS (
+    SELECT c.id, ARRAY[]::integer[] AS ancestor_ids, ARRAY[]::integer[] AS ancestor_message_ids
+    FROM conversations AS c
+    WHERE c.message_id IS NULL
+    UNION ALL
+    SELECT c.id, e.ancestor_ids || m.conversation_id, e.ancestor_message_ids || m.id
+    FROM expected AS e
+    JOIN messages AS m ON m.conversation_id = e.id
+    JOIN conversations AS c ON c.message_id = m.id
+)
+UPDATE conversations AS c
+SET ancestor_ids = e.ancestor_ids, ancestor_message_ids = e.ancestor_message_ids
+FROM expected AS e
+WHERE e.id = c.id;
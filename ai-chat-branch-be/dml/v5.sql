@@ -0,0 +1,14 @@
+-- Rolling summary of each conversation's prompt history (ancestors included)
+-- up to last_message_id
+CREATE TABLE conversation_summaries (
+    conversation_id INTEGER PRIMARY KEY REFERENCES conversations(id) ON DELETE CASCADE,
+    summary TEXT NOT NULL,
+    last_message_id INTEGER NOT NULL REFERENCES messages(id) ON DELETE CASCADE,
+    num_messages INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT (NOW() AT TIME ZONE 'UTC'),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT (NOW() AT TIME ZONE 'UTC')
+);
+
+CREATE TRIGGER update_conversation_summaries_updated_at
+    BEFORE UPDATE ON conversation_summaries
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
@@ -0,0 +1,2 @@
+-- Back keyset pagination of conversations on (created_at, id)
+CREATE INDEX idx_conversations_created_at_id ON conversations(created_at DESC, id DESC);
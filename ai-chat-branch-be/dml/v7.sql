@@ -0,0 +1,10 @@
+-- Persistent tier of the agent response cache (RESPONSE_CACHE_PERSIST=true)
+CREATE TABLE llm_response_cache (
+    key TEXT PRIMARY KEY,
+    agent_name TEXT NOT NULL,
+    output JSONB NOT NULL,
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT (NOW() AT TIME ZONE 'UTC')
+);
+
+CREATE INDEX idx_llm_response_cache_expires_at ON llm_response_cache(expires_at);
@@ -0,0 +1,10 @@
+-- Persistent tier of the web search cache (WEB_SEARCH_CACHE_PERSIST=true)
+CREATE TABLE web_search_cache (
+    key TEXT PRIMARY KEY,
+    query TEXT NOT NULL,
+    result TEXT NOT NULL,
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT (NOW() AT TIME ZONE 'UTC')
+);
+
+CREATE INDEX idx_web_search_cache_expires_at ON web_search_cache(expires_at);
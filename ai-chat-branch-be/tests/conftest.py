@@ -0,0 +1,47 @@
+import asyncio
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import pytest
+
+
+class FakeDb:
+    """Stand-in for app.db.db that records statements instead of running them.
+
+    Fetches record their query and return rows, or what answer(query, params)
+    returns when it is set, for code that runs several different queries.
+
+    Setting hold makes every execute() wait until it is set again, to
+    simulate a slow write; failing makes execute() raise.
+    """
+
+    def __init__(self):
+        self.executed: List[Tuple[str, Optional[tuple]]] = []
+        self.fetched: List[str] = []
+        self.rows: List[Dict[str, Any]] = []
+        self.answer: Optional[Callable[[str, Optional[tuple]], List[Dict[str, Any]]]] = None
+        self.hold: Optional[asyncio.Event] = None
+        self.failing = False
+
+    async def execute(self, query: str, params: Optional[tuple] = None, fetch: bool = False):
+        if self.hold is not None:
+            await self.hold.wait()
+        if self.failing:
+            raise RuntimeError("database unavailable")
+        self.executed.append((" ".join(query.split()), params))
+        return self.rows if fetch else None
+
+    def _fetch(self, query: str, params: Optional[tuple]) -> List[Dict[str, Any]]:
+        query = " ".join(query.split())
+        self.fetched.append(query)
+        return list(self.answer(query, params) if self.answer else self.rows)
+
+    async def fetch_one(self, query: str, params: Optional[tuple] = None) -> Optional[Dict[str, Any]]:
+        rows = self._fetch(query, params)
+        return rows[0] if rows else None
+
+    async def fetch_all(self, query: str, params: Optional[tuple] = None) -> List[Dict[str, Any]]:
+        return self._fetch(query, params)
+
+
+@pytest.fixture
+def fake_db() -> FakeDb:
+    return FakeDb()
@@ -0,0 +1,80 @@
+import pytest
+from app.prompts import budget as budget_module
+from app.prompts.budget import ContextWindowBuilder
+from app.prompts.constants import PromptMode
+from app.prompts.index import Prompt
+
+WORDS_PER_MESSAGE = 50
+
+
+def count_words(model, messages):
+    return sum(len(message["content"].split()) for message in messages) + 4
+
+
+@pytest.fixture(autouse=True)
+def patch_litellm(monkeypatch):
+    # one token per word keeps the expected numbers independent of the tokenizer
+    monkeypatch.setattr(budget_module.litellm, "token_counter", count_words)
+    monkeypatch.setattr(budget_module.litellm, "get_model_info", lambda model: {})
+
+
+def deep_history(length: int):
+    return [
+        {"id": i, "role": "user" if i % 2 else "assistant", "content": f"turn-{i} " + "word " * (WORDS_PER_MESSAGE - 1)}
+        for i in range(1, length + 1)
+    ]
+
+
+def turns(messages):
+    return [int(message["content"].split()[0].split("-")[1]) for message in messages]
+
+
+async def test_deep_history_keeps_recent_and_pinned_turns_within_budget():
+    history = deep_history(200)
+    tokens_per_message = WORDS_PER_MESSAGE + 4
+    builder = ContextWindowBuilder(model="budget-test", budget=20 * tokens_per_message, keep_recent=6)
+
+    fitted, report = builder.build(history, [{"role": "user", "content": "question"}], pinned_ids={1, 40})
+
+    kept = turns(fitted)
+    assert kept == sorted(kept)
+    assert kept[:2] == [1, 40]
+    assert kept[-6:] == list(range(195, 201))
+    # the budget minus the prompt leaves room for 19 messages: 2 pinned, 6 recent, 11 older
+    assert kept[2:-6] == list(range(184, 195))
+    assert report.pinned_messages == 2
+    assert report.dropped_messages == 200 - 19
+    assert report.tokens_before == 200 * tokens_per_message
+    assert report.tokens_after == 19 * tokens_per_message
+    assert report.tokens_saved == report.dropped_messages * tokens_per_message
+
+
+async def test_prompt_pins_the_branch_and_referred_messages():
+    history = deep_history(120)
+    extra_data = {"sub_str": "word", "referred_message": {"id": 30, "content": history[29]["content"]}}
+    prompt = Prompt()
+
+    messages = prompt.prepare(
+        "what does it mean?", history, mode=PromptMode.REPLY, extra_data=extra_data,
+        model_settings={"model": "budget-test", "context_token_budget": 1000}, branch_message_id=5,
+    )
+
+    kept = turns(messages[:-1])
+    assert kept[:2] == [5, 30]
+    assert kept[-6:] == list(range(115, 121))
+    assert prompt.report.pinned_messages == 2
+    assert prompt.report.tokens_saved > 0
+    assert prompt.report.tokens_after <= 1000
+
+
+async def test_short_history_is_kept_verbatim():
+    history = deep_history(4)
+    builder = ContextWindowBuilder(model="budget-test", budget=10000, keep_recent=6)
+
+    fitted, report = builder.build(history, [], pinned_ids={2})
+
+    assert turns(fitted) == [1, 2, 3, 4]
+    assert report.tokens_saved == 0
+    assert report.dropped_messages == 0
+    # within the recent window, pinning changes nothing
+    assert report.pinned_messages == 0
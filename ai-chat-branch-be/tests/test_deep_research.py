@@ -0,0 +1,122 @@
+import asyncio
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import Dict, List, Union
+import pytest
+from app.agent_workflows.deep_research import index as deep_research_module
+from app.agent_workflows.deep_research.agents import Evidence, ResearchPlan, SubResearchResult
+from app.agent_workflows.deep_research.index import DeepResearchWorkflow
+
+
+class FakeResearch:
+    """Stand-in for the planner and the sub-research agent.
+
+    Each sub-question takes its fixed latency and returns its findings, or
+    raises when they are an exception. Tracks how many run at once.
+    """
+
+    def __init__(self, answers: Dict[str, Union[List[Evidence], Exception]], latency: Union[float, Dict[str, float]] = 0.05):
+        self.answers = answers
+        self.latency = latency
+        self.running = 0
+        self.max_running = 0
+
+    async def plan(self, agent, instruction):
+        return SimpleNamespace(final_output=ResearchPlan(sub_questions=list(self.answers)))
+
+    async def run(self, agent, question):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(self.latency[question] if isinstance(self.latency, dict) else self.latency)
+        finally:
+            self.running -= 1
+        answer = self.answers[question]
+        if isinstance(answer, Exception):
+            raise answer
+        return SimpleNamespace(final_output=SubResearchResult(findings=answer))
+
+
+@contextmanager
+def recorded_span(name, data):
+    yield SimpleNamespace(span_data=SimpleNamespace(data=data))
+
+
+@pytest.fixture
+def research(monkeypatch):
+    """Installs a FakeResearch into the fan-out; returns a function building it."""
+    monkeypatch.setattr(deep_research_module, "custom_span", recorded_span)
+    monkeypatch.setattr(deep_research_module, "FAN_OUT", True)
+
+    def install(answers, latency=0.05, concurrency=None) -> FakeResearch:
+        fake = FakeResearch(answers, latency)
+        monkeypatch.setattr(deep_research_module, "Runner", SimpleNamespace(run=fake.run))
+        monkeypatch.setattr(deep_research_module, "response_cache", SimpleNamespace(run=fake.plan))
+        monkeypatch.setattr(deep_research_module, "MAX_SUB_QUESTIONS", len(answers))
+        if concurrency is not None:
+            monkeypatch.setattr(deep_research_module, "FAN_OUT_CONCURRENCY", concurrency)
+        return fake
+
+    return install
+
+
+def finding(claim: str, source: str = "") -> Evidence:
+    return Evidence(claim=claim, source=source)
+
+
+async def test_fan_out_takes_as_long_as_the_slowest_sub_question(research):
+    latency = {"q1": 0.1, "q2": 0.1, "q3": 0.1, "q4": 0.2}
+    research({question: [finding(f"claim of {question}")] for question in latency}, latency=latency, concurrency=4)
+
+    started = time.perf_counter()
+    evidence = await DeepResearchWorkflow().gather_evidence("instruction")
+    elapsed = time.perf_counter() - started
+
+    assert len(evidence) == 4
+    # one after the other would take 0.5 seconds
+    assert 0.19 <= elapsed < 0.3
+
+
+async def test_fan_out_respects_the_concurrency_limit(research):
+    fake = research({f"q{i}": [finding(f"claim {i}")] for i in range(6)}, latency=0.05, concurrency=2)
+
+    started = time.perf_counter()
+    await DeepResearchWorkflow().gather_evidence("instruction")
+    elapsed = time.perf_counter() - started
+
+    assert fake.max_running == 2
+    # 6 sub-questions, 2 at a time
+    assert elapsed >= 0.14
+
+
+async def test_duplicate_claims_are_merged_with_their_sources(research):
+    research({
+        "q1": [finding("Water boils at 100 C.", "https://a.example"), finding("Ice is less dense than water", "https://a.example")],
+        "q2": [finding("water boils at 100 c", "https://b.example")],
+        "q3": [finding("Water boils at 100 C!", "https://a.example"), finding("Water boils at 100 C", "")],
+    })
+
+    evidence = await DeepResearchWorkflow().gather_evidence("instruction")
+
+    assert [(item.claim, item.source) for item in evidence] == [
+        ("Water boils at 100 C.", "https://a.example; https://b.example"),
+        ("Ice is less dense than water", "https://a.example"),
+    ]
+
+
+async def test_failed_sub_question_yields_no_evidence(research):
+    research({"q1": [finding("kept claim", "https://a.example")], "q2": RuntimeError("search unavailable")})
+    failed = deep_research_module.stats["failed_sub_questions"]
+    workflow = DeepResearchWorkflow()
+
+    research_input = await workflow.research_input("instruction")
+
+    assert deep_research_module.stats["failed_sub_questions"] == failed + 1
+    assert research_input == "instruction\n\nEvidence gathered so far:\n- kept claim (source: https://a.example)"
+
+
+async def test_no_evidence_leaves_the_instruction_alone(research):
+    research({"q1": RuntimeError("search unavailable"), "q2": []})
+
+    assert await DeepResearchWorkflow().research_input("instruction") == "instruction"
@@ -0,0 +1,112 @@
+import asyncio
+from typing import Dict, Tuple
+import pytest
+from app import message_buffer as message_buffer_module
+from app.message_buffer import MessageWriteBuffer
+
+
+@pytest.fixture
+def buffer(fake_db, monkeypatch) -> MessageWriteBuffer:
+    monkeypatch.setattr(message_buffer_module, "db", fake_db)
+    return MessageWriteBuffer(flush_interval=0.01, flush_bytes=4)
+
+
+def stored(fake_db) -> Dict[int, Tuple[str, str | None]]:
+    """Message contents after replaying the recorded writes in order."""
+    messages = {}
+    for query, params in fake_db.executed:
+        if "unnest" in query:
+            ids, contents, reasoning_summaries = params
+            messages.update({message_id: (content, reasoning) for message_id, content, reasoning in zip(ids, contents, reasoning_summaries)})
+        else:
+            content, reasoning_summary, message_id = params
+            messages[message_id] = (content, reasoning_summary)
+    return messages
+
+
+async def test_partial_content_is_checkpointed(buffer, fake_db):
+    buffer.start()
+    try:
+        buffer.update(1, "Hel")
+        buffer.update(1, "Hello world", "thinking")
+        await asyncio.sleep(0.05)
+    finally:
+        await buffer.stop()
+
+    assert stored(fake_db)[1] == ("Hello world", "thinking")
+    assert buffer.stats()["rows_written"] >= 1
+
+
+async def test_failed_checkpoint_is_retried(buffer, fake_db):
+    buffer.update(1, "Hello")
+    fake_db.failing = True
+    await buffer.flush()
+    assert buffer.stats()["failures"] == 1
+
+    fake_db.failing = False
+    await buffer.flush()
+    assert stored(fake_db)[1] == ("Hello", None)
+
+
+async def test_final_write_wins_over_stale_checkpoint(buffer, fake_db):
+    buffer.update(1, "Hel")
+    fake_db.hold = asyncio.Event()
+    checkpoint = asyncio.create_task(buffer.flush())
+    await asyncio.sleep(0)
+    finalize = asyncio.create_task(buffer.finalize(1, "Hello world"))
+    await asyncio.sleep(0)
+
+    fake_db.hold.set()
+    await asyncio.gather(checkpoint, finalize)
+    assert stored(fake_db)[1] == ("Hello world", None)
+
+
+async def test_pending_checkpoint_is_dropped_on_finalize(buffer, fake_db):
+    buffer.update(1, "Hel")
+    await buffer.finalize(1, "Hello world")
+    await buffer.flush()
+
+    assert len(fake_db.executed) == 1
+    assert stored(fake_db)[1] == ("Hello world", None)
+    assert buffer.stats()["streaming_messages"] == 0
+
+
+async def test_interrupted_generation_still_finalizes(buffer, fake_db, monkeypatch):
+    from app import main
+
+    class FakeWorkflows:
+        def __init__(self, agentic_mode=None, model_settings=None):
+            pass
+
+        async def run_streamed(self, query):
+            return None
+
+    async def fake_deltas(result):
+        yield "real_content", "Hel"
+        yield "reasoning_summary", "thinking"
+        yield "real_content", "lo"
+        # the client disconnects while the model is still generating
+        await asyncio.sleep(3600)
+        yield "real_content", " never sent"
+
+    monkeypatch.setattr(main, "message_buffer", buffer)
+    monkeypatch.setattr(main, "AgentWorkflows", FakeWorkflows)
+    monkeypatch.setattr(main, "stream_deltas", fake_deltas)
+    monkeypatch.setattr(main.summaries, "schedule_refresh", lambda conversation_id, message_id: None)
+
+    body = main.CreateMessageReq(conversation_id=1, user_message="hi", is_new_conversation=False)
+    received = []
+
+    async def consume():
+        async for delta in main.generateMessage(body, 7, query=[]):
+            received.append(delta)
+
+    generation = asyncio.create_task(consume())
+    while len(received) < 3:
+        await asyncio.sleep(0)
+    generation.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await generation
+
+    assert stored(fake_db)[7] == ("Hello", "thinking")
+    assert buffer.stats()["final_writes"] == 1
@@ -0,0 +1,130 @@
+import asyncio
+import time
+from types import SimpleNamespace
+from typing import List
+import pytest
+from app.utils.scheduler import LLMScheduler, Priority
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after: str):
+        super().__init__("429 Too Many Requests")
+        self.response = SimpleNamespace(headers={"retry-after": retry_after})
+
+
+def make_scheduler(max_concurrency: int = 1, requests_per_minute: float = 0, max_retries: int = 3) -> LLMScheduler:
+    return LLMScheduler(
+        get_limits=lambda provider: (max_concurrency, requests_per_minute),
+        max_retries=max_retries,
+        retry_base_delay=10,
+        is_rate_limit=lambda error: isinstance(error, RateLimited),
+    )
+
+
+async def test_interactive_served_before_background_when_saturated():
+    scheduler = make_scheduler(max_concurrency=1)
+    limiter = scheduler.limiter("openai")
+    order: List[str] = []
+    await limiter.acquire(Priority.BACKGROUND)
+
+    async def call(name: str, priority: Priority):
+        async with scheduler.slot("openai", priority):
+            order.append(name)
+
+    calls = [
+        asyncio.create_task(call("background 1", Priority.BACKGROUND)),
+        asyncio.create_task(call("background 2", Priority.BACKGROUND)),
+        asyncio.create_task(call("interactive", Priority.INTERACTIVE)),
+    ]
+    await asyncio.sleep(0)
+    assert limiter.stats()["queue_depth"] == 3
+
+    limiter.release()
+    await asyncio.gather(*calls)
+    assert order == ["interactive", "background 1", "background 2"]
+
+
+async def test_retry_after_is_honoured():
+    scheduler = make_scheduler(max_concurrency=2)
+    attempts: List[float] = []
+
+    async def call():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise RateLimited(retry_after="0.2")
+        return "ok"
+
+    assert await scheduler.run("openai", Priority.INTERACTIVE, call) == "ok"
+    assert attempts[1] - attempts[0] >= 0.2
+    assert scheduler.retries == 1
+    assert scheduler.limiter("openai").stats()["rate_limited"] == 1
+
+
+async def test_back_off_holds_other_calls():
+    scheduler = make_scheduler(max_concurrency=2)
+    assert scheduler.retry_delay("openai", RateLimited(retry_after="0.2"), attempt=0) == 0.2
+
+    started = time.monotonic()
+    async with scheduler.slot("openai", Priority.INTERACTIVE):
+        waited = time.monotonic() - started
+    assert waited >= 0.15
+
+
+async def test_gives_up_after_max_retries():
+    scheduler = make_scheduler(max_retries=1)
+
+    async def call():
+        raise RateLimited(retry_after="0")
+
+    with pytest.raises(RateLimited):
+        await scheduler.run("openai", Priority.INTERACTIVE, call)
+    assert scheduler.retries == 1
+
+
+async def test_cancelled_waiter_does_not_leak_a_slot():
+    scheduler = make_scheduler(max_concurrency=1)
+    limiter = scheduler.limiter("openai")
+    await limiter.acquire(Priority.INTERACTIVE)
+
+    waiter = asyncio.create_task(limiter.acquire(Priority.INTERACTIVE))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+
+    limiter.release()
+    await asyncio.wait_for(limiter.acquire(Priority.INTERACTIVE), timeout=1)
+    limiter.release()
+    assert limiter.stats()["in_flight"] == 0
+
+
+async def test_waiter_cancelled_as_it_is_granted_does_not_leak_a_slot():
+    scheduler = make_scheduler(max_concurrency=1)
+    limiter = scheduler.limiter("openai")
+    await limiter.acquire(Priority.INTERACTIVE)
+
+    waiter = asyncio.create_task(limiter.acquire(Priority.INTERACTIVE))
+    await asyncio.sleep(0)
+    # the slot is handed to the waiter, which is cancelled before it resumes
+    limiter.release()
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+
+    assert limiter.stats()["in_flight"] == 0
+    await asyncio.wait_for(limiter.acquire(Priority.INTERACTIVE), timeout=1)
+    limiter.release()
+
+
+async def test_token_bucket_spaces_calls_after_burst():
+    # 600 requests per minute: a burst of 10, then one every 0.1s
+    scheduler = make_scheduler(max_concurrency=100, requests_per_minute=600)
+    limiter = scheduler.limiter("openai")
+    started = time.monotonic()
+    for _ in range(10):
+        await limiter.acquire(Priority.INTERACTIVE)
+    assert time.monotonic() - started < 0.05
+
+    await limiter.acquire(Priority.INTERACTIVE)
+    assert time.monotonic() - started >= 0.08
+    assert limiter.stats()["waited"] == 1
@@ -0,0 +1,32 @@
+import asyncio
+from app.utils.stream import coalesce
+
+
+async def test_coalesce_merges_bursts_of_text():
+    async def deltas():
+        for piece in ("a", "b", "c"):
+            yield "real_content", piece
+        yield "tot_progress", {"event": "search_started"}
+        yield "real_content", "d"
+
+    merged = [delta async for delta in coalesce(deltas(), interval=1, max_bytes=1024)]
+
+    assert merged == [("real_content", "abc"), ("tot_progress", {"event": "search_started"}), ("real_content", "d")]
+
+
+async def test_coalesce_closes_the_source_when_the_consumer_stops():
+    closed = asyncio.Event()
+
+    async def deltas():
+        try:
+            yield "real_content", "first"
+            await asyncio.Event().wait()
+            yield "real_content", "never"
+        finally:
+            closed.set()
+
+    stream = coalesce(deltas(), interval=0.01, max_bytes=1024)
+    assert await stream.__anext__() == ("real_content", "first")
+    await stream.aclose()
+
+    assert closed.is_set()
@@ -0,0 +1,93 @@
+import asyncio
+from typing import List
+from app.utils.job_runner import JobRunner
+from app.utils.stream_channel import StreamChannel, StreamEvent, StreamRegistry
+
+
+async def collect(channel: StreamChannel, last_event_id: int = 0) -> List[StreamEvent]:
+    return [event async for event in channel.subscribe(last_event_id)]
+
+
+def published(events: List[StreamEvent]) -> str:
+    return "".join(data["content"] for _, event_type, data in events if event_type == "real_content")
+
+
+async def test_replays_after_last_event_id():
+    channel = StreamChannel(1, {}, capacity=8)
+    for content in ["a", "b", "c", "d"]:
+        channel.publish("real_content", {"content": content})
+    channel.close()
+
+    events = await collect(channel, last_event_id=2)
+    assert [event[0] for event in events] == [3, 4]
+    assert published(events) == "cd"
+
+
+async def test_snapshot_when_subscriber_fell_behind():
+    channel = StreamChannel(1, {}, capacity=2)
+    for content in ["a", "b", "c", "d"]:
+        channel.publish("real_content", {"content": content})
+    channel.publish("reasoning_summary", {"content": "why"})
+    channel.close()
+
+    events = await collect(channel, last_event_id=1)
+    assert events[0] == (5, "snapshot", {"real_content": "abcd", "reasoning_summary": "why"})
+    assert events[1:] == []
+
+
+async def test_snapshot_then_live_events():
+    channel = StreamChannel(1, {}, capacity=2)
+    for content in ["a", "b", "c"]:
+        channel.publish("real_content", {"content": content})
+    subscriber = asyncio.create_task(collect(channel))
+    await asyncio.sleep(0)
+
+    channel.publish("real_content", {"content": "d"})
+    channel.close()
+    events = await subscriber
+    assert events[0][1] == "snapshot" and events[0][2]["real_content"] == "abc"
+    assert published(events[1:]) == "d"
+
+
+async def test_concurrent_subscribers_see_every_event():
+    channel = StreamChannel(1, {}, capacity=64)
+    subscribers = [asyncio.create_task(collect(channel)) for _ in range(3)]
+    await asyncio.sleep(0)
+
+    for content in "streaming":
+        channel.publish("real_content", {"content": content})
+        await asyncio.sleep(0)
+    late = asyncio.create_task(collect(channel, last_event_id=4))
+    channel.publish("real_content", {"content": "!"})
+    channel.close()
+
+    for events in await asyncio.gather(*subscribers):
+        assert [event[0] for event in events] == list(range(1, 11))
+        assert published(events) == "streaming!"
+    assert published(await late) == "aming!"
+
+
+async def test_generation_discarded_at_stop_is_finished():
+    runner = JobRunner(max_concurrency=1, max_queue=1)
+    registry = StreamRegistry(capacity=8, linger=60, runner=runner)
+    started, discarded = [], []
+
+    async def events(name):
+        started.append(name)
+        yield "real_content", {"content": name}
+        await asyncio.Event().wait()
+
+    async def finish(name):
+        discarded.append(name)
+
+    running = registry.start(1, {}, events("running"), on_discard=lambda: finish("running"))
+    queued = registry.start(2, {}, events("queued"), on_discard=lambda: finish("queued"))
+    await asyncio.sleep(0.01)
+    await runner.stop()
+
+    assert started == ["running"]
+    assert discarded == ["queued"]
+    assert running.done and published(await collect(running)) == "running"
+    assert queued.done and [event[1:] for event in await collect(queued)] == [("error", {"message": "Generation cancelled"})]
+    assert runner.stats()["discarded"] == 1
+    assert runner.stats()["queue_depth"] == 0
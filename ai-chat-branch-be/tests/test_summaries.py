@@ -0,0 +1,144 @@
+from types import SimpleNamespace
+import pytest
+from app import history as history_module
+from app import summaries
+from app.history import HistoryCache
+
+
+class FakeWorkflows:
+    """Stand-in for the summary agent that records the prompts it gets."""
+
+    queries = []
+
+    def __init__(self, agentic_mode=None):
+        self.agentic_mode = agentic_mode
+
+    async def run(self, query):
+        FakeWorkflows.queries.append(query[0]["content"])
+        return SimpleNamespace(final_output=f"summary #{len(FakeWorkflows.queries)}")
+
+
+@pytest.fixture(autouse=True)
+def patch_db(fake_db, monkeypatch):
+    FakeWorkflows.queries = []
+    monkeypatch.setattr(summaries, "db", fake_db)
+    monkeypatch.setattr(history_module, "db", fake_db)
+    monkeypatch.setattr(summaries, "AgentWorkflows", FakeWorkflows)
+
+
+def messages(first_id: int, count: int, conversation_id: int = 1):
+    return [{"id": i, "content": f"message {i}", "role": "user" if i % 2 else "assistant", "conversation_id": conversation_id} for i in range(first_id, first_id + count)]
+
+
+def answer_with(conversation, pending=(), branch_history=(), messages_by_conversation=None):
+    """FakeDb.answer serving the queries of summaries and history."""
+
+    def answer(query, params):
+        if query.startswith("SELECT c.id, c.message_id, c.ancestor_message_ids"):
+            return [conversation]
+        if query.startswith("WITH s AS"):
+            return list(branch_history)
+        if query.startswith("SELECT id, content, role from messages"):
+            if messages_by_conversation is not None:
+                conversation_id, *bounds = params
+                after = bounds[0] if len(bounds) == 2 else 0
+                return [row for row in messages_by_conversation[conversation_id] if after < row["id"] <= bounds[-1]]
+            return list(pending)
+        raise AssertionError(f"unexpected query: {query}")
+
+    return answer
+
+
+def conversation_row(conversation_id=1, message_id=None, summary=None, summary_message_id=None, num_messages=None):
+    return {
+        "id": conversation_id, "message_id": message_id, "ancestor_message_ids": [message_id] if message_id else [],
+        "summary": summary, "summary_message_id": summary_message_id, "num_messages": num_messages,
+    }
+
+
+async def test_refresh_waits_for_enough_pending_messages(fake_db):
+    fake_db.answer = answer_with(conversation_row(), pending=messages(1, summaries.REFRESH_EVERY + summaries.KEEP_RECENT - 1))
+
+    await summaries.refresh(1, 100)
+
+    assert FakeWorkflows.queries == []
+    assert fake_db.executed == []
+
+
+async def test_refresh_folds_all_but_the_recent_messages(fake_db):
+    pending = messages(11, summaries.REFRESH_EVERY + summaries.KEEP_RECENT)
+    fake_db.answer = answer_with(conversation_row(summary="old summary", summary_message_id=10, num_messages=10), pending=pending)
+
+    await summaries.refresh(1, 100)
+
+    folded = pending[:summaries.REFRESH_EVERY]
+    [prompt] = FakeWorkflows.queries
+    assert prompt.startswith("Current summary:\nold summary")
+    assert f"message {folded[-1]['id']}" in prompt
+    assert f"message {pending[-1]['id']}" not in prompt
+    [(query, params)] = fake_db.executed
+    assert query.startswith("INSERT INTO conversation_summaries")
+    assert params == (1, "summary #1", folded[-1]["id"], 10 + len(folded))
+
+
+async def test_first_refresh_of_a_branch_starts_from_the_parent_summary(fake_db):
+    fetched_branch_points = []
+    answer = answer_with(
+        conversation_row(conversation_id=2, message_id=5),
+        pending=messages(100, summaries.REFRESH_EVERY + summaries.KEEP_RECENT, conversation_id=2),
+        branch_history=[{"id": None, "content": "parent summary", "role": "system"}, {"id": 5, "content": "message 5", "role": "user"}],
+    )
+
+    def record(query, params):
+        if query.startswith("WITH s AS"):
+            fetched_branch_points.append(params)
+        return answer(query, params)
+
+    fake_db.answer = record
+
+    await summaries.refresh(2, 200)
+
+    assert fetched_branch_points == [(5,)]
+    [prompt] = FakeWorkflows.queries
+    assert prompt.startswith("Current summary:\nsystem: Summary of the earlier conversation:\nparent summary\nuser: message 5")
+
+
+async def test_get_history_replaces_summarized_turns(fake_db):
+    local = messages(1, 20)
+    fake_db.answer = answer_with(None, messages_by_conversation={1: local})
+    cache = HistoryCache(max_messages=1000)
+
+    rows = await cache.get_history({**conversation_row(summary="rolling summary", summary_message_id=14), "last_message_id": 20})
+
+    assert rows[0] == summaries.summary_message("rolling summary")
+    assert [row["id"] for row in rows[1:]] == list(range(15, 21))
+
+
+async def test_get_history_ignores_a_summary_newer_than_the_cutoff(fake_db):
+    local = messages(1, 20)
+    fake_db.answer = answer_with(None, messages_by_conversation={1: local})
+    cache = HistoryCache(max_messages=1000)
+
+    rows = await cache.get_history({**conversation_row(summary="rolling summary", summary_message_id=14), "last_message_id": 12})
+
+    assert [row["id"] for row in rows] == list(range(1, 13))
+
+
+async def test_sibling_branches_use_their_own_summaries(fake_db):
+    # threads 2 and 3 both branch from message 5 of thread 1; only thread 2 has a summary
+    parent_summary = [{"id": None, "content": "parent summary", "role": "system"}, {"id": 5, "content": "message 5", "role": "user"}]
+    fake_db.answer = answer_with(
+        None,
+        branch_history=parent_summary,
+        messages_by_conversation={2: messages(100, 20, conversation_id=2), 3: messages(200, 4, conversation_id=3)},
+    )
+    cache = HistoryCache(max_messages=1000)
+
+    first = await cache.get_history({**conversation_row(2, message_id=5, summary="thread 2 summary", summary_message_id=110), "last_message_id": 119})
+    second = await cache.get_history({**conversation_row(3, message_id=5), "last_message_id": 203})
+
+    assert first[0] == summaries.summary_message("thread 2 summary")
+    assert [row["id"] for row in first[1:]] == list(range(111, 120))
+    assert second[0] == summaries.summary_message("parent summary")
+    assert [row["id"] for row in second[1:]] == [5, 200, 201, 202, 203]
+    assert all("thread 2" not in row["content"] for row in second)
@@ -0,0 +1,107 @@
+import asyncio
+import pytest
+from app.utils import tiered_cache as tiered_cache_module
+from app.utils.tiered_cache import TieredCache
+
+
+def make_cache(persist: bool = False, purge_interval: float = 3600) -> TieredCache:
+    return TieredCache(
+        table="web_search_cache", value_column="result", value_type="text",
+        max_size=100, ttl=60, persist=persist, purge_interval=purge_interval,
+    )
+
+
+@pytest.fixture(autouse=True)
+def patch_db(fake_db, monkeypatch):
+    monkeypatch.setattr(tiered_cache_module, "db", fake_db)
+
+
+async def test_concurrent_gets_share_one_load():
+    cache = make_cache()
+    loads = 0
+    release = asyncio.Event()
+
+    async def load():
+        nonlocal loads
+        loads += 1
+        await release.wait()
+        return "result"
+
+    gets = [asyncio.create_task(cache.get("key", load)) for _ in range(3)]
+    await asyncio.sleep(0)
+    release.set()
+    assert await asyncio.gather(*gets) == ["result"] * 3
+    assert await cache.get("key", load) == "result"
+    assert loads == 1
+    assert cache.stats()["joined"] == 2
+
+
+async def test_waiter_reloads_when_the_joined_load_is_cancelled():
+    cache = make_cache()
+
+    async def slow():
+        await asyncio.sleep(3600)
+
+    async def fast():
+        return "result"
+
+    first = asyncio.create_task(cache.get("key", slow))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(cache.get("key", fast))
+    await asyncio.sleep(0)
+    first.cancel()
+
+    assert await waiter == "result"
+
+
+async def test_failed_load_is_not_cached():
+    cache = make_cache()
+
+    async def failing():
+        raise RuntimeError("search failed")
+
+    async def load():
+        return "result"
+
+    with pytest.raises(RuntimeError):
+        await cache.get("key", failing)
+    assert await cache.get("key", load) == "result"
+
+
+async def test_persisted_value_is_read_back(fake_db):
+    cache = make_cache(persist=True)
+    fake_db.rows = [{"value": "stored"}]
+
+    async def load():
+        raise AssertionError("should be served from the table")
+
+    assert await cache.get("key", load) == "stored"
+    assert cache.stats()["db_hits"] == 1
+
+
+async def test_writes_purge_expired_rows(fake_db):
+    cache = make_cache(persist=True, purge_interval=0)
+
+    async def load():
+        return "result"
+
+    # no stored value; two expired rows to purge
+    fake_db.rows = [{"value": None, "count": 2}]
+    assert await cache.get("key", load, columns={"query": "q"}) == "result"
+
+    query, params = fake_db.executed[0]
+    assert query.startswith("INSERT INTO web_search_cache (key, result, query, expires_at)")
+    assert params == ("key", "result", "q", 60)
+    assert fake_db.fetched[-1].startswith("WITH expired AS (DELETE FROM web_search_cache WHERE expires_at <= NOW()")
+    assert cache.stats()["purged"] == 2
+
+
+async def test_purge_runs_at_most_once_per_interval(fake_db):
+    cache = make_cache(persist=True, purge_interval=3600)
+    fake_db.rows = [{"value": None, "count": 2}]
+
+    async def load():
+        return "result"
+
+    await cache.get("key", load)
+    assert not any(query.startswith("WITH expired") for query in fake_db.fetched)
@@ -0,0 +1,295 @@
+import asyncio
+import time
+from contextlib import nullcontext
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional, Tuple
+import pytest
+from app.agent_workflows.tree_of_thoughts import index as tot_module
+from app.agent_workflows.tree_of_thoughts import agents as agents_module
+from app.agent_workflows.tree_of_thoughts import transposition
+from app.agent_workflows.tree_of_thoughts.agents import CandidateEvaluation, Evaluation, EvaluationBatch, Thought, ThoughtBatch
+from app.agent_workflows.tree_of_thoughts.index import Node, ToTConfig, TreeOfThoughtsWorkflow
+from app.agent_workflows.tree_of_thoughts.policy import SearchBudget
+from app.agent_workflows.tree_of_thoughts.transposition import TranspositionTable
+
+# a model call as SearchBudget.record sees it
+CALL = SimpleNamespace(context_wrapper=None)
+
+
+class ScriptedModel:
+    """Stand-in for the reasoner and evaluator with scripted thoughts and latencies.
+
+    thoughts maps a path to the (text, score) pairs proposed after it; other
+    paths get k thoughts scored default_score. Evaluations agree with the
+    thought's own score. At most concurrency calls run at once, like behind a
+    provider's rate limit. Every call is recorded as (kind, path, started,
+    finished), with times relative to the start of the search.
+    """
+
+    def __init__(
+        self,
+        thoughts: Optional[Dict[Tuple[str, ...], List[Tuple[str, float]]]] = None,
+        default_score: float = 0.85,
+        generate_latency: Callable[[Tuple[str, ...]], float] = lambda path: 0.0,
+        evaluate_latency: Callable[[Tuple[str, ...]], float] = lambda path: 0.0,
+        finalized: bool = False,
+        concurrency: Optional[int] = None,
+    ):
+        self.thoughts = thoughts or {}
+        self.default_score = default_score
+        self.generate_latency = generate_latency
+        self.evaluate_latency = evaluate_latency
+        self.finalized = finalized
+        self.slots = asyncio.Semaphore(concurrency) if concurrency else None
+        self.scores: Dict[str, float] = {}
+        self.calls: List[Tuple[str, Tuple[str, ...], float, float]] = []
+        self.started = time.perf_counter()
+
+    async def _call(self, kind: str, path: List[str], latency: float, budget) -> None:
+        async with self.slots or nullcontext():
+            started = time.perf_counter() - self.started
+            await asyncio.sleep(latency)
+            self.calls.append((kind, tuple(path), started, time.perf_counter() - self.started))
+        if budget:
+            budget.record(CALL)
+
+    def count(self, kind: str) -> int:
+        return len([call for call in self.calls if call[0] == kind])
+
+    async def generate_thoughts(self, goal, agent, current_path, k=3, budget=None) -> ThoughtBatch:
+        await self._call("generate", current_path, self.generate_latency(tuple(current_path)), budget)
+        proposed = self.thoughts.get(tuple(current_path)) or [(f"{current_path[-1] if current_path else 'start'} step {i}", self.default_score) for i in range(k)]
+        self.scores.update(proposed)
+        return ThoughtBatch(thoughts=[Thought(text=text, rationale="scripted", score=score) for text, score in proposed])
+
+    def evaluation(self, candidate: str) -> Evaluation:
+        return Evaluation(keep=True, reason="scripted", adjusted_score=self.scores[candidate])
+
+    async def evaluate_thoughts(self, goal, agent, path_so_far, candidates, budget=None) -> List[Optional[Evaluation]]:
+        await self._call("evaluate", path_so_far, self.evaluate_latency(tuple(path_so_far)), budget)
+        return [self.evaluation(candidate) for candidate in candidates]
+
+    async def evaluate_thought(self, goal, agent, path_so_far, candiate, budget=None) -> Evaluation:
+        await self._call("evaluate", path_so_far, self.evaluate_latency(tuple(path_so_far)), budget)
+        return self.evaluation(candiate)
+
+    async def check_finalized(self, goal, frontier, budget=None) -> bool:
+        await self._call("finalize", frontier[0].path, 0.0, budget)
+        return self.finalized
+
+    async def synthesize_answer(self, goal, frontier, is_streamed=False) -> List[str]:
+        return frontier[0].path
+
+
+@pytest.fixture
+def scripted(monkeypatch):
+    """Installs a ScriptedModel into the search; returns a function building it."""
+
+    def install(**kwargs) -> Tuple[TreeOfThoughtsWorkflow, ScriptedModel]:
+        # evaluations are cached across searches
+        transposition._evaluations.clear()
+        model = ScriptedModel(**kwargs)
+        monkeypatch.setattr(tot_module, "generate_thoughts", model.generate_thoughts)
+        monkeypatch.setattr(tot_module, "evaluate_thoughts", model.evaluate_thoughts)
+        monkeypatch.setattr(tot_module, "evaluate_thought", model.evaluate_thought)
+        workflow = TreeOfThoughtsWorkflow()
+        workflow.check_finalized = model.check_finalized
+        workflow.synthesize_answer = model.synthesize_answer
+        return workflow, model
+
+    return install
+
+
+async def search(workflow: TreeOfThoughtsWorkflow, config: ToTConfig) -> Tuple[List[str], List[Tuple[str, dict]]]:
+    events: List[Tuple[str, dict]] = []
+    path = await workflow.generate_final_thought("goal", config, on_progress=lambda name, data: events.append((name, data)))
+    return path, events
+
+
+class RecordedSpan:
+    """custom_span stand-in keeping the search report it is given."""
+
+    reports: List[dict] = []
+
+    def __init__(self, name: str, data: dict):
+        RecordedSpan.reports.append(data)
+
+    def start(self, mark_as_current: bool = False) -> None:
+        pass
+
+    def finish(self, reset_current: bool = False) -> None:
+        pass
+
+
+@pytest.fixture
+def reports(monkeypatch) -> List[dict]:
+    RecordedSpan.reports = []
+    monkeypatch.setattr(tot_module, "custom_span", RecordedSpan)
+    return RecordedSpan.reports
+
+
+def depth_events(events: List[Tuple[str, dict]]) -> List[dict]:
+    return [data for name, data in events if name == "depth_completed"]
+
+
+async def test_each_parent_is_evaluated_as_soon_as_its_batch_arrives(scripted):
+    # A's thoughts are slow to generate but quick to judge, B's the other way round:
+    # waiting for the whole level at each stage would take 0.3 + 0.2 seconds
+    workflow, model = scripted(
+        thoughts={(): [("A", 0.8), ("B", 1.0)]},
+        generate_latency=lambda path: 0.3 if path == ("A",) else 0.01,
+        evaluate_latency=lambda path: 0.2 if path == ("B",) else 0.01,
+    )
+    config = ToTConfig(beam_width=2, thoughts_per_step=2, max_depth=3, adaptive_beam=False, plateau_delta=None, finalize_policy="sequential")
+
+    _, events = await search(workflow, config)
+
+    seconds = [round(data["seconds"], 2) for data in depth_events(events)]
+    print("wall-clock per depth:", seconds)
+    assert len(seconds) == 3
+    assert seconds[1] < 0.45
+    [evaluate_b] = [call for call in model.calls if call[:2] == ("evaluate", ("B",))]
+    [generate_a] = [call for call in model.calls if call[:2] == ("generate", ("A",))]
+    assert evaluate_b[2] < generate_a[3]
+
+
+async def test_only_settled_nodes_are_expanded_early(scripted):
+    # B's children outscore anything A can still produce, so they are expanded
+    # while A is pending; A's children never enter the beam
+    workflow, model = scripted(
+        thoughts={(): [("A", 0.8), ("B", 1.0)], ("B",): [("B one", 1.0), ("B two", 1.0)]},
+        default_score=0.8,
+        generate_latency=lambda path: 0.3 if path == ("A",) else 0.01,
+    )
+    config = ToTConfig(beam_width=2, thoughts_per_step=2, max_depth=3, adaptive_beam=False, plateau_delta=None, finalize_policy="sequential")
+
+    _, events = await search(workflow, config)
+
+    level_done = model.calls[[call[:2] for call in model.calls].index(("generate", ("A",)))][3]
+    early = [call[1] for call in model.calls if call[0] == "generate" and len(call[1]) == 2 and call[2] < level_done]
+    frontier = [tuple(node["path"]) for node in depth_events(events)[1]["frontier"]]
+    assert sorted(early) == sorted(frontier) == [("B", "B one"), ("B", "B two")]
+
+
+def test_settled_nodes_leaves_nodes_a_pending_parent_can_displace():
+    workflow = TreeOfThoughtsWorkflow.__new__(TreeOfThoughtsWorkflow)
+    beam = [Node(path=["x"], score=0.9), Node(path=["y"], score=0.7)]
+
+    # children of a 0.6 parent score at most 0.8: they can push out 0.7 but not 0.9
+    assert workflow.settled_nodes(beam, [Node(path=["p"], score=0.6)], width=2) == beam[:1]
+    assert workflow.settled_nodes(beam, [Node(path=["p"], score=0.2)], width=2) == beam
+    assert workflow.settled_nodes(beam, [Node(path=["p"], score=0.9)], width=2) == []
+    assert workflow.settled_nodes(beam, [], width=2) == beam
+
+
+async def test_batch_evaluations_map_back_to_their_candidates(monkeypatch):
+    # the model answers out of order, twice for one index, for an unknown index and not at all for another
+    output = EvaluationBatch(evaluations=[
+        CandidateEvaluation(index=2, keep=True, reason="third", adjusted_score=0.3),
+        CandidateEvaluation(index=0, keep=True, reason="first", adjusted_score=0.1),
+        CandidateEvaluation(index=0, keep=False, reason="first again", adjusted_score=0.9),
+        CandidateEvaluation(index=7, keep=True, reason="unknown", adjusted_score=0.7),
+    ])
+
+    async def run(agent, prompt):
+        return SimpleNamespace(final_output=output, context_wrapper=None)
+
+    monkeypatch.setattr(agents_module.response_cache, "run", run)
+    budget = SearchBudget()
+
+    evaluations = await agents_module.evaluate_thoughts("goal", None, [], ["a", "b", "c"], budget=budget)
+
+    assert [evaluation.reason if evaluation else None for evaluation in evaluations] == ["first", None, "third"]
+    assert budget.calls == 1
+
+
+async def test_skipped_candidate_falls_back_to_its_own_score(scripted, monkeypatch):
+    workflow, model = scripted(thoughts={(): [("A", 0.9), ("B", 0.9), ("C", 0.9)]})
+
+    async def evaluate_thoughts(goal, agent, path_so_far, candidates, budget=None):
+        scores = {"A": 1.0, "C": 0.5}
+        return [Evaluation(keep=True, reason=candidate, adjusted_score=scores[candidate]) if candidate in scores else None for candidate in candidates]
+
+    monkeypatch.setattr(tot_module, "evaluate_thoughts", evaluate_thoughts)
+    config = ToTConfig(eval_mode="batched", min_keep_score=0.8)
+
+    kept, pruned = await workflow.expand("goal", Node(path=[], score=0.0), config, TranspositionTable(scope="test"), SearchBudget())
+
+    # A and C are scored with their own evaluation, B keeps its generator score
+    assert [(node.path, node.score) for node in kept] == [(["A"], pytest.approx(0.475)), (["B"], pytest.approx(0.45))]
+    assert [(node.path, node.score) for node in pruned] == [(["C"], pytest.approx(0.35))]
+
+
+@pytest.mark.parametrize("eval_mode", ["per_candidate", "batched"])
+async def test_evaluator_calls_per_depth(scripted, eval_mode):
+    # a provider that runs 3 calls at a time, each taking 50ms
+    workflow, model = scripted(evaluate_latency=lambda path: 0.05, concurrency=3)
+    config = ToTConfig(beam_width=3, thoughts_per_step=3, max_depth=2, eval_mode=eval_mode, adaptive_beam=False, plateau_delta=None, finalize_policy="sequential")
+
+    _, events = await search(workflow, config)
+
+    calls_per_depth = [len([call for call in model.calls if call[0] == "evaluate" and len(call[1]) == depth]) for depth in range(2)]
+    seconds = [data["seconds"] for data in depth_events(events)]
+    print(f"{eval_mode}: evaluator calls per depth {calls_per_depth}, wall-clock per depth {[round(s, 2) for s in seconds]}")
+    if eval_mode == "batched":
+        # one call per expanded node
+        assert calls_per_depth == [1, 3]
+        assert seconds[1] < 0.1
+    else:
+        # one call per candidate: 9 calls need 3 rounds of the provider's 3 slots
+        assert calls_per_depth == [3, 9]
+        assert seconds[1] > 0.12
+
+
+async def test_search_runs_to_max_depth_while_scores_improve(scripted, reports):
+    workflow, model = scripted()
+
+    path = await workflow.generate_final_thought("goal", ToTConfig(max_depth=3, adaptive_beam=False))
+
+    [report] = reports
+    assert report["stop_reason"] == "max_depth"
+    assert report["beam_widths"] == [3, 3, 3]
+    assert len(path) == 3
+
+
+async def test_search_stops_when_the_best_score_plateaus(scripted, reports):
+    # the second level barely improves on the first
+    workflow, model = scripted(thoughts={(): [("A", 0.9), ("B", 0.9), ("C", 0.9)]}, default_score=0.46)
+
+    path = await workflow.generate_final_thought("goal", ToTConfig(max_depth=5, min_keep_score=0.0, plateau_delta=0.01, adaptive_beam=False))
+
+    [report] = reports
+    assert report["stop_reason"] == "plateau"
+    assert report["beam_widths"] == [3, 3]
+    assert len(path) == 2
+
+
+async def test_beam_narrows_behind_a_leader_and_widens_on_ties(scripted, reports):
+    workflow, model = scripted(thoughts={(): [("A", 1.0), ("B", 0.5), ("C", 0.5)]}, default_score=0.9)
+
+    await workflow.generate_final_thought("goal", ToTConfig(max_depth=3, min_keep_score=0.0, plateau_delta=None))
+
+    [report] = reports
+    assert report["beam_widths"] == [3, 2, 3]
+
+
+@pytest.mark.parametrize("eval_mode,finalize_policy", [
+    ("batched", "speculative"), ("batched", "sequential"), ("per_candidate", "speculative"), ("per_candidate", "sequential"),
+])
+async def test_max_calls_from_model_settings_is_never_exceeded(scripted, reports, eval_mode, finalize_policy):
+    for max_calls in range(0, 25):
+        # uneven latencies so expansions and verdicts overlap in many ways
+        workflow, model = scripted(
+            generate_latency=lambda path: 0.001 * (len("".join(path)) % 5),
+            evaluate_latency=lambda path: 0.002 * (len(path) % 3),
+        )
+        config = ToTConfig.from_model_settings({"tot_max_calls": max_calls})
+        config.eval_mode, config.finalize_policy, config.plateau_delta = eval_mode, finalize_policy, None
+
+        await workflow.generate_final_thought("goal", config)
+
+        assert len(model.calls) <= max_calls
+        assert reports[-1]["budget"]["calls"] == len(model.calls)
+        if max_calls < 5:
+            # not even the first two levels fit
+            assert reports[-1]["stop_reason"] == "calls"